@@ -1,5 +1,6 @@
+import hashlib
 import os
-from flask import Flask, render_template
+from flask import Flask, render_template, make_response, request, abort
 from flask_cors import CORS
 from config import config
 
@@ -18,12 +19,96 @@ def create_app(config_name=None):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    # Non-blocking, structured logging for the app, routes and DB layer
+    from .utils.logging_config import configure_logging
+    configure_logging(app)
+    
     # Enable CORS for frontend integration
     CORS(app, supports_credentials=True)
     
     # Configure session
     app.secret_key = app.config['SECRET_KEY']
     
+    # Pooled database connections, usable from background threads too
+    from .utils.db_connector import db_connector
+    db_connector.init_app(app)
+    
+    # Fast JSON encoding with Accept-negotiated MessagePack for all blueprints
+    from .utils import serialization
+    serialization.init_app(app)
+    
+    # Fingerprinted, precompressed static assets and gzip for large API responses
+    from .utils import assets, compression
+    assets.init_app(app)
+    compression.init_app(app)
+    
+    from .cli import register_commands
+    register_commands(app)
+    
+    # Request latency / DB time metrics and on-demand profiling (/metrics)
+    if app.config.get('METRICS_ENABLED', True):
+        from .utils import metrics
+        metrics.init_app(app)
+    
+    # Request tracing with trace-context propagation from gates and kiosks
+    from .utils import tracing
+    tracing.init_app(app)
+    
+    # Per-client rate limits and load shedding; gate entry/exit is exempt
+    if app.config.get('RATE_LIMIT_ENABLED', True):
+        from .utils import rate_limit
+        rate_limit.init_app(app)
+    
+    # Bulkheads per partition (gate entry/exit, then blueprint); DB pools come from DB_POOL_PARTITIONS
+    from .utils import bulkhead
+    bulkhead.init_app(app)
+    
+    # Per-statement fingerprint statistics and slow-query log
+    from .utils.query_stats import query_stats
+    query_stats.configure(
+        slow_threshold_ms=app.config.get('SLOW_QUERY_MS', 500),
+        max_fingerprints=app.config.get('QUERY_STATS_MAX_FINGERPRINTS', 5000)
+    )
+    
+    # Tag-invalidated SELECT result cache; lot writes also refresh the tariff and fee caches
+    from .utils.query_cache import query_cache
+    query_cache.enabled = app.config.get('QUERY_CACHE_ENABLED', True)
+    query_cache.max_bytes = app.config.get('QUERY_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+    query_cache.default_ttl = app.config.get('QUERY_CACHE_DEFAULT_TTL', 60)
+    
+    # Time-ordered payment transaction IDs, unique across threads, processes and hosts
+    from .utils.transaction_ids import transaction_ids
+    transaction_ids.configure(
+        worker_id=app.config.get('TXN_WORKER_ID'),
+        node_id=app.config.get('TXN_NODE_ID', 0),
+        lock_dir=app.config.get('TXN_LOCK_DIR')
+    )
+    
+    from .services.plate_index import plate_index
+    plate_index.refresh_seconds = app.config.get('PLATE_INDEX_REFRESH_SECONDS', 300)
+    
+    from .services.tariff_cache import tariff_cache
+    tariff_cache.refresh_seconds = app.config.get('TARIFF_CACHE_REFRESH_SECONDS', 300)
+    tariff_cache.version_check_seconds = app.config.get('TARIFF_VERSION_CHECK_SECONDS', 5)
+    
+    from .services.quote_service import quote_service
+    quote_service.ttl_seconds = app.config.get('KIOSK_QUOTE_TTL_SECONDS', 120)
+    
+    from .services.fee_cache import fee_cache
+    fee_cache.max_age_seconds = app.config.get('FEE_CACHE_MAX_AGE_SECONDS', 3600)
+    
+    from .services.analytics import analytics_cache
+    analytics_cache.max_entries = app.config.get('ANALYTICS_CACHE_MAX_ENTRIES', 64)
+    analytics_cache.open_ttl = app.config.get('ANALYTICS_OPEN_TTL', 60)
+    analytics_cache.closed_ttl = app.config.get('ANALYTICS_CLOSED_TTL', 3600)
+    
+    query_cache.on_invalidate('PARKING_LOT', tariff_cache.invalidate)
+    query_cache.on_invalidate('PARKING_LOT', fee_cache.clear)
+    query_cache.on_invalidate('TARIFF_RULE', tariff_cache.invalidate)
+    query_cache.on_invalidate('TARIFF_RULE', fee_cache.clear)
+    # Tariff changes made by other workers reach this one through the cache's version probe
+    tariff_cache.on_change(fee_cache.clear)
+    
     # Register blueprints
     from .api.kiosk_routes import kiosk_bp
     from .api.hardware_routes import hardware_bp
@@ -42,26 +127,62 @@ def create_app(config_name=None):
             'status': 'running'
         }
     
+    def render_page(template):
+        # Pages reference hashed assets, so a revalidated page is all a reload costs
+        response = make_response(render_template(template))
+        response.headers['Cache-Control'] = 'no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
+    
     # Serve kiosk interface
     @app.route('/kiosk')
     def kiosk():
-        return render_template('kiosk/index.html')
+        return render_page('kiosk/index.html')
+    
+    # Kiosk service worker (scope /): boots the kiosk page and its hashed assets from cache
+    @app.route('/kiosk-sw.js')
+    def kiosk_service_worker():
+        from .utils.assets import asset_manifest
+        
+        # Unhashed static URLs would stay cached after their files change
+        if not asset_manifest.entries:
+            abort(404)
+        # The page embeds the hashed asset URLs, so its hash versions the whole precache
+        version = hashlib.sha256(render_template('kiosk/index.html').encode()).hexdigest()[:12]
+        response = make_response(render_template('kiosk/sw.js', version=version))
+        response.mimetype = 'application/javascript'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
     
     # Serve admin interface  
     @app.route('/admin')
     def admin():
-        return render_template('admin/index.html')
+        return render_page('admin/index.html')
+    
+    # Liveness / readiness answered from the background prober's last results
+    from .utils import health
+    health.init_app(app)
+    
+    # Minute occupancy samples per lot, downsampled to 15-minute and hourly tiers
+    from .services import occupancy_history
+    occupancy_history.init_app(app)
+    
+    # Admin overrides and account changes, written to AUDIT_LOG in batches off the request path
+    from .services import audit_log
+    audit_log.init_app(app)
     
     @app.route('/health')
     def health_check():
-        """Health check endpoint"""
-        try:
-            from .utils.db_connector import db_connector
-            # Test database connection
-            db_connector.execute_query("SELECT 1 as test", fetch=True)
-            return {'status': 'healthy', 'database': 'connected'}
-        except Exception as e:
-            return {'status': 'unhealthy', 'error': str(e)}, 500
+        """Liveness check endpoint"""
+        status, alive = health.health_monitor.liveness()
+        return status, 200 if alive else 503
+    
+    @app.route('/ready')
+    def readiness_check():
+        """Readiness check: database reachable and active-vehicle / tariff caches warm"""
+        status, ready = health.health_monitor.readiness()
+        return status, 200 if ready else 503
     
     @app.route('/debug/admins')
     def debug_admins():
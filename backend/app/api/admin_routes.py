@@ -1,8 +1,11 @@
 from flask import Blueprint, request, jsonify, session
 from datetime import datetime, timedelta
-from ..utils.db_connector import db_connector
+from ..utils.db_connector import db_connector, read_replica, lot_sharded
 from ..services.billing_service import BillingService
 from ..services.coupon_service import CouponService
+from ..services.fee_cache import fee_cache
+from ..services.audit_log import audit_log
+from ..utils.transaction_ids import transaction_ids
 import hashlib
 import json
 import logging
@@ -39,9 +42,21 @@ def get_admin_lot_permissions(admin_id):
         FROM ADMIN_LOT_ASSIGNMENTS ala
         WHERE ala.AdminID = %s
     """
-    result = db_connector.execute_query(query, (admin_id,))
+    # Assignments are only kept on the primary, also when asked from inside a lot's shard
+    with db_connector.primary():
+        result = db_connector.execute_query(query, (admin_id,), cache_ttl=30)
     return [row['ParkingLotID'] for row in result]
 
+def _lot_aggregates(query, params, lot_ids):
+    """
+    Per-lot aggregate rows fanned out to the shards holding lot_ids
+    
+    Returns ({lot ID: row}, lot IDs whose shard failed or timed out).
+    """
+    rows, failed = db_connector.fan_out(query, params, lot_ids)
+    unavailable = [lot_id for lot_id in lot_ids if (db_connector.shard_for(lot_id) or 'primary') in failed]
+    return {row['ParkingLotID']: row for row in rows}, unavailable
+
 @admin_bp.route('/login', methods=['POST'])
 def admin_login():
     """
@@ -122,7 +137,7 @@ def get_admin_profile():
             GROUP BY a.AdminID, a.Username, a.RoleLevel
         """
         
-        result = db_connector.execute_query(query, (admin_id,))
+        result = db_connector.execute_query(query, (admin_id,), cache_ttl=60)
         
         if result:
             admin = result[0]
@@ -144,6 +159,7 @@ def get_admin_profile():
 
 @admin_bp.route('/lots', methods=['GET'])
 @require_auth
+@read_replica
 def get_parking_lots():
     """Get parking lots (filtered by admin permissions)"""
     try:
@@ -153,8 +169,7 @@ def get_parking_lots():
         if role_level == 99:
             # Super admin sees all lots
             query = """
-                SELECT pl.*, 
-                       (SELECT COUNT(*) FROM PARKING_RECORD pr WHERE pr.ParkingLotID = pl.ParkingLotID AND pr.ExitTime IS NULL) as CurrentOccupancy
+                SELECT pl.*
                 FROM PARKING_LOT pl
                 ORDER BY pl.Name
             """
@@ -162,8 +177,7 @@ def get_parking_lots():
         else:
             # Lot manager sees only assigned lots
             query = """
-                SELECT pl.*, 
-                       (SELECT COUNT(*) FROM PARKING_RECORD pr WHERE pr.ParkingLotID = pl.ParkingLotID AND pr.ExitTime IS NULL) as CurrentOccupancy
+                SELECT pl.*
                 FROM PARKING_LOT pl
                 JOIN ADMIN_LOT_ASSIGNMENTS ala ON pl.ParkingLotID = ala.ParkingLotID
                 WHERE ala.AdminID = %s
@@ -173,22 +187,35 @@ def get_parking_lots():
         
         result = db_connector.execute_query(query, params)
         
+        # Occupancy is counted on the shards holding each lot's records
+        occupancy, unavailable = _lot_aggregates("""
+            SELECT ParkingLotID, COUNT(*) as CurrentOccupancy
+            FROM PARKING_RECORD
+            WHERE ExitTime IS NULL
+            GROUP BY ParkingLotID
+        """, None, [lot['ParkingLotID'] for lot in result])
+        
         lots = []
         for lot in result:
+            if lot['ParkingLotID'] in unavailable:
+                current_occupancy = None
+            else:
+                current_occupancy = occupancy.get(lot['ParkingLotID'], {}).get('CurrentOccupancy', 0)
             lots.append({
-                'id': lot['ParkingLotID'],           # 前端儀表板期望 lot.id
-                'ParkingLotID': lot['ParkingLotID'], # 管理員設定頁面期望 lot.ParkingLotID
-                'name': lot['Name'],                 # 前端儀表板期望 lot.name
-                'Name': lot['Name'],                 # 管理員設定頁面期望 lot.Name
+                'id': lot['ParkingLotID'],
+                'name': lot['Name'],
                 'address': lot['Address'],
                 'totalSpaces': lot['TotalSpaces'],
-                'currentOccupancy': lot['CurrentOccupancy'],
-                'availableSpaces': lot['TotalSpaces'] - lot['CurrentOccupancy'],
+                'currentOccupancy': current_occupancy,
+                'availableSpaces': lot['TotalSpaces'] - current_occupancy if current_occupancy is not None else None,
                 'hourlyRate': lot['HourlyRate'],
                 'dailyMaxRate': lot['DailyMaxRate']
             })
         
-        return jsonify({'lots': lots})
+        response = {'lots': lots}
+        if unavailable:
+            response['unavailableLots'] = unavailable
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -214,7 +241,7 @@ def create_parking_lot():
             VALUES (%s, %s, %s, %s, %s)
         """
         
-        result = db_connector.execute_query(query, (
+        result = db_connector.execute_returning(query, (
             data['name'],
             data['address'],
             data['totalSpaces'],
@@ -224,6 +251,20 @@ def create_parking_lot():
         
         if result:
             lot_id = result[0]['ParkingLotID']
+            if db_connector.sharded:
+                from ..services.lot_shards import sync_lots
+                try:
+                    sync_lots([lot_id])
+                except Exception as e:
+                    # The lot exists; its gates fail until the copy is retried
+                    logger.warning("Parking lot %s not copied to its shard, run flask sync-lot-shards: %s", lot_id, e)
+            audit_log.record('lot.create', 'lot', lot_id, lot_id=lot_id, details={
+                'name': data['name'],
+                'address': data['address'],
+                'totalSpaces': data['totalSpaces'],
+                'hourlyRate': data['hourlyRate'],
+                'dailyMaxRate': data.get('dailyMaxRate')
+            })
             return jsonify({
                 'success': True,
                 'lotId': lot_id,
@@ -235,8 +276,102 @@ def create_parking_lot():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/lots/<int:lot_id>/tariff', methods=['GET'])
+@require_auth
+def get_lot_tariff(lot_id):
+    """
+    Base rates and time-of-day / weekday tariff rules of a lot
+    GET /api/v1/admin/lots/1/tariff?from=2025-01-01T08:00&to=2025-01-01T11:30
+    
+    With from/to the response also prices that stay (before free period and daily cap).
+    """
+    try:
+        from ..services.tariff_cache import tariff_cache
+        from ..services.tariff_engine import rule_to_json
+        
+        if session['role_level'] != 99 and lot_id not in get_admin_lot_permissions(session['admin_id']):
+            return jsonify({'error': 'Access denied to this parking lot'}), 403
+        
+        lot = tariff_cache.get(lot_id)
+        if lot is None:
+            return jsonify({'error': 'Parking lot not found'}), 404
+        
+        response = {
+            'lotId': lot_id,
+            'hourlyRate': lot['HourlyRate'],
+            'dailyMaxRate': lot['DailyMaxRate'],
+            'rules': [rule_to_json(rule) for rule in tariff_cache.rules(lot_id)]
+        }
+        
+        if 'from' in request.args and 'to' in request.args:
+            try:
+                start = datetime.fromisoformat(request.args['from'])
+                end = datetime.fromisoformat(request.args['to'])
+            except ValueError:
+                return jsonify({'error': 'from and to must be ISO 8601 date/times'}), 400
+            schedule = tariff_cache.schedule(lot_id)
+            hours = max(0, -(-int((end - start).total_seconds()) // 3600))
+            end = start + timedelta(hours=hours)
+            response['quote'] = {
+                'from': start,
+                'to': end,
+                'billableHours': hours,
+                'price': schedule.price(start, end) if schedule else hours * lot['HourlyRate']
+            }
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/lots/<int:lot_id>/tariff', methods=['PUT'])
+@require_super_admin
+def update_lot_tariff(lot_id):
+    """
+    Replace the time-of-day / weekday tariff rules of a lot (Super Admin only)
+    PUT /api/v1/admin/lots/1/tariff
+    Body: {"rules": [{"days": [0,1,2,3,4], "start": "08:00", "end": "18:00", "rateType": "hourly", "rate": 50},
+                     {"days": [0,1,2,3,4,5,6], "start": "22:00", "end": "08:00", "rateType": "flat", "rate": 100, "priority": 1}]}
+    
+    Hours no rule covers are charged at the lot's HourlyRate; an empty list restores the flat tariff.
+    """
+    try:
+        from ..services.tariff_cache import tariff_cache
+        from ..services.tariff_engine import rule_from_json
+        
+        data = request.get_json()
+        if not data or not isinstance(data.get('rules'), list):
+            return jsonify({'error': 'rules must be a list'}), 400
+        if tariff_cache.get(lot_id) is None:
+            return jsonify({'error': 'Parking lot not found'}), 404
+        
+        try:
+            rules = [rule_from_json(rule) for rule in data['rules']]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        statements = [("DELETE FROM TARIFF_RULE WHERE ParkingLotID = %s", (lot_id,))]
+        for rule in rules:
+            statements.append(("""
+                INSERT INTO TARIFF_RULE (ParkingLotID, DaysMask, StartMinute, EndMinute, RateType, Rate, Priority)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (lot_id, rule['DaysMask'], rule['StartMinute'], rule['EndMinute'],
+                  rule['RateType'], rule['Rate'], rule['Priority'])))
+        # Bumps PARKING_LOT.UpdatedAt, the version other workers' tariff caches probe
+        statements.append(("UPDATE PARKING_LOT SET UpdatedAt = SYSDATETIME() WHERE ParkingLotID = %s", (lot_id,)))
+        # The write invalidates the tariff and fee caches through the query cache tags
+        db_connector.execute_transaction(statements)
+        audit_log.record('lot.tariff_update', 'lot', lot_id, lot_id=lot_id, details={'rules': data['rules']})
+        
+        return jsonify({'success': True, 'lotId': lot_id, 'rules': len(rules)})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/lots/<int:lot_id>/vehicles', methods=['GET'])
 @require_auth
+@read_replica
+@lot_sharded
 def get_lot_vehicles(lot_id):
     """Get vehicles in specific parking lot"""
     try:
@@ -253,13 +388,15 @@ def get_lot_vehicles(lot_id):
         
         if status == 'current':
             query = """
-                SELECT pr.RecordID, pr.VehicleNumber, pr.EntryTime, pr.PaidUntilTime, pr.TotalFee,
+                SELECT pr.RecordID, pr.ParkingLotID, pr.VehicleNumber, pr.EntryTime, pr.PaidUntilTime, pr.TotalFee,
+                       pl.HourlyRate, pl.DailyMaxRate,
                        CASE 
                            WHEN pr.PaidUntilTime IS NULL THEN 'Unpaid'
                            WHEN pr.PaidUntilTime > GETDATE() THEN 'Paid'
                            ELSE 'Payment Expired'
                        END as PaymentStatus
                 FROM PARKING_RECORD pr
+                JOIN PARKING_LOT pl ON pr.ParkingLotID = pl.ParkingLotID
                 WHERE pr.ParkingLotID = %s AND pr.ExitTime IS NULL
                 ORDER BY pr.EntryTime DESC
             """
@@ -280,31 +417,32 @@ def get_lot_vehicles(lot_id):
         result = db_connector.execute_query(query, [lot_id] if status == 'current' else params)
         
         vehicles = []
+        current_time = datetime.now()
         for record in result:
             vehicle_data = {
                 'recordId': record['RecordID'],
                 'licensePlate': record['VehicleNumber'],
-                'entryTime': record['EntryTime'].isoformat(),
+                'entryTime': record['EntryTime'],
                 'totalFee': record['TotalFee']
             }
             
             if status == 'current':
-                # Calculate real-time fee for current vehicles
+                # Real-time fee from the row already loaded (cached until it next changes)
                 try:
                     from ..services.billing_service import BillingService
-                    billing_result = BillingService.calculate_parking_fee(record['RecordID'])
+                    billing_result = BillingService.current_fee_for_record(record, current_time)
                     current_fee = billing_result['fee']
                 except Exception as e:
                     current_fee = 0
                     
                 vehicle_data.update({
                     'paymentStatus': record['PaymentStatus'],
-                    'paidUntilTime': record['PaidUntilTime'].isoformat() if record['PaidUntilTime'] else None,
+                    'paidUntilTime': record['PaidUntilTime'],
                     'currentFee': current_fee  # Add real-time calculated fee
                 })
             else:
                 vehicle_data.update({
-                    'exitTime': record['ExitTime'].isoformat() if record['ExitTime'] else None,
+                    'exitTime': record['ExitTime'],
                     'durationMinutes': record['DurationMinutes']
                 })
             
@@ -344,9 +482,12 @@ def update_parking_record(record_id):
             WHERE pr.RecordID = %s
         """
         
-        record_result = db_connector.execute_query(record_query, (record_id,))
+        # The record's lot, and so its shard, is not known yet
+        record_result, failed = db_connector.fan_out(record_query, (record_id,))
         
         if not record_result:
+            if failed:
+                return jsonify({'error': 'Parking records temporarily unavailable'}), 503
             return jsonify({'error': 'Parking record not found'}), 404
         
         record = record_result[0]
@@ -357,65 +498,85 @@ def update_parking_record(record_id):
             if record['ParkingLotID'] not in allowed_lots:
                 return jsonify({'error': 'Access denied to this parking lot'}), 403
         
-        action = data['action']
-        current_time = datetime.now()
-        
-        if action == 'mark_paid':
-            amount = data.get('amount', 0)
-            exit_deadline = current_time + timedelta(minutes=15)
-            
-            # Calculate total fee - if there's already a TotalFee, add to it, otherwise use the new amount
-            current_total_fee = record.get('TotalFee', 0) or 0  # Handle NULL values
-            new_total_fee = current_total_fee + amount
-            
-            # Update record
-            update_query = """
-                UPDATE PARKING_RECORD 
-                SET PaidUntilTime = %s, TotalFee = %s
-                WHERE RecordID = %s
-            """
-            db_connector.execute_query(update_query, (exit_deadline, new_total_fee, record_id), fetch=False)
-            
-            # Insert payment record
-            payment_query = """
-                INSERT INTO PAYMENT_RECORD (RecordID, PaymentAmount, PaymentMethod, PaymentTime, TransactionID)
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            transaction_id = f"ADMIN{current_time.strftime('%Y%m%d%H%M%S')}{record_id}"
-            db_connector.execute_query(payment_query, 
-                                     (record_id, amount, 'Manual', current_time, transaction_id), 
-                                     fetch=False)
-            
-            return jsonify({
-                'success': True,
-                'message': f'Record marked as paid. Total fee: NT${new_total_fee} (added NT${amount})',
-                'paidUntilTime': exit_deadline.isoformat(),
-                'totalFee': new_total_fee,
-                'addedAmount': amount
-            })
+        # The override's writes go to the shard holding the record's lot
+        with db_connector.lot_shard(record['ParkingLotID']):
+            action = data['action']
+            current_time = datetime.now()
             
-        elif action == 'force_exit':
-            update_query = """
-                UPDATE PARKING_RECORD 
-                SET ExitTime = %s
-                WHERE RecordID = %s
-            """
-            db_connector.execute_query(update_query, (current_time, record_id), fetch=False)
-            
-            return jsonify({
-                'success': True,
-                'message': 'Vehicle marked as exited',
-                'exitTime': current_time.isoformat()
-            })
-            
-        else:
-            return jsonify({'error': 'Invalid action'}), 400
+            if action == 'mark_paid':
+                amount = data.get('amount', 0)
+                exit_deadline = current_time + timedelta(minutes=15)
+                
+                # Calculate total fee - if there's already a TotalFee, add to it, otherwise use the new amount
+                current_total_fee = record.get('TotalFee', 0) or 0  # Handle NULL values
+                new_total_fee = current_total_fee + amount
+                
+                # Update record and insert payment record together; the sum is taken in SQL so a
+                # concurrent kiosk payment is not lost
+                update_query = """
+                    UPDATE PARKING_RECORD 
+                    SET PaidUntilTime = %s, TotalFee = ISNULL(TotalFee, 0) + %s
+                    WHERE RecordID = %s
+                """
+                payment_query = """
+                    INSERT INTO PAYMENT_RECORD (RecordID, PaymentAmount, PaymentMethod, PaymentTime, TransactionID)
+                    VALUES (%s, %s, %s, %s, %s)
+                """
+                transaction_id = transaction_ids.next_id('ADMIN')
+                db_connector.execute_transaction([
+                    (update_query, (exit_deadline, amount, record_id)),
+                    (payment_query, (record_id, amount, 'Manual', current_time, transaction_id))
+                ])
+                fee_cache.invalidate(record_id)
+                audit_log.record('record.mark_paid', 'record', record_id, lot_id=record['ParkingLotID'], details={
+                    'vehicleNumber': record['VehicleNumber'],
+                    'amount': amount,
+                    'totalFee': new_total_fee,
+                    'paidUntilTime': exit_deadline,
+                    'transactionId': transaction_id
+                })
+                
+                return jsonify({
+                    'success': True,
+                    'message': f'Record marked as paid. Total fee: NT${new_total_fee} (added NT${amount})',
+                    'paidUntilTime': exit_deadline,
+                    'totalFee': new_total_fee,
+                    'addedAmount': amount
+                })
+                
+            elif action == 'force_exit':
+                update_query = """
+                    UPDATE PARKING_RECORD 
+                    SET ExitTime = %s
+                    WHERE RecordID = %s
+                """
+                db_connector.execute_query(update_query, (current_time, record_id), fetch=False)
+                
+                from ..services.plate_index import plate_index
+                plate_index.remove(record_id)
+                fee_cache.invalidate(record_id)
+                audit_log.record('record.force_exit', 'record', record_id, lot_id=record['ParkingLotID'], details={
+                    'vehicleNumber': record['VehicleNumber'],
+                    'entryTime': record['EntryTime'],
+                    'paidUntilTime': record['PaidUntilTime'],
+                    'exitTime': current_time
+                })
+                
+                return jsonify({
+                    'success': True,
+                    'message': 'Vehicle marked as exited',
+                    'exitTime': current_time
+                })
+                
+            else:
+                return jsonify({'error': 'Invalid action'}), 400
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/reports/revenue', methods=['GET'])
 @require_auth
+@read_replica
 def get_revenue_report():
     """
     Get revenue report
@@ -435,22 +596,13 @@ def get_revenue_report():
             if lot_id not in allowed_lots:
                 return jsonify({'error': 'Access denied to this parking lot'}), 403
         
-        # Build query
+        # Lots come from the primary, their records' totals from the shards holding them
         base_query = """
-            SELECT 
-                pl.ParkingLotID,
-                pl.Name as LotName,
-                COUNT(pr.RecordID) as TotalTransactions,
-                COUNT(CASE WHEN pr.ExitTime IS NOT NULL THEN 1 END) as CompletedParking,
-                ISNULL(SUM(pr.TotalFee), 0) as TotalRevenue,
-                AVG(CAST(pr.TotalFee as FLOAT)) as AverageRevenue
+            SELECT pl.ParkingLotID, pl.Name as LotName
             FROM PARKING_LOT pl
-            LEFT JOIN PARKING_RECORD pr ON pl.ParkingLotID = pr.ParkingLotID
-                AND CAST(pr.EntryTime AS DATE) BETWEEN %s AND %s
-                AND pr.TotalFee IS NOT NULL
         """
         
-        params = [start_date, end_date]
+        params = []
         
         if lot_id:
             base_query += " WHERE pl.ParkingLotID = %s"
@@ -463,29 +615,358 @@ def get_revenue_report():
                 base_query += f" WHERE pl.ParkingLotID IN ({placeholders})"
                 params.extend(allowed_lots)
         
-        base_query += " GROUP BY pl.ParkingLotID, pl.Name ORDER BY TotalRevenue DESC"
-        
-        result = db_connector.execute_query(base_query, params)
+        lots = db_connector.execute_query(base_query, params)
+        totals, unavailable = _lot_aggregates("""
+            SELECT 
+                ParkingLotID,
+                COUNT(RecordID) as TotalTransactions,
+                COUNT(ExitTime) as CompletedParking,
+                SUM(TotalFee) as TotalRevenue
+            FROM PARKING_RECORD
+            WHERE CAST(EntryTime AS DATE) BETWEEN %s AND %s
+              AND TotalFee IS NOT NULL
+            GROUP BY ParkingLotID
+        """, (start_date, end_date), [lot['ParkingLotID'] for lot in lots])
         
         reports = []
         total_revenue = 0
         
-        for row in result:
-            total_revenue += row['TotalRevenue']
+        for lot in lots:
+            if lot['ParkingLotID'] in unavailable:
+                continue
+            row = totals.get(lot['ParkingLotID'], {})
+            transactions = row.get('TotalTransactions', 0)
+            revenue = row.get('TotalRevenue') or 0
+            total_revenue += revenue
             reports.append({
-                'lotId': row['ParkingLotID'],
-                'lotName': row['LotName'],
-                'totalTransactions': row['TotalTransactions'],
-                'completedParking': row['CompletedParking'],
-                'totalRevenue': row['TotalRevenue'],
-                'averageRevenue': round(row['AverageRevenue'] or 0, 2)
+                'lotId': lot['ParkingLotID'],
+                'lotName': lot['LotName'],
+                'totalTransactions': transactions,
+                'completedParking': row.get('CompletedParking', 0),
+                'totalRevenue': revenue,
+                'averageRevenue': round(revenue / transactions, 2) if transactions else 0
             })
+        reports.sort(key=lambda report: report['totalRevenue'], reverse=True)
         
-        return jsonify({
+        response = {
             'startDate': start_date,
             'endDate': end_date,
             'totalRevenue': total_revenue,
             'reports': reports
+        }
+        if unavailable:
+            # Left out of the totals until their shard answers again
+            response['unavailableLots'] = unavailable
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _analytics_report(kind):
+    """Shared handler of the per-lot analytics reports"""
+    from ..services.analytics import analytics_cache
+    from ..services.tariff_cache import tariff_cache
+    
+    lot_id = request.args.get('lot_id', type=int)
+    if not lot_id:
+        return jsonify({'error': 'lot_id is required'}), 400
+    if session['role_level'] != 99 and lot_id not in get_admin_lot_permissions(session['admin_id']):
+        return jsonify({'error': 'Access denied to this parking lot'}), 403
+    
+    try:
+        start_date = datetime.strptime(
+            request.args.get('start_date', (datetime.now() - timedelta(days=28)).strftime('%Y-%m-%d')), '%Y-%m-%d')
+        end_date = datetime.strptime(request.args.get('end_date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'start_date and end_date must be YYYY-MM-DD'}), 400
+    if end_date < start_date:
+        return jsonify({'error': 'end_date must not be before start_date'}), 400
+    if (end_date - start_date).days >= 366:
+        return jsonify({'error': 'Date range is limited to 366 days'}), 400
+    
+    lot = tariff_cache.get(lot_id)
+    if lot is None:
+        return jsonify({'error': 'Parking lot not found'}), 404
+    
+    # end_date is inclusive
+    report = analytics_cache.report(kind, lot_id, start_date, end_date + timedelta(days=1), lot['TotalSpaces'])
+    return jsonify({
+        'lotId': lot_id,
+        'name': lot['Name'],
+        'totalSpaces': lot['TotalSpaces'],
+        'startDate': start_date.strftime('%Y-%m-%d'),
+        'endDate': end_date.strftime('%Y-%m-%d'),
+        **report
+    })
+
+@admin_bp.route('/reports/occupancy-heatmap', methods=['GET'])
+@require_auth
+@read_replica
+def get_occupancy_heatmap():
+    """
+    Average / peak occupancy by hour of week (weekdays[0] is Monday)
+    GET /api/v1/admin/reports/occupancy-heatmap?lot_id=1&start_date=2025-01-01&end_date=2025-01-31
+    """
+    try:
+        return _analytics_report('heatmap')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/dwell-time', methods=['GET'])
+@require_auth
+@read_replica
+def get_dwell_time_report():
+    """
+    Dwell-time histogram and percentiles of completed stays
+    GET /api/v1/admin/reports/dwell-time?lot_id=1&start_date=2025-01-01&end_date=2025-01-31
+    """
+    try:
+        return _analytics_report('dwell')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/turnover', methods=['GET'])
+@require_auth
+@read_replica
+def get_turnover_report():
+    """
+    Entries per day and per space per day
+    GET /api/v1/admin/reports/turnover?lot_id=1&start_date=2025-01-01&end_date=2025-01-31
+    """
+    try:
+        return _analytics_report('turnover')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reconciliation', methods=['GET'])
+@require_super_admin
+@read_replica
+def get_reconciliation_report():
+    """
+    Stored TotalFee vs. PAYMENT_RECORD reconciliation per lot and entry date (Super Admin only)
+    GET /api/v1/admin/reconciliation?lot_id=1&start_date=2025-01-01&end_date=2025-01-31&discrepancies_only=true
+    """
+    try:
+        lot_id = request.args.get('lot_id', type=int)
+        start_date = request.args.get('start_date', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
+        end_date = request.args.get('end_date', datetime.now().strftime('%Y-%m-%d'))
+        
+        query = """
+            SELECT rd.ParkingLotID, pl.Name AS LotName, rd.EntryDate, rd.Records, rd.FeeTotal,
+                   rd.PaidTotal, rd.Discrepancies, rd.Checksum, rd.CheckedAt
+            FROM RECONCILIATION_DAY rd
+            JOIN PARKING_LOT pl ON rd.ParkingLotID = pl.ParkingLotID
+            WHERE rd.EntryDate BETWEEN %s AND %s
+        """
+        params = [start_date, end_date]
+        if lot_id:
+            query += " AND rd.ParkingLotID = %s"
+            params.append(lot_id)
+        if request.args.get('discrepancies_only', 'false').lower() == 'true':
+            query += " AND rd.Discrepancies > 0"
+        query += " ORDER BY rd.EntryDate, rd.ParkingLotID"
+        
+        rows = db_connector.execute_query(query, params)
+        state = db_connector.execute_query(
+            "SELECT LastRecordID, LastPaymentID, RunAt FROM RECONCILIATION_STATE WHERE StateID = 1")
+        
+        return jsonify({
+            'startDate': start_date,
+            'endDate': end_date,
+            'lastRun': {
+                'runAt': state[0]['RunAt'],
+                'lastRecordId': state[0]['LastRecordID'],
+                'lastPaymentId': state[0]['LastPaymentID']
+            } if state else None,
+            'days': [{
+                'lotId': row['ParkingLotID'],
+                'lotName': row['LotName'],
+                'date': row['EntryDate'],
+                'records': row['Records'],
+                'feeTotal': row['FeeTotal'],
+                'paidTotal': row['PaidTotal'],
+                'difference': row['FeeTotal'] - row['PaidTotal'],
+                'discrepancies': row['Discrepancies'],
+                'checksum': format(row['Checksum'] & 0xFFFFFFFFFFFFFFFF, '016x'),
+                'checkedAt': row['CheckedAt']
+            } for row in rows]
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reconciliation/discrepancies', methods=['GET'])
+@require_super_admin
+@read_replica
+def get_reconciliation_discrepancies():
+    """
+    Records whose TotalFee differs from the sum of their payments (Super Admin only)
+    GET /api/v1/admin/reconciliation/discrepancies?lot_id=1&date=2025-01-15
+    """
+    try:
+        lot_id = request.args.get('lot_id', type=int)
+        entry_date = request.args.get('date')
+        if not lot_id or not entry_date:
+            return jsonify({'error': 'lot_id and date are required'}), 400
+        
+        query = """
+            SELECT rd.RecordID, pr.VehicleNumber, pr.EntryTime, pr.ExitTime,
+                   rd.TotalFee, rd.PaidTotal, rd.Payments, rd.CheckedAt
+            FROM RECONCILIATION_DISCREPANCY rd
+            JOIN PARKING_RECORD pr ON rd.RecordID = pr.RecordID
+            WHERE rd.ParkingLotID = %s AND rd.EntryDate = %s
+            ORDER BY rd.RecordID
+        """
+        rows = db_connector.execute_query(query, (lot_id, entry_date))
+        
+        return jsonify({
+            'lotId': lot_id,
+            'date': entry_date,
+            'discrepancies': [{
+                'recordId': row['RecordID'],
+                'licensePlate': row['VehicleNumber'],
+                'entryTime': row['EntryTime'],
+                'exitTime': row['ExitTime'],
+                'totalFee': row['TotalFee'],
+                'paidTotal': row['PaidTotal'],
+                'difference': (row['TotalFee'] or 0) - row['PaidTotal'],
+                'payments': row['Payments'],
+                'checkedAt': row['CheckedAt']
+            } for row in rows]
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reconciliation/run', methods=['POST'])
+@require_super_admin
+def run_reconciliation():
+    """
+    Reconcile records and payments added since the last run (Super Admin only)
+    POST /api/v1/admin/reconciliation/run
+    Body: {"full": false}
+    """
+    try:
+        from ..services.reconciliation import payment_reconciler
+        
+        if db_connector.sharded:
+            return jsonify({'error': 'Payment reconciliation does not support DB_SHARDS yet'}), 409
+        
+        data = request.get_json(silent=True) or {}
+        return jsonify(payment_reconciler.run(full=bool(data.get('full', False))))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/tariff-simulations', methods=['POST'])
+@require_super_admin
+@read_replica
+def simulate_tariff():
+    """
+    Re-price past closed stays under a proposed tariff (Super Admin only)
+    POST /api/v1/admin/tariff-simulations
+    Body: {"startDate": "2024-01-01", "endDate": "2024-12-31", "lotIds": [1, 2],
+           "tariff": {"hourlyRate": 50, "dailyMaxRate": 400, "rules": [...]}}
+    
+    Omitted tariff fields keep each lot's current value; rules take the PUT /lots/<id>/tariff format.
+    Omitting lotIds simulates every lot. Nothing is written.
+    """
+    try:
+        from ..services.tariff_simulator import simulate, validate_proposal
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            start_date = datetime.strptime(data.get('startDate', ''), '%Y-%m-%d')
+            end_date = datetime.strptime(data.get('endDate', ''), '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'startDate and endDate must be YYYY-MM-DD'}), 400
+        if end_date < start_date:
+            return jsonify({'error': 'endDate must not be before startDate'}), 400
+        if (end_date - start_date).days >= 366:
+            return jsonify({'error': 'Date range is limited to 366 days'}), 400
+        
+        lot_ids = data.get('lotIds') or []
+        if not isinstance(lot_ids, list) or any(not isinstance(lot_id, int) for lot_id in lot_ids):
+            return jsonify({'error': 'lotIds must be a list of lot IDs'}), 400
+        try:
+            validate_proposal(data.get('tariff'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # endDate is inclusive
+        result = simulate(start_date, end_date + timedelta(days=1), data['tariff'], lot_ids)
+        return jsonify({
+            'startDate': start_date.strftime('%Y-%m-%d'),
+            'endDate': end_date.strftime('%Y-%m-%d'),
+            'tariff': data['tariff'],
+            **result
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/audit-log', methods=['GET'])
+@require_super_admin
+@read_replica
+def get_audit_log():
+    """
+    Audit trail of admin overrides and account changes, newest first (Super Admin only)
+    GET /api/v1/admin/audit-log?admin_id=2&action=record.mark_paid&target_type=record&target_id=15
+        &lot_id=1&start=2025-01-01T00:00&end=2025-01-31T23:59&limit=50&before_id=12345
+    
+    Pages are keyset-paginated on AuditID: pass nextBeforeId as before_id for the next page.
+    """
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        filters = []
+        params = []
+        for arg, column in (('admin_id', 'AdminID'), ('lot_id', 'ParkingLotID'), ('before_id', 'AuditID')):
+            value = request.args.get(arg, type=int)
+            if value is not None:
+                filters.append(f"{column} < %s" if arg == 'before_id' else f"{column} = %s")
+                params.append(value)
+        for arg, column in (('action', 'Action'), ('target_type', 'TargetType'), ('target_id', 'TargetID')):
+            value = request.args.get(arg)
+            if value:
+                filters.append(f"{column} = %s")
+                params.append(value)
+        try:
+            for arg, operator in (('start', '>='), ('end', '<=')):
+                value = request.args.get(arg)
+                if value:
+                    filters.append(f"OccurredAt {operator} %s")
+                    params.append(datetime.fromisoformat(value))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps'}), 400
+        
+        query = f"""
+            SELECT TOP ({limit + 1}) AuditID, OccurredAt, AdminID, Username, Action, TargetType,
+                   TargetID, ParkingLotID, Details, ClientIP
+            FROM AUDIT_LOG
+            {'WHERE ' + ' AND '.join(filters) if filters else ''}
+            ORDER BY AuditID DESC
+        """
+        rows = db_connector.execute_query(query, params)
+        
+        return jsonify({
+            'events': [{
+                'id': row['AuditID'],
+                'occurredAt': row['OccurredAt'],
+                'adminId': row['AdminID'],
+                'username': row['Username'],
+                'action': row['Action'],
+                'targetType': row['TargetType'],
+                'targetId': row['TargetID'],
+                'lotId': row['ParkingLotID'],
+                'details': json.loads(row['Details']) if row['Details'] else None,
+                'clientIp': row['ClientIP']
+            } for row in rows[:limit]],
+            'nextBeforeId': rows[limit - 1]['AuditID'] if len(rows) > limit else None,
+            # Events still queued in this worker are not visible yet
+            'pending': audit_log.pending()
         })
         
     except Exception as e:
@@ -493,6 +974,7 @@ def get_revenue_report():
 
 @admin_bp.route('/dashboard', methods=['GET'])
 @require_auth
+@read_replica
 def get_dashboard_data():
     """Get dashboard summary data"""
     try:
@@ -500,7 +982,7 @@ def get_dashboard_data():
         role_level = session['role_level']
         
         # Get today's date
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
         # Build base query based on admin permissions
         if role_level == 99:
@@ -526,55 +1008,109 @@ def get_dashboard_data():
         
         # Get basic parking lot statistics
         basic_query = f"""
-            SELECT 
-                COUNT(pl.ParkingLotID) as TotalLots,
-                ISNULL(SUM(pl.TotalSpaces), 0) as TotalSpaces
+            SELECT pl.ParkingLotID, pl.TotalSpaces
             FROM PARKING_LOT pl
             {lot_filter}
         """
-        basic_result = db_connector.execute_query(basic_query, params)
-        basic_stats = basic_result[0] if basic_result else {'TotalLots': 0, 'TotalSpaces': 0}
+        lots = db_connector.execute_query(basic_query, params)
         
-        # Get current occupancy
-        occupancy_query = f"""
-            SELECT COUNT(*) as CurrentOccupancy
-            FROM PARKING_RECORD pr
-            JOIN PARKING_LOT pl ON pr.ParkingLotID = pl.ParkingLotID
-            WHERE pr.ExitTime IS NULL {lot_filter.replace('WHERE', 'AND') if lot_filter else ''}
-        """
-        occupancy_result = db_connector.execute_query(occupancy_query, params)
-        current_occupancy = occupancy_result[0]['CurrentOccupancy'] if occupancy_result else 0
-        
-        # Get today's revenue and entries
-        today_query = f"""
+        # Current occupancy and today's revenue and entries, from the shards holding the lots' records
+        lot_stats, unavailable = _lot_aggregates("""
             SELECT 
-                ISNULL(SUM(pr.TotalFee), 0) as TodayRevenue,
-                COUNT(*) as TodayEntries
-            FROM PARKING_RECORD pr
-            JOIN PARKING_LOT pl ON pr.ParkingLotID = pl.ParkingLotID
-            WHERE CAST(pr.EntryTime AS DATE) = '{today}' 
-            {lot_filter.replace('WHERE', 'AND') if lot_filter else ''}
-        """
-        today_result = db_connector.execute_query(today_query, params)
-        today_stats = today_result[0] if today_result else {'TodayRevenue': 0, 'TodayEntries': 0}
+                ParkingLotID,
+                COUNT(CASE WHEN ExitTime IS NULL THEN 1 END) as CurrentOccupancy,
+                ISNULL(SUM(CASE WHEN EntryTime >= %s THEN TotalFee END), 0) as TodayRevenue,
+                COUNT(CASE WHEN EntryTime >= %s THEN 1 END) as TodayEntries
+            FROM PARKING_RECORD
+            WHERE ExitTime IS NULL OR EntryTime >= %s
+            GROUP BY ParkingLotID
+        """, (today, today, today), [lot['ParkingLotID'] for lot in lots])
         
         # Combine results
         summary = {
-            'TotalLots': basic_stats['TotalLots'],
-            'TotalSpaces': basic_stats['TotalSpaces'], 
-            'CurrentOccupancy': current_occupancy,
-            'TodayRevenue': today_stats['TodayRevenue'],
-            'TodayEntries': today_stats['TodayEntries']
+            'TotalLots': len(lots),
+            'TotalSpaces': sum(lot['TotalSpaces'] for lot in lots),
+            'CurrentOccupancy': 0,
+            'TodayRevenue': 0,
+            'TodayEntries': 0
         }
+        for lot in lots:
+            stats = lot_stats.get(lot['ParkingLotID'])
+            if stats is not None:
+                for key in ('CurrentOccupancy', 'TodayRevenue', 'TodayEntries'):
+                    summary[key] += stats[key]
         
-        return jsonify({
+        response = {
             'totalLots': summary.get('TotalLots', 0),
             'totalSpaces': summary.get('TotalSpaces', 0),
             'currentOccupancy': summary.get('CurrentOccupancy', 0),
             'occupancyRate': round((summary.get('CurrentOccupancy', 0) / max(summary.get('TotalSpaces', 1), 1)) * 100, 1),
             'todayRevenue': summary.get('TodayRevenue', 0),
             'todayEntries': summary.get('TodayEntries', 0)
-        })
+        }
+        if unavailable:
+            # Partial figures: these lots' shards did not answer in time
+            response['unavailableLots'] = unavailable
+        return jsonify(response)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/occupancy/history', methods=['GET'])
+@require_auth
+def get_occupancy_history():
+    """
+    Occupancy time series per lot, served from memory
+    GET /api/v1/admin/occupancy/history?lot_id=1&hours=24&resolution=minute|15min|hour
+    GET /api/v1/admin/occupancy/history?start=2025-01-01T00:00&end=2025-01-31T00:00
+    """
+    try:
+        from ..services.occupancy_history import occupancy_history, TIERS
+        from ..services.tariff_cache import tariff_cache
+        
+        admin_id = session['admin_id']
+        role_level = session['role_level']
+        
+        lot_id = request.args.get('lot_id', type=int)
+        resolution = request.args.get('resolution')
+        if resolution is not None and resolution not in TIERS:
+            return jsonify({'error': f"resolution must be one of {', '.join(TIERS)}"}), 400
+        
+        try:
+            end = datetime.fromisoformat(request.args['end']) if 'end' in request.args else datetime.now()
+            if 'start' in request.args:
+                start = datetime.fromisoformat(request.args['start'])
+            else:
+                start = end - timedelta(hours=request.args.get('hours', 24, type=float))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 date/times'}), 400
+        if start >= end:
+            return jsonify({'error': 'start must be before end'}), 400
+        
+        if role_level == 99:
+            allowed_lots = None
+        else:
+            allowed_lots = get_admin_lot_permissions(admin_id)
+            if lot_id and lot_id not in allowed_lots:
+                return jsonify({'error': 'Access denied to this parking lot'}), 403
+        
+        if lot_id:
+            lot_ids = [lot_id]
+        else:
+            lot_ids = [i for i in occupancy_history.lot_ids() if allowed_lots is None or i in allowed_lots]
+        
+        lots = []
+        for current_lot_id in lot_ids:
+            lot = tariff_cache.get(current_lot_id)
+            series = occupancy_history.history(current_lot_id, start.timestamp(), end.timestamp(), resolution)
+            lots.append({
+                'lotId': current_lot_id,
+                'name': lot['Name'] if lot else None,
+                'totalSpaces': lot['TotalSpaces'] if lot else None,
+                **series
+            })
+        
+        return jsonify({'start': start, 'end': end, 'lots': lots})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -611,7 +1147,7 @@ def generate_coupon():
         
         # Validate parking lot exists
         lot_query = "SELECT Name FROM PARKING_LOT WHERE ParkingLotID = %s"
-        lot_result = db_connector.execute_query(lot_query, (parking_lot_id,))
+        lot_result = db_connector.execute_query(lot_query, (parking_lot_id,), cache_ttl=300)
         
         if not lot_result:
             return jsonify({'error': '停車場不存在'}), 404
@@ -621,13 +1157,14 @@ def generate_coupon():
         # Generate coupons
         generated_coupons = []
         for i in range(min(quantity, 10)):  # Limit to 10 coupons per request
-            coupon_result = CouponService.generate_coupon(parking_lot_id, partner_name)
+            with db_connector.lot_shard(parking_lot_id):
+                coupon_result = CouponService.generate_coupon(parking_lot_id, partner_name)
             
             if coupon_result['success']:
                 generated_coupons.append({
                     'code': coupon_result['code'],
                     'discountId': coupon_result['discount_id'],
-                    'expiryTime': coupon_result['expiry_time'].isoformat()
+                    'expiryTime': coupon_result['expiry_time']
                 })
         
         if generated_coupons:
@@ -638,7 +1175,7 @@ def generate_coupon():
                 'parkingLotName': lot_name,
                 'partnerName': partner_name,
                 'coupons': generated_coupons,
-                'generatedAt': datetime.now().isoformat()
+                'generatedAt': datetime.now()
             })
         else:
             return jsonify({'error': '優惠券生成失敗'}), 500
@@ -650,6 +1187,7 @@ def generate_coupon():
 
 @admin_bp.route('/admins', methods=['GET'])
 @require_super_admin
+@read_replica
 def get_admins():
     """
     Get all administrators (Super Admin only)
@@ -690,6 +1228,7 @@ def get_admins():
 
 @admin_bp.route('/admins/<int:admin_id>', methods=['GET'])
 @require_super_admin
+@read_replica
 def get_admin(admin_id):
     """
     Get specific administrator details
@@ -760,7 +1299,7 @@ def create_admin():
         check_query = "SELECT AdminID, Username FROM ADMINS WHERE LOWER(Username) = LOWER(%s)"
         existing_conflict = db_connector.execute_query(check_query, (username,))
         if existing_conflict:
-            logger.warning(f"Attempted to create duplicate username: {username}, conflicts with existing: {existing_conflict[0]['Username']}")
+            logger.warning("Attempted to create duplicate username: %s, conflicts with existing: %s", username, existing_conflict[0]['Username'])
             return jsonify({'error': f'Username already exists: {username}'}), 400
         
         # Hash password
@@ -782,18 +1321,17 @@ def create_admin():
         result = db_connector.execute_query(id_query, (username,))
         admin_id = result[0]['AdminID'] if result and len(result) > 0 else None
         
-        # Assign parking lots (for LotManager)
+        # Assign parking lots (for LotManager) in one statement
         if role_level == 1 and lot_ids:
-            for lot_id in lot_ids:
-                assignment_query = """
-                    INSERT INTO ADMIN_LOT_ASSIGNMENTS (AdminID, ParkingLotID, AssignedAt)
-                    VALUES (%s, %s, %s)
-                """
-                db_connector.execute_query(
-                    assignment_query, 
-                    (admin_id, lot_id, datetime.now()),
-                    fetch=False
-                )
+            from ..services.admin_import import assignment_statements
+            db_connector.execute_transaction(
+                assignment_statements([(username, lot_id) for lot_id in set(lot_ids)], [], session['admin_id']))
+        
+        audit_log.record('admin.create', 'admin', admin_id, details={
+            'username': username,
+            'roleLevel': role_level,
+            'lots': lot_ids if role_level == 1 else []
+        })
         
         return jsonify({
             'success': True,
@@ -804,6 +1342,65 @@ def create_admin():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/admins/import', methods=['POST'])
+@require_super_admin
+def import_admins():
+    """
+    Create / update administrators and their lot assignments in bulk (Super Admin only)
+    POST /api/v1/admin/admins/import?mode=replace&dry_run=false
+    Body (JSON): {"admins": [{"username": "m1", "password": "secret", "roleLevel": 1, "lots": [1, 2]}]}
+    Body (text/csv): username,password,role_level,lots
+                     m1,secret,1,1;2
+    
+    With mode=replace each listed admin's lots become exactly the given set; mode=merge only adds.
+    Omitted fields are left unchanged. The whole import is one transaction.
+    """
+    return _bulk_import(create=True)
+
+@admin_bp.route('/admins/assignments/import', methods=['POST'])
+@require_super_admin
+def import_admin_assignments():
+    """
+    Set lot assignments of existing administrators in bulk (Super Admin only)
+    POST /api/v1/admin/admins/assignments/import?mode=replace&dry_run=false
+    Body (JSON): {"admins": [{"username": "m1", "lots": [1, 2]}]}
+    Body (text/csv): username,lot_id (one assignment per line)
+    """
+    return _bulk_import(create=False)
+
+def _bulk_import(create):
+    """Shared handler of the bulk admin and assignment imports"""
+    from ..services.admin_import import AdminImportError, apply_import, parse_rows, plan_import, summarize
+    
+    try:
+        mode = request.args.get('mode', 'replace')
+        if mode not in ('replace', 'merge'):
+            return jsonify({'error': 'mode must be replace or merge'}), 400
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        
+        try:
+            if request.mimetype == 'text/csv':
+                rows = parse_rows(request.get_data(as_text=True), 'csv')
+            else:
+                rows = parse_rows(request.get_json(silent=True), 'json')
+            plan = plan_import(rows, replace=mode == 'replace', create=create)
+        except AdminImportError as e:
+            return jsonify({'error': 'Import rejected', 'details': e.errors}), 400
+        
+        if dry_run:
+            return jsonify({'success': True, 'dryRun': True, **summarize(plan)})
+        
+        result = apply_import(plan, assigned_by=session['admin_id'])
+        audit_log.record('admin.import', 'admin', None, details={
+            'mode': mode,
+            'created': [username for username, _, _ in plan['create']],
+            **result
+        })
+        return jsonify({'success': True, 'dryRun': False, **result})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/admins/<int:admin_id>', methods=['PUT'])
 @require_super_admin
 def update_admin(admin_id):
@@ -819,7 +1416,7 @@ def update_admin(admin_id):
             return jsonify({'error': 'Request body is required'}), 400
         
         # Check if admin exists
-        check_query = "SELECT AdminID, Username FROM ADMINS WHERE AdminID = %s"
+        check_query = "SELECT AdminID, Username, RoleLevel FROM ADMINS WHERE AdminID = %s"
         existing = db_connector.execute_query(check_query, (admin_id,))
         if not existing:
             return jsonify({'error': 'Administrator not found'}), 404
@@ -857,31 +1454,30 @@ def update_admin(admin_id):
         if updates:
             params.append(admin_id)
             update_query = f"UPDATE ADMINS SET {', '.join(updates)} WHERE AdminID = %s"
-            logger.info(f"Updating admin {admin_id} with query: {update_query} and params: {params}")
+            logger.debug("Updating admin %s", admin_id, extra={'sql': update_query})
             result = db_connector.execute_query(update_query, params, fetch=False)
-            logger.info(f"Update result: {result} rows affected")
+            logger.debug("Update result: %s rows affected", result)
         
-        # Update lot assignments
+        # Update lot assignments: only the lots that differ are inserted or deleted
         if 'lots' in data:
-            # Remove existing assignments
-            delete_query = "DELETE FROM ADMIN_LOT_ASSIGNMENTS WHERE AdminID = %s"
-            db_connector.execute_query(delete_query, (admin_id,), fetch=False)
+            from ..services.admin_import import sync_assignments
             
-            # Add new assignments (for LotManager)
-            role_level = data.get('RoleLevel', existing[0].get('RoleLevel', 1))
-            if role_level == 1:
-                for lot_id in data['lots']:
-                    assignment_query = """
-                        INSERT INTO ADMIN_LOT_ASSIGNMENTS (AdminID, ParkingLotID, AssignedAt)
-                        VALUES (%s, %s, %s)
-                    """
-                    db_connector.execute_query(
-                        assignment_query, 
-                        (admin_id, lot_id, datetime.now()),
-                        fetch=False
-                    )
-        
-        logger.info(f"Successfully updated admin {admin_id}")
+            # A SuperAdmin keeps no assignments
+            role_level = data.get('RoleLevel', existing[0]['RoleLevel'])
+            lot_ids = data['lots'] if role_level == 1 else []
+            username = data['Username'].strip() if 'Username' in data else existing[0]['Username']
+            sync_assignments(admin_id, username, lot_ids, session['admin_id'])
+        
+        # Never log the password itself, only that it changed
+        audit_log.record('admin.update', 'admin', admin_id, details={
+            'previousUsername': existing[0]['Username'],
+            'username': data.get('Username'),
+            'roleLevel': data.get('RoleLevel'),
+            'passwordChanged': bool(data.get('Password')),
+            'lots': data.get('lots')
+        })
+        
+        logger.info("Successfully updated admin %s", admin_id)
         return jsonify({
             'success': True,
             'message': 'Administrator updated successfully',
@@ -905,7 +1501,7 @@ def delete_admin(admin_id):
             return jsonify({'error': 'Cannot delete your own account'}), 400
         
         # Check if admin exists
-        check_query = "SELECT AdminID FROM ADMINS WHERE AdminID = %s"
+        check_query = "SELECT AdminID, Username, RoleLevel FROM ADMINS WHERE AdminID = %s"
         existing = db_connector.execute_query(check_query, (admin_id,))
         if not existing:
             return jsonify({'error': 'Administrator not found'}), 404
@@ -917,6 +1513,10 @@ def delete_admin(admin_id):
         # Delete admin
         delete_query = "DELETE FROM ADMINS WHERE AdminID = %s"
         db_connector.execute_query(delete_query, (admin_id,), fetch=False)
+        audit_log.record('admin.delete', 'admin', admin_id, details={
+            'username': existing[0]['Username'],
+            'roleLevel': existing[0]['RoleLevel']
+        })
         
         return jsonify({
             'success': True,
@@ -924,4 +1524,173 @@ def delete_admin(admin_id):
         })
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+# ============= 效能分析 API =============
+
+@admin_bp.route('/profiler', methods=['GET'])
+@require_super_admin
+def get_profiler_status():
+    """
+    Get request profiler status and captured profiles (Super Admin only)
+    GET /api/v1/admin/profiler
+    """
+    from ..utils.profiler import request_profiler
+    
+    profiles = request_profiler.list_profiles()
+    
+    return jsonify({**request_profiler.status(), 'profiles': profiles})
+
+@admin_bp.route('/profiler', methods=['PUT'])
+@require_super_admin
+def configure_profiler():
+    """
+    Arm the request profiler (Super Admin only)
+    PUT /api/v1/admin/profiler
+    Body: {"requests": 1} to profile the next request, or {"sampleRate": 0.05, "pathPrefix": "/api/v1/kiosk"}
+    """
+    try:
+        from ..utils.profiler import request_profiler
+        
+        data = request.get_json() or {}
+        requests_to_profile = int(data.get('requests', 0))
+        sample_rate = float(data.get('sampleRate', 0))
+        
+        if requests_to_profile < 0 or not 0 <= sample_rate <= 1:
+            return jsonify({'error': 'requests must be >= 0 and sampleRate between 0 and 1'}), 400
+        
+        request_profiler.configure(requests_to_profile, sample_rate, data.get('pathPrefix'))
+        return jsonify({'success': True, **request_profiler.status()})
+        
+    except (TypeError, ValueError):
+        return jsonify({'error': 'requests and sampleRate must be numbers'}), 400
+
+@admin_bp.route('/profiler', methods=['DELETE'])
+@require_super_admin
+def disable_profiler():
+    """
+    Disable the profiler and discard captured profiles (Super Admin only)
+    DELETE /api/v1/admin/profiler
+    """
+    from ..utils.profiler import request_profiler
+    
+    request_profiler.disable()
+    request_profiler.clear()
+    return jsonify({'success': True, 'message': 'Profiler disabled'})
+
+@admin_bp.route('/profiler/profiles/<int:profile_id>', methods=['GET'])
+@require_super_admin
+def download_profile(profile_id):
+    """
+    Download a captured profile (Super Admin only)
+    GET /api/v1/admin/profiler/profiles/{profile_id}?format=pstats|text
+    """
+    from ..utils.profiler import request_profiler, RequestProfiler
+    
+    profile = request_profiler.get_profile(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    if request.args.get('format', 'pstats') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        return RequestProfiler.format_text(profile, sort=sort), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    
+    filename = f"profile-{profile_id}-{profile['endpoint']}.prof"
+    return profile['stats'], 200, {
+        'Content-Type': 'application/octet-stream',
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    }
+
+@admin_bp.route('/query-stats', methods=['GET'])
+@require_super_admin
+def get_query_stats():
+    """
+    Top-N SQL statements by fingerprint (Super Admin only)
+    GET /api/v1/admin/query-stats?limit=20&sort=total|mean|max|calls|rows
+    """
+    try:
+        from ..utils.query_stats import query_stats, QueryStatistics
+        
+        limit = request.args.get('limit', 20, type=int)
+        sort = request.args.get('sort', 'total')
+        if sort not in QueryStatistics.SORT_KEYS:
+            return jsonify({'error': f"sort must be one of {', '.join(QueryStatistics.SORT_KEYS)}"}), 400
+        
+        statements = query_stats.top(limit=max(1, min(limit, 500)), sort=sort)
+        
+        return jsonify({**query_stats.summary(), 'sort': sort, 'statements': statements})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/query-stats', methods=['DELETE'])
+@require_super_admin
+def reset_query_stats():
+    """
+    Reset query statistics (Super Admin only)
+    DELETE /api/v1/admin/query-stats
+    """
+    from ..utils.query_stats import query_stats
+    
+    query_stats.reset()
+    return jsonify({'success': True, 'message': 'Query statistics reset'})
+
+@admin_bp.route('/query-cache', methods=['GET'])
+@require_super_admin
+def get_query_cache_stats():
+    """
+    Query result cache size, hit ratio and entries per table tag (Super Admin only)
+    GET /api/v1/admin/query-cache
+    """
+    from ..utils.query_cache import query_cache
+    
+    return jsonify(query_cache.stats())
+
+@admin_bp.route('/query-cache', methods=['DELETE'])
+@require_super_admin
+def clear_query_cache():
+    """
+    Drop every cached query result (Super Admin only)
+    DELETE /api/v1/admin/query-cache
+    """
+    from ..utils.query_cache import query_cache
+    
+    query_cache.clear()
+    return jsonify({'success': True, 'message': 'Query cache cleared'})
+
+@admin_bp.route('/traces', methods=['GET'])
+@require_super_admin
+def get_traces():
+    """
+    Recent request traces from the in-memory exporter (Super Admin only)
+    GET /api/v1/admin/traces?limit=50&min_ms=200&name=hardware.vehicle_exit
+    """
+    from ..utils.tracing import tracer, InMemoryExporter
+    
+    if not isinstance(tracer.exporter, InMemoryExporter):
+        return jsonify({'error': 'In-memory trace exporter is not enabled'}), 404
+    
+    traces = tracer.exporter.recent_traces(
+        limit=max(1, min(request.args.get('limit', 50, type=int), 500)),
+        min_duration_ms=request.args.get('min_ms', 0, type=float),
+        name=request.args.get('name')
+    )
+    return jsonify({'count': len(traces), 'traces': traces})
+
+@admin_bp.route('/traces/<trace_id>', methods=['GET'])
+@require_super_admin
+def get_trace(trace_id):
+    """
+    All spans of a single trace (Super Admin only)
+    GET /api/v1/admin/traces/{trace_id}
+    """
+    from ..utils.tracing import tracer, InMemoryExporter
+    
+    if not isinstance(tracer.exporter, InMemoryExporter):
+        return jsonify({'error': 'In-memory trace exporter is not enabled'}), 404
+    
+    spans = tracer.exporter.get_trace(trace_id.lower())
+    if not spans:
+        return jsonify({'error': 'Trace not found'}), 404
+    
+    return jsonify({'traceId': trace_id.lower(), 'spans': spans})
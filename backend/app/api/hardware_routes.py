@@ -1,10 +1,56 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from ..utils.db_connector import db_connector
+from ..utils.db_connector import db_connector, lot_sharded, DuplicateKeyError
+from ..services.plate_index import plate_index
+from ..services.fee_cache import fee_cache
+from ..services.tariff_cache import tariff_cache
 
 hardware_bp = Blueprint('hardware', __name__, url_prefix='/api/v1/lots')
 
+# PARKING_RECORD.VehicleNumber is NVARCHAR(8); SQL Server would silently cut a
+# longer plate, so "ABC-12345" could match and open the gate for "ABC-1234"
+MAX_PLATE_LENGTH = 8
+
+# Every gate operation is for one lot, so each view runs on that lot's shard (see DB_SHARD_MAP)
+
+# Gate decisions are single batches: the write and its outcome come back in one
+# round trip, and the filtered unique index idx_unique_active_vehicle (not a
+# prior SELECT) is what prevents a vehicle being inside the same lot twice.
+ENTRY_QUERY = """
+    SET NOCOUNT ON;
+    DECLARE @lot INT = %s, @plate NVARCHAR(8) = %s, @now DATETIME2 = %s;
+    DECLARE @entered TABLE (RecordID INT);
+    
+    INSERT INTO PARKING_RECORD (ParkingLotID, VehicleNumber, EntryTime)
+    OUTPUT INSERTED.RecordID INTO @entered
+    SELECT ParkingLotID, @plate, @now FROM PARKING_LOT WHERE ParkingLotID = @lot;
+    
+    SELECT pl.Name AS LotName, e.RecordID
+    FROM PARKING_LOT pl
+    LEFT JOIN @entered e ON 1 = 1
+    WHERE pl.ParkingLotID = @lot;
+"""
+
+EXIT_QUERY = """
+    SET NOCOUNT ON;
+    DECLARE @lot INT = %s, @plate NVARCHAR(8) = %s, @now DATETIME2 = %s;
+    DECLARE @exited TABLE (RecordID INT);
+    
+    UPDATE PARKING_RECORD
+    SET ExitTime = @now
+    OUTPUT INSERTED.RecordID INTO @exited
+    WHERE VehicleNumber = @plate AND ParkingLotID = @lot
+      AND ExitTime IS NULL AND PaidUntilTime >= @now;
+    
+    SELECT RecordID, 'open_gate' AS Outcome FROM @exited
+    UNION ALL
+    SELECT RecordID, CASE WHEN PaidUntilTime IS NULL THEN 'unpaid' ELSE 'payment_expired' END
+    FROM PARKING_RECORD
+    WHERE VehicleNumber = @plate AND ParkingLotID = @lot AND ExitTime IS NULL;
+"""
+
 @hardware_bp.route('/<int:lot_id>/entry', methods=['POST'])
+@lot_sharded
 def vehicle_entry(lot_id):
     """
     Simulate vehicle entry (license plate recognition)
@@ -18,57 +64,49 @@ def vehicle_entry(lot_id):
             return jsonify({'error': 'license_plate is required'}), 400
         
         license_plate = data['license_plate'].strip().upper()
+        if not license_plate or len(license_plate) > MAX_PLATE_LENGTH:
+            return jsonify({'error': f'license_plate must be 1 to {MAX_PLATE_LENGTH} characters'}), 400
+        entry_time = datetime.now()
         
-        # Validate parking lot exists
-        lot_query = "SELECT Name FROM PARKING_LOT WHERE ParkingLotID = %s"
-        lot_result = db_connector.execute_query(lot_query, (lot_id,))
-        
-        if not lot_result:
-            return jsonify({'error': 'Parking lot not found'}), 404
-        
-        lot_name = lot_result[0]['Name']
-        
-        # Check if vehicle is already in the lot (no exit record)
-        existing_query = """
-            SELECT RecordID FROM PARKING_RECORD 
-            WHERE VehicleNumber = %s AND ParkingLotID = %s AND ExitTime IS NULL
-        """
-        existing_result = db_connector.execute_query(existing_query, (license_plate, lot_id))
-        
-        if existing_result:
+        # Insert only if the lot exists; a duplicate active record violates the unique index
+        try:
+            result = db_connector.execute_returning(ENTRY_QUERY, (lot_id, license_plate, entry_time))
+        except DuplicateKeyError:
+            existing_query = """
+                SELECT RecordID FROM PARKING_RECORD 
+                WHERE VehicleNumber = %s AND ParkingLotID = %s AND ExitTime IS NULL
+            """
+            existing_result = db_connector.execute_query(existing_query, (license_plate, lot_id))
             return jsonify({
                 'error': f'Vehicle {license_plate} is already in the parking lot',
-                'existing_record_id': existing_result[0]['RecordID']
+                'existing_record_id': existing_result[0]['RecordID'] if existing_result else None
             }), 409
         
-        # Create new parking record
-        entry_time = datetime.now()
-        insert_query = """
-            INSERT INTO PARKING_RECORD (ParkingLotID, VehicleNumber, EntryTime)
-            OUTPUT INSERTED.RecordID
-            VALUES (%s, %s, %s)
-        """
+        if not result:
+            return jsonify({'error': 'Parking lot not found'}), 404
         
-        result = db_connector.execute_query(insert_query, (lot_id, license_plate, entry_time))
+        lot_name = result[0]['LotName']
+        record_id = result[0]['RecordID']
         
-        if result:
-            record_id = result[0]['RecordID']
-            
-            return jsonify({
-                'recordId': record_id,
-                'message': f'車輛 {license_plate} 已於 {entry_time.strftime("%Y-%m-%d %H:%M:%S")} 進入 {lot_name}。',
-                'licensePlate': license_plate,
-                'lotId': lot_id,
-                'lotName': lot_name,
-                'entryTime': entry_time.isoformat()
-            }), 201
-        else:
+        if record_id is None:
             return jsonify({'error': 'Failed to create parking record'}), 500
+        
+        plate_index.add(lot_id, record_id, license_plate)
+        
+        return jsonify({
+            'recordId': record_id,
+            'message': f'車輛 {license_plate} 已於 {entry_time.strftime("%Y-%m-%d %H:%M:%S")} 進入 {lot_name}。',
+            'licensePlate': license_plate,
+            'lotId': lot_id,
+            'lotName': lot_name,
+            'entryTime': entry_time
+        }), 201
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @hardware_bp.route('/<int:lot_id>/exit', methods=['POST'])
+@lot_sharded
 def vehicle_exit(lot_id):
     """
     Simulate vehicle exit (gate control)
@@ -82,16 +120,12 @@ def vehicle_exit(lot_id):
             return jsonify({'error': 'license_plate is required'}), 400
         
         license_plate = data['license_plate'].strip().upper()
+        if not license_plate or len(license_plate) > MAX_PLATE_LENGTH:
+            return jsonify({'error': f'license_plate must be 1 to {MAX_PLATE_LENGTH} characters'}), 400
+        current_time = datetime.now()
         
-        # Find active parking record
-        query = """
-            SELECT pr.*, pl.Name as LotName
-            FROM PARKING_RECORD pr
-            JOIN PARKING_LOT pl ON pr.ParkingLotID = pl.ParkingLotID
-            WHERE pr.VehicleNumber = %s AND pr.ParkingLotID = %s AND pr.ExitTime IS NULL
-        """
-        
-        result = db_connector.execute_query(query, (license_plate, lot_id))
+        # Conditional update: ExitTime is only set while the payment is still valid
+        result = db_connector.execute_returning(EXIT_QUERY, (lot_id, license_plate, current_time))
         
         if not result:
             return jsonify({
@@ -100,10 +134,8 @@ def vehicle_exit(lot_id):
             }), 404
         
         record = result[0]
-        current_time = datetime.now()
         
-        # Check payment status
-        if record['PaidUntilTime'] is None:
+        if record['Outcome'] == 'unpaid':
             # Not paid
             return jsonify({
                 'action': 'keep_gate_closed',
@@ -111,7 +143,7 @@ def vehicle_exit(lot_id):
                 'recordId': record['RecordID']
             }), 402
         
-        elif current_time > record['PaidUntilTime']:
+        elif record['Outcome'] == 'payment_expired':
             # Payment expired
             return jsonify({
                 'action': 'keep_gate_closed',
@@ -120,61 +152,77 @@ def vehicle_exit(lot_id):
             }), 402
         
         else:
-            # Payment valid, allow exit
-            # Update exit time
-            update_query = """
-                UPDATE PARKING_RECORD 
-                SET ExitTime = %s
-                WHERE RecordID = %s
-            """
-            
-            db_connector.execute_query(update_query, (current_time, record['RecordID']), fetch=False)
-            
+            # Payment valid, exit time already recorded
+            plate_index.remove(record['RecordID'])
+            fee_cache.invalidate(record['RecordID'])
             return jsonify({
                 'action': 'open_gate',
                 'message': '允許離場，感謝使用。',
                 'recordId': record['RecordID'],
-                'exitTime': current_time.isoformat()
+                'exitTime': current_time
             })
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@hardware_bp.route('/<int:lot_id>/search', methods=['GET'])
+@lot_sharded
+def search_plates(lot_id):
+    """
+    Fuzzy or prefix search over vehicles currently in the lot (LPR misreads)
+    GET /api/v1/lots/{lot_id}/search?q=A8C1234&mode=fuzzy|prefix&limit=5
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        mode = request.args.get('mode', 'fuzzy')
+        limit = max(1, min(request.args.get('limit', 5, type=int), 50))
+        
+        if not query:
+            return jsonify({'error': 'q parameter is required'}), 400
+        if mode not in ('fuzzy', 'prefix'):
+            return jsonify({'error': 'mode must be fuzzy or prefix'}), 400
+        
+        if mode == 'prefix':
+            candidates = plate_index.prefix(query, lot_id=lot_id, limit=limit)
+        else:
+            candidates = plate_index.search(query, lot_id=lot_id, limit=limit)
+        
+        return jsonify({'lotId': lot_id, 'query': query, 'mode': mode, 'candidates': candidates})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @hardware_bp.route('/<int:lot_id>/status', methods=['GET'])
+@lot_sharded
 def get_lot_status(lot_id):
     """
     Get parking lot current status
     GET /api/v1/lots/{lot_id}/status
     """
     try:
-        # Get lot information
-        lot_query = """
-            SELECT pl.*, 
-                   (SELECT COUNT(*) FROM PARKING_RECORD pr WHERE pr.ParkingLotID = pl.ParkingLotID AND pr.ExitTime IS NULL) as CurrentOccupancy
-            FROM PARKING_LOT pl
-            WHERE pl.ParkingLotID = %s
-        """
+        # Lot information from the in-memory lot cache
+        lot = tariff_cache.get(lot_id)
         
-        lot_result = db_connector.execute_query(lot_query, (lot_id,))
-        
-        if not lot_result:
+        if not lot:
             return jsonify({'error': 'Parking lot not found'}), 404
         
-        lot_info = lot_result[0]
-        
-        # Get today's statistics
+        # Get today's statistics; occupancy is counted live (idx_active_records), since the
+        # plate index of this worker may miss other workers' entries until its next refresh
         today_query = """
             SELECT 
                 COUNT(*) as TotalEntries,
                 COUNT(CASE WHEN pr.ExitTime IS NOT NULL THEN 1 END) as TotalExits,
-                ISNULL(SUM(pr.TotalFee), 0) as TotalRevenue
+                ISNULL(SUM(pr.TotalFee), 0) as TotalRevenue,
+                (SELECT COUNT(*) FROM PARKING_RECORD active
+                 WHERE active.ParkingLotID = %s AND active.ExitTime IS NULL) as CurrentOccupancy
             FROM PARKING_RECORD pr
             WHERE pr.ParkingLotID = %s 
               AND CAST(pr.EntryTime AS DATE) = CAST(GETDATE() AS DATE)
         """
         
-        today_result = db_connector.execute_query(today_query, (lot_id,))
+        today_result = db_connector.execute_query(today_query, (lot_id, lot_id))
         today_stats = today_result[0] if today_result else {}
+        lot_info = {**lot, 'CurrentOccupancy': today_stats.get('CurrentOccupancy', 0)}
         
         return jsonify({
             'lotId': lot_info['ParkingLotID'],
@@ -197,6 +245,7 @@ def get_lot_status(lot_id):
         return jsonify({'error': str(e)}), 500
 
 @hardware_bp.route('/<int:lot_id>/vehicles', methods=['GET'])
+@lot_sharded
 def get_current_vehicles(lot_id):
     """
     Get list of currently parked vehicles
@@ -227,9 +276,9 @@ def get_current_vehicles(lot_id):
             vehicles.append({
                 'recordId': record['RecordID'],
                 'licensePlate': record['VehicleNumber'],
-                'entryTime': record['EntryTime'].isoformat(),
+                'entryTime': record['EntryTime'],
                 'paymentStatus': record['PaymentStatus'],
-                'paidUntilTime': record['PaidUntilTime'].isoformat() if record['PaidUntilTime'] else None,
+                'paidUntilTime': record['PaidUntilTime'],
                 'totalFee': record['TotalFee']
             })
         
@@ -244,6 +293,7 @@ def get_current_vehicles(lot_id):
         return jsonify({'error': str(e)}), 500
 
 @hardware_bp.route('/<int:lot_id>/generate-coupon', methods=['POST'])
+@lot_sharded
 def generate_coupon(lot_id):
     """
     Generate discount coupon for a parking lot (for partners)
@@ -258,7 +308,7 @@ def generate_coupon(lot_id):
         
         # Validate parking lot exists
         lot_query = "SELECT Name FROM PARKING_LOT WHERE ParkingLotID = %s"
-        lot_result = db_connector.execute_query(lot_query, (lot_id,))
+        lot_result = db_connector.execute_query(lot_query, (lot_id,), cache_ttl=300)
         
         if not lot_result:
             return jsonify({'error': 'Parking lot not found'}), 404
@@ -274,8 +324,8 @@ def generate_coupon(lot_id):
                     'code': coupon_result['code'],
                     'parkingLotId': coupon_result['parking_lot_id'],
                     'partnerName': coupon_result['partner_name'],
-                    'generatedTime': coupon_result['generated_time'].isoformat(),
-                    'expiryTime': coupon_result['expiry_time'].isoformat(),
+                    'generatedTime': coupon_result['generated_time'],
+                    'expiryTime': coupon_result['expiry_time'],
                     'validFor': '1 小時停車費折抵'
                 }
             }), 201
@@ -1,47 +1,164 @@
 from flask import Blueprint, request, jsonify
 from ..services.billing_service import BillingService
 from ..services.coupon_service import CouponService
+from ..services.plate_index import plate_index, normalize_plate
+from ..services.quote_service import quote_service
+from ..services.tariff_cache import tariff_cache
 from ..utils.db_connector import db_connector
 
 kiosk_bp = Blueprint('kiosk', __name__, url_prefix='/api/v1/kiosk')
 
+# The kiosk API is unauthenticated: plate search needs a lot and enough of the
+# plate that it cannot be used to list the vehicles parked there
+MIN_SEARCH_KEY_LENGTH = 4
+
+def _plate_candidates(plate, limit=5):
+    """Likely intended plates for a lookup that found nothing (never fails the lookup itself)"""
+    try:
+        # Misreads (8/B, 0/O, a missing dash) normalize to distance 0; only the plate as typed is no suggestion
+        typed = plate.strip().upper()
+        return [
+            {'licensePlate': c['licensePlate'], 'lotId': c['lotId'], 'distance': c['distance']}
+            for c in plate_index.search(plate, limit=limit + 1) if c['licensePlate'].upper() != typed
+        ][:limit]
+    except Exception:
+        return []
+
+def _active_record(query, plate):
+    """Latest active record of a plate, asked of the shards the plate index places it in"""
+    if db_connector.sharded:
+        try:
+            lot_ids = plate_index.lots_of_plate(plate)
+        except Exception:
+            lot_ids = None
+        if lot_ids:
+            # Only the lot's own shard: a slow or failed other shard cannot delay or fail the lookup
+            rows, failed = db_connector.fan_out(query, (plate,), lot_ids=lot_ids)
+            if rows:
+                return max(rows, key=lambda row: row['EntryTime'])
+            if failed:
+                raise RuntimeError(f"Parking records temporarily unavailable: {', '.join(failed)}")
+    # Index miss (entered through another worker since its last refresh, or left and
+    # re-entered elsewhere): ask every shard
+    rows, failed = db_connector.fan_out(query, (plate,))
+    if not rows and failed:
+        # The vehicle may be parked in a lot whose shard did not answer
+        raise RuntimeError(f"Parking records temporarily unavailable: {', '.join(failed)}")
+    return max(rows, key=lambda row: row['EntryTime']) if rows else None
+
+def _record_lot(record_id, quote=None):
+    """Lot of a parking record, so the kiosk session runs on that lot's shard"""
+    if quote is not None:
+        return quote.fee_info['record']['ParkingLotID']
+    if not db_connector.sharded:
+        return None
+    lot_id = plate_index.lot_of(record_id)
+    if lot_id is None:
+        rows, _ = db_connector.fan_out("SELECT ParkingLotID FROM PARKING_RECORD WHERE RecordID = %s", (record_id,))
+        lot_id = rows[0]['ParkingLotID'] if rows else None
+    return lot_id
+
+@kiosk_bp.route('/search', methods=['GET'])
+def search_plates():
+    """
+    Fuzzy plate search across the active vehicles of one lot
+    GET /api/v1/kiosk/search?q=ABC1234&lot_id=1&limit=5
+    
+    Prefix (autocomplete) search is only offered on the hardware API.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        lot_id = request.args.get('lot_id', type=int)
+        limit = max(1, min(request.args.get('limit', 5, type=int), 20))
+        
+        if lot_id is None:
+            return jsonify({'error': 'lot_id parameter is required'}), 400
+        if len(normalize_plate(query)) < MIN_SEARCH_KEY_LENGTH:
+            return jsonify({'error': f'q must contain at least {MIN_SEARCH_KEY_LENGTH} letters or digits'}), 400
+        
+        candidates = [
+            {'licensePlate': c['licensePlate'], 'lotId': c['lotId'], 'distance': c['distance']}
+            for c in plate_index.search(query, lot_id=lot_id, limit=limit)
+        ]
+        
+        return jsonify({'query': query, 'candidates': candidates})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@kiosk_bp.route('/lots', methods=['GET'])
+def get_lots():
+    """
+    Lot names, base rates and time-of-day / weekday rules for the kiosk's rate display
+    GET /api/v1/kiosk/lots
+    
+    Answered from the tariff cache; the kiosk service worker serves it
+    stale-while-revalidate, so the display survives an API outage.
+    """
+    try:
+        from ..services.tariff_engine import rule_to_json
+        
+        lots = [{
+            'id': lot['ParkingLotID'],
+            'name': lot['Name'],
+            'hourlyRate': lot['HourlyRate'],
+            'dailyMaxRate': lot['DailyMaxRate'],
+            'rules': [rule_to_json(rule) for rule in tariff_cache.rules(lot['ParkingLotID'])]
+        } for lot in sorted(tariff_cache.all(), key=lambda lot: lot['Name'])]
+        
+        response = jsonify({'lots': lots})
+        response.headers['Cache-Control'] = 'no-cache'
+        response.add_etag()
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @kiosk_bp.route('/fee', methods=['GET'])
 def get_parking_fee():
     """
     Query parking fee by license plate
-    GET /api/v1/kiosk/fee%splate=ABC-1234
+    GET /api/v1/kiosk/fee?plate=ABC-1234
+    
+    Returns a quoteToken; pass it to apply-discount and pay so they reuse
+    this fee snapshot instead of recomputing it.
     """
     try:
         plate = request.args.get('plate')
         if not plate:
             return jsonify({'error': 'License plate parameter is required'}), 400
         
-        # Find active parking record for this plate
+        # Find active parking record for this plate, with the lot tariff for billing
         query = """
-            SELECT pr.RecordID, pr.VehicleNumber, pr.EntryTime, pr.ParkingLotID, pl.Name as LotName
+            SELECT pr.*, pl.HourlyRate, pl.DailyMaxRate, pl.Name as LotName
             FROM PARKING_RECORD pr
             JOIN PARKING_LOT pl ON pr.ParkingLotID = pl.ParkingLotID
             WHERE pr.VehicleNumber = %s AND pr.ExitTime IS NULL
             ORDER BY pr.EntryTime DESC
         """
         
-        result = db_connector.execute_query(query, (plate,))
-        
-        if not result:
-            return jsonify({'message': '找不到此車輛的在場紀錄。'}), 404
+        record = _active_record(query, plate)
         
-        record = result[0]
+        if not record:
+            return jsonify({
+                'message': '找不到此車輛的在場紀錄。',
+                'candidates': _plate_candidates(plate)
+            }), 404
         
-        # Calculate current fee
-        fee_info = BillingService.calculate_parking_fee(record['RecordID'])
+        # Calculate current fee and keep it as a quote for the rest of the session
+        fee_info = BillingService.current_fee_for_record(record)
+        quote = quote_service.create(fee_info)
         
         return jsonify({
             'recordId': record['RecordID'],
             'licensePlate': record['VehicleNumber'],
-            'entryTime': record['EntryTime'].isoformat(),
+            'entryTime': record['EntryTime'],
             'parkingDuration': fee_info['duration_display'],
             'fee': fee_info['fee'],
-            'lotName': record['LotName']
+            'lotName': record['LotName'],
+            'quoteToken': quote.token,
+            'quoteExpiresAt': quote.expires_at,
+            'feeChangesAt': fee_info['next_change_at']
         })
         
     except Exception as e:
@@ -52,36 +169,56 @@ def apply_discount():
     """
     Apply discount coupon to parking fee
     POST /api/v1/kiosk/apply-discount
-    Body: {"recordId": 123, "couponCode": "A1B2C3D4E5F6"}
+    Body: {"recordId": 123, "couponCode": "A1B2C3D4E5F6", "quoteToken": "..."}
+      or  {"recordId": 123, "coupons": ["A1B2C3D4E5F6"], "quoteToken": "..."} to set the full coupon list
     """
     try:
         data = request.get_json()
         
-        if not data or 'recordId' not in data or 'couponCode' not in data:
+        if not data or 'recordId' not in data or ('couponCode' not in data and 'coupons' not in data):
             return jsonify({'error': 'recordId and couponCode are required'}), 400
         
         record_id = data['recordId']
-        coupon_code = data['couponCode']
-        
-        # Validate coupon
-        validation = CouponService.validate_coupon(coupon_code, record_id)
-        
-        if not validation['valid']:
-            return jsonify({'message': validation['reason']}), 400
-        
-        # Calculate fee with discount
-        try:
-            fee_info = BillingService.apply_coupon_discount(record_id, [coupon_code])
+        quote = quote_service.get(data.get('quoteToken'), record_id)
+        with db_connector.lot_shard(_record_lot(record_id, quote)):
+            if quote is not None:
+                # Reuse the quoted fee; only newly added coupons hit the database
+                coupon_codes = data['coupons'] if 'coupons' in data else quote.coupon_codes + [data['couponCode']]
+                try:
+                    fee_info = quote_service.set_coupons(quote, coupon_codes)
+                except ValueError as e:
+                    return jsonify({'message': str(e)}), 400
+                
+                return jsonify({
+                    'originalFee': fee_info['original_fee'],
+                    'discountAmount': fee_info['total_discount'],
+                    'finalFee': fee_info['final_fee'],
+                    'appliedCoupons': [coupon['code'] for coupon in fee_info['applied_coupons']],
+                    'quoteToken': quote.token
+                })
             
-            return jsonify({
-                'originalFee': fee_info['original_fee'],
-                'discountAmount': fee_info['total_discount'],
-                'finalFee': fee_info['final_fee'],
-                'appliedCoupons': [coupon['code'] for coupon in fee_info['applied_coupons']]
-            })
+            coupon_codes = data['coupons'] if 'coupons' in data else [data['couponCode']]
+            
+            # Validate coupons
+            for coupon_code in coupon_codes:
+                validation = CouponService.validate_coupon(coupon_code, record_id)
+                
+                if not validation['valid']:
+                    return jsonify({'message': validation['reason']}), 400
             
-        except Exception as e:
-            return jsonify({'message': f'優惠券應用失敗: {str(e)}'}), 400
+            # Calculate fee with discount
+            try:
+                fee_info = BillingService.apply_coupon_discount(record_id, coupon_codes)
+                
+                return jsonify({
+                    'originalFee': fee_info['original_fee'],
+                    'discountAmount': fee_info['total_discount'],
+                    'finalFee': fee_info['final_fee'],
+                    'appliedCoupons': [coupon['code'] for coupon in fee_info['applied_coupons']]
+                })
+                
+            except Exception as e:
+                return jsonify({'message': f'優惠券應用失敗: {str(e)}'}), 400
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -91,7 +228,7 @@ def process_payment():
     """
     Process payment
     POST /api/v1/kiosk/pay
-    Body: {"recordId": 123, "amountPaid": 60, "paymentMethod": "CreditCard", "coupons": ["CODE1"]}
+    Body: {"recordId": 123, "amountPaid": 60, "paymentMethod": "CreditCard", "coupons": ["CODE1"], "quoteToken": "..."}
     """
     try:
         data = request.get_json()
@@ -109,20 +246,29 @@ def process_payment():
         if payment_method not in ['Cash', 'CreditCard']:
             return jsonify({'error': 'Invalid payment method. Use Cash or CreditCard'}), 400
         
-        # Process payment
-        payment_result = BillingService.process_payment(
-            record_id, amount_paid, payment_method, applied_coupons
-        )
-        
-        if payment_result['success']:
-            return jsonify({
-                'message': '繳費成功！請於 15 分鐘內離場。',
-                'exitBy': payment_result['exit_deadline'].isoformat(),
-                'transactionId': payment_result['transaction_id'],
-                'change': payment_result.get('change', 0)
-            })
-        else:
-            return jsonify({'error': 'Payment processing failed'}), 500
+        # A live quote with the same coupons is charged as quoted; otherwise recompute
+        quote = quote_service.get(data.get('quoteToken'), record_id)
+        with db_connector.lot_shard(_record_lot(record_id, quote)):
+            quoted_fee = None
+            if quote is not None and sorted(quote.coupon_codes) == sorted(applied_coupons):
+                quoted_fee = quote.discount_info
+            
+            # Process payment
+            payment_result = BillingService.process_payment(
+                record_id, amount_paid, payment_method, applied_coupons, quoted_fee=quoted_fee
+            )
+            
+            if payment_result['success']:
+                if quote is not None:
+                    quote_service.discard(quote.token)
+                return jsonify({
+                    'message': '繳費成功！請於 15 分鐘內離場。',
+                    'exitBy': payment_result['exit_deadline'],
+                    'transactionId': payment_result['transaction_id'],
+                    'change': payment_result.get('change', 0)
+                })
+            else:
+                return jsonify({'error': 'Payment processing failed'}), 500
         
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -144,12 +290,14 @@ def get_vehicle_status(plate):
             ORDER BY pr.EntryTime DESC
         """
         
-        result = db_connector.execute_query(query, (plate,))
+        record = _active_record(query, plate)
         
-        if not result:
-            return jsonify({'status': 'not_found', 'message': '車輛不在場內'}), 404
-        
-        record = result[0]
+        if not record:
+            return jsonify({
+                'status': 'not_found',
+                'message': '車輛不在場內',
+                'candidates': _plate_candidates(plate)
+            }), 404
         
         # Check payment status
         if record['PaidUntilTime']:
@@ -171,9 +319,9 @@ def get_vehicle_status(plate):
             'message': message,
             'recordId': record['RecordID'],
             'licensePlate': record['VehicleNumber'],
-            'entryTime': record['EntryTime'].isoformat(),
+            'entryTime': record['EntryTime'],
             'lotName': record['LotName'],
-            'paidUntilTime': record['PaidUntilTime'].isoformat() if record['PaidUntilTime'] else None
+            'paidUntilTime': record['PaidUntilTime']
         })
         
     except Exception as e:
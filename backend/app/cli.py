@@ -0,0 +1,106 @@
+import os
+import click
+
+
+def register_commands(app):
+    """Register maintenance commands on the flask CLI"""
+
+    @app.cli.command('build-assets')
+    @click.option('--output', default=None, help='Build folder (default: ASSET_BUILD_FOLDER or static/dist)')
+    def build_assets_command(output):
+        """Fingerprint and precompress static assets for immutable caching"""
+        from .utils.assets import build_assets
+
+        output = output or app.config.get('ASSET_BUILD_FOLDER') or os.path.join(app.static_folder, 'dist')
+        manifest = build_assets(app.static_folder, output)
+        for logical, hashed in sorted(manifest.items()):
+            click.echo(f'{logical} -> {hashed}')
+        click.echo(f'Built {len(manifest)} assets into {output}')
+
+    @app.cli.command('reconcile-payments')
+    @click.option('--full', is_flag=True, help='Reconcile every record instead of resuming from the high-water marks')
+    def reconcile_payments_command(full):
+        """Compare PARKING_RECORD.TotalFee with PAYMENT_RECORD sums per lot and entry date"""
+        from .services.reconciliation import payment_reconciler
+
+        if app.config.get('DB_SHARDS'):
+            raise click.ClickException('Payment reconciliation does not support DB_SHARDS yet')
+        result = payment_reconciler.run(full=full)
+        click.echo(f"Reconciled {result['records']} records in {result['groups']} lot-days: "
+                   f"{result['discrepancies']} discrepancies ({result['durationMs']} ms)")
+        click.echo(f"High-water marks: RecordID {result['lastRecordId']}, PaymentID {result['lastPaymentId']}")
+
+    @app.cli.command('sync-lot-shards')
+    @click.option('--lot', 'lot_ids', multiple=True, type=int, help='Parking lot ID (repeatable; default all lots)')
+    def sync_lot_shards_command(lot_ids):
+        """Copy PARKING_LOT rows from the primary to the shards DB_SHARD_MAP routes them to"""
+        from .services.lot_shards import sync_lots
+
+        if not app.config.get('DB_SHARDS'):
+            raise click.ClickException('DB_SHARDS is not configured')
+        copied = sync_lots(list(lot_ids) or None)
+        for shard, count in sorted(copied.items()):
+            click.echo(f'{shard}: {count} lots')
+        click.echo(f'Copied {sum(copied.values())} lots to {len(copied)} shards')
+
+    @app.cli.command('simulate-tariff')
+    @click.option('--start', 'start_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='First entry date (YYYY-MM-DD)')
+    @click.option('--end', 'end_date', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+                  help='Last entry date, inclusive (YYYY-MM-DD)')
+    @click.option('--lot', 'lot_ids', multiple=True, type=int, help='Parking lot ID (repeatable; default all lots)')
+    @click.option('--hourly-rate', type=int, default=None, help='Proposed HourlyRate')
+    @click.option('--daily-max', type=int, default=None, help='Proposed DailyMaxRate')
+    @click.option('--rules', 'rules_file', type=click.File(encoding='utf-8'), default=None,
+                  help='JSON file with a list of proposed tariff rules ([] for a flat tariff)')
+    def simulate_tariff_command(start_date, end_date, lot_ids, hourly_rate, daily_max, rules_file):
+        """Re-price past closed stays under a proposed tariff and report the revenue change"""
+        import json
+        from datetime import timedelta
+        from .services.tariff_simulator import simulate, validate_proposal
+
+        proposal = {}
+        if hourly_rate is not None:
+            proposal['hourlyRate'] = hourly_rate
+        if daily_max is not None:
+            proposal['dailyMaxRate'] = daily_max
+        if rules_file is not None:
+            proposal['rules'] = json.load(rules_file)
+        try:
+            validate_proposal(proposal)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+        result = simulate(start_date, end_date + timedelta(days=1), proposal, list(lot_ids))
+        for lot in result['lots']:
+            change = f"{lot['deltaPercent']:+.2f}%" if lot['deltaPercent'] is not None else 'n/a'
+            click.echo(f"{lot['lotId']:>4} {lot['name']}: {lot['stays']} stays, "
+                       f"{lot['currentRevenue']} -> {lot['proposedRevenue']} ({lot['delta']:+d}, {change})")
+        distribution = result['distribution']
+        click.echo(f"Total: {result['stays']} stays, {result['currentRevenue']} -> {result['proposedRevenue']} "
+                   f"({result['delta']:+d}); {distribution['staysPayingMore']} pay more, "
+                   f"{distribution['staysPayingLess']} pay less ({result['durationMs']} ms)")
+
+    @app.cli.command('import-admins')
+    @click.argument('source', type=click.File(encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), default=None,
+                  help='File format (default: from the file extension)')
+    @click.option('--merge', is_flag=True, help='Only add listed lots instead of making them the exact assignment set')
+    @click.option('--assignments-only', is_flag=True, help='Only change lot assignments of existing admins')
+    @click.option('--dry-run', is_flag=True, help='Show the changes without applying them')
+    def import_admins_command(source, fmt, merge, assignments_only, dry_run):
+        """Create / update admins and lot assignments from a CSV or JSON file in one transaction"""
+        from .services.admin_import import AdminImportError, apply_import, parse_rows, plan_import, summarize
+
+        fmt = fmt or ('json' if source.name.endswith('.json') else 'csv')
+        try:
+            plan = plan_import(parse_rows(source.read(), fmt), replace=not merge, create=not assignments_only)
+        except AdminImportError as e:
+            for error in e.errors:
+                click.echo(error, err=True)
+            raise click.ClickException('Import rejected, nothing was changed')
+
+        result = summarize(plan) if dry_run else apply_import(plan)
+        click.echo(f"{'Would apply' if dry_run else 'Applied'}: {result['adminsCreated']} admins created, "
+                   f"{result['adminsUpdated']} updated, {result['adminsUnchanged']} unchanged; "
+                   f"{result['assignmentsAdded']} assignments added, {result['assignmentsRemoved']} removed")
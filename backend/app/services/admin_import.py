@@ -0,0 +1,244 @@
+import csv
+import hashlib
+import io
+import json
+from datetime import datetime
+from ..utils.db_connector import db_connector
+from .tariff_cache import tariff_cache
+
+ROLE_LEVELS = (1, 99)
+
+# SQL Server allows 2100 parameters per statement and 1000 rows per VALUES list
+_ADMIN_ROWS = 500
+_PAIR_ROWS = 900
+
+
+class AdminImportError(ValueError):
+    """Rejected import; errors lists one message per offending row"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid rows')
+        self.errors = errors
+
+
+def password_hash(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def parse_rows(content, fmt):
+    """
+    Admin rows from a JSON list or CSV text
+
+    JSON: [{"username": "m1", "password": "...", "roleLevel": 1, "lots": [1, 2]}, ...]
+    CSV: a header with username and any of password, role_level and lots
+    ("1;2;3"); a lot_id column instead gives one assignment per line, and
+    lines of the same username are combined. Fields left out are not changed.
+    """
+    if fmt == 'json':
+        data = json.loads(content) if isinstance(content, str) else content
+        if isinstance(data, dict):
+            data = data.get('admins')
+        if not isinstance(data, list):
+            raise AdminImportError(['expected a list of admins'])
+        return [
+            {
+                'username': row.get('username'),
+                'password': row.get('password'),
+                'roleLevel': row.get('roleLevel'),
+                'lots': row.get('lots')
+            } if isinstance(row, dict) else {'username': None}
+            for row in data
+        ]
+
+    rows = {}
+    errors = []
+    for line, record in enumerate(csv.DictReader(io.StringIO(content)), start=2):
+        username = (record.get('username') or '').strip()
+        row = rows.setdefault(username.lower(), {'username': username, 'password': None, 'roleLevel': None, 'lots': None})
+        try:
+            if record.get('password'):
+                row['password'] = record['password']
+            if record.get('role_level'):
+                row['roleLevel'] = int(record['role_level'])
+            if 'lots' in record:
+                row['lots'] = [int(lot) for lot in (record['lots'] or '').split(';') if lot.strip()]
+            elif record.get('lot_id'):
+                row['lots'] = (row['lots'] or []) + [int(record['lot_id'])]
+        except ValueError:
+            errors.append(f'line {line}: role_level and lot IDs must be integers')
+    if errors:
+        raise AdminImportError(errors)
+    return list(rows.values())
+
+
+def plan_import(rows, replace=True, create=True):
+    """
+    Diff requested admins and assignments against the database
+
+    With replace a row's lots are its complete assignment set (lots it no
+    longer lists are removed); otherwise they are only added. create=False
+    restricts the import to existing admins. Raises AdminImportError if any
+    row is invalid, so nothing is applied partially.
+    """
+    existing = {
+        row['Username'].lower(): row
+        for row in db_connector.execute_query("SELECT AdminID, Username, RoleLevel FROM ADMINS")
+    }
+    lot_ids = {lot['ParkingLotID'] for lot in tariff_cache.all()}
+
+    errors = []
+    seen = set()
+    targets = []
+    for index, row in enumerate(rows, start=1):
+        username = (row.get('username') or '').strip()
+        if not username:
+            errors.append(f'row {index}: username is required')
+            continue
+        if username.lower() in seen:
+            errors.append(f'row {index}: duplicate username {username}')
+            continue
+        seen.add(username.lower())
+
+        current = existing.get(username.lower())
+        role_level = row.get('roleLevel')
+        if current is None and not create:
+            errors.append(f'row {index}: unknown admin {username}')
+            continue
+        if current is None and (not row.get('password') or role_level is None):
+            errors.append(f'row {index}: password and roleLevel are required for new admin {username}')
+            continue
+        if role_level is not None and role_level not in ROLE_LEVELS:
+            errors.append(f'row {index}: roleLevel must be 1 (LotManager) or 99 (SuperAdmin)')
+            continue
+        lots = row.get('lots')
+        if lots is not None:
+            if not isinstance(lots, list) or any(not isinstance(lot, int) for lot in lots):
+                errors.append(f'row {index}: lots must be a list of lot IDs')
+                continue
+            unknown = sorted(set(lots) - lot_ids)
+            if unknown:
+                errors.append(f"row {index}: unknown parking lots {', '.join(map(str, unknown))}")
+                continue
+        targets.append((username, current, row))
+    if errors:
+        raise AdminImportError(errors)
+
+    admin_ids = [current['AdminID'] for _, current, _ in targets if current is not None]
+    assigned = {}
+    for offset in range(0, len(admin_ids), _PAIR_ROWS):
+        chunk = admin_ids[offset:offset + _PAIR_ROWS]
+        assignments = db_connector.execute_query(
+            f"SELECT AdminID, ParkingLotID FROM ADMIN_LOT_ASSIGNMENTS WHERE AdminID IN ({', '.join(['%s'] * len(chunk))})",
+            tuple(chunk))
+        for assignment in assignments:
+            assigned.setdefault(assignment['AdminID'], set()).add(assignment['ParkingLotID'])
+
+    plan = {'create': [], 'update': [], 'add': [], 'remove': [], 'unchanged': 0}
+    for username, current, row in targets:
+        role_level = row.get('roleLevel') if row.get('roleLevel') is not None else current['RoleLevel']
+        changed = current is None or role_level != current['RoleLevel'] or bool(row.get('password'))
+        if current is None:
+            plan['create'].append((username, password_hash(row['password']), role_level))
+            had = set()
+        else:
+            if changed:
+                new_hash = password_hash(row['password']) if row.get('password') else None
+                plan['update'].append((current['AdminID'], role_level, new_hash))
+            had = assigned.get(current['AdminID'], set())
+
+        # Super admins see every lot and keep no assignments
+        if role_level == 99:
+            wanted = set()
+        elif row.get('lots') is None:
+            wanted = had
+        else:
+            wanted = set(row['lots']) if replace else had | set(row['lots'])
+        added, removed = sorted(wanted - had), sorted(had - wanted)
+        plan['add'].extend((username, lot_id) for lot_id in added)
+        plan['remove'].extend((current['AdminID'], lot_id) for lot_id in removed)
+        if not (changed or added or removed):
+            plan['unchanged'] += 1
+    return plan
+
+
+def assignment_statements(additions, removals, assigned_by=None, assigned_at=None):
+    """
+    Set-based statements applying assignment changes
+
+    additions are (username, lot ID) pairs, so they also cover admins
+    inserted earlier in the same transaction; removals are (admin ID,
+    lot ID) pairs.
+    """
+    assigned_at = assigned_at or datetime.now()
+    statements = []
+    for offset in range(0, len(removals), _PAIR_ROWS):
+        chunk = removals[offset:offset + _PAIR_ROWS]
+        statements.append((f"""
+            DELETE FROM ADMIN_LOT_ASSIGNMENTS
+            WHERE EXISTS (
+                SELECT 1 FROM (VALUES {', '.join(['(%s, %s)'] * len(chunk))}) AS v(AdminID, ParkingLotID)
+                WHERE v.AdminID = ADMIN_LOT_ASSIGNMENTS.AdminID AND v.ParkingLotID = ADMIN_LOT_ASSIGNMENTS.ParkingLotID
+            )
+        """, tuple(value for pair in chunk for value in pair)))
+    for offset in range(0, len(additions), _PAIR_ROWS):
+        chunk = additions[offset:offset + _PAIR_ROWS]
+        statements.append((f"""
+            INSERT INTO ADMIN_LOT_ASSIGNMENTS (AdminID, ParkingLotID, AssignedAt, AssignedBy)
+            SELECT a.AdminID, v.ParkingLotID, %s, %s
+            FROM (VALUES {', '.join(['(%s, %s)'] * len(chunk))}) AS v(Username, ParkingLotID)
+            JOIN ADMINS a ON a.Username = v.Username
+        """, (assigned_at, assigned_by) + tuple(value for pair in chunk for value in pair)))
+    return statements
+
+
+def apply_import(plan, assigned_by=None):
+    """Run a plan from plan_import in one transaction"""
+    now = datetime.now()
+    statements = []
+    for offset in range(0, len(plan['create']), _ADMIN_ROWS):
+        chunk = plan['create'][offset:offset + _ADMIN_ROWS]
+        statements.append((
+            f"INSERT INTO ADMINS (Username, PasswordHash, RoleLevel, CreatedAt) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}",
+            tuple(value for row in chunk for value in row + (now,))
+        ))
+    for offset in range(0, len(plan['update']), _ADMIN_ROWS):
+        chunk = plan['update'][offset:offset + _ADMIN_ROWS]
+        statements.append((f"""
+            UPDATE ADMINS
+            SET RoleLevel = v.RoleLevel, PasswordHash = COALESCE(v.PasswordHash, ADMINS.PasswordHash)
+            FROM ADMINS
+            JOIN (VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))}) AS v(AdminID, RoleLevel, PasswordHash)
+                ON ADMINS.AdminID = v.AdminID
+        """, tuple(value for row in chunk for value in row)))
+    statements.extend(assignment_statements(plan['add'], plan['remove'], assigned_by, now))
+    if statements:
+        db_connector.execute_transaction(statements)
+    return summarize(plan)
+
+
+def summarize(plan):
+    return {
+        'adminsCreated': len(plan['create']),
+        'adminsUpdated': len(plan['update']),
+        'assignmentsAdded': len(plan['add']),
+        'assignmentsRemoved': len(plan['remove']),
+        'adminsUnchanged': plan['unchanged']
+    }
+
+
+def sync_assignments(admin_id, username, lot_ids, assigned_by=None):
+    """Make lot_ids the exact assignment set of one admin, touching only the rows that differ"""
+    had = {
+        row['ParkingLotID'] for row in db_connector.execute_query(
+            "SELECT ParkingLotID FROM ADMIN_LOT_ASSIGNMENTS WHERE AdminID = %s", (admin_id,))
+    }
+    wanted = set(lot_ids)
+    statements = assignment_statements(
+        [(username, lot_id) for lot_id in sorted(wanted - had)],
+        [(admin_id, lot_id) for lot_id in sorted(had - wanted)],
+        assigned_by
+    )
+    if statements:
+        db_connector.execute_transaction(statements)
+    return len(wanted - had), len(had - wanted)
@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from ..utils.db_connector import db_connector
+
+# Dwell-time histogram bucket edges in minutes; the last bucket is open-ended
+DWELL_BUCKETS = (0, 15, 30, 60, 120, 180, 240, 360, 480, 720, 1440, 2880)
+
+# EntryTime span loaded per query, so each batch is an index seek on (ParkingLotID, EntryTime)
+BATCH_DAYS = 7
+
+_LOAD_QUERY = """
+    SELECT DATEDIFF(SECOND, %s, EntryTime) AS EntryOffset,
+           DATEDIFF(SECOND, %s, ExitTime) AS ExitOffset
+    FROM PARKING_RECORD
+    WHERE ParkingLotID = %s AND EntryTime >= %s AND EntryTime < %s
+"""
+
+# Vehicles that entered before the window and were still parked when it began
+_CARRIED_OVER_QUERY = """
+    SELECT DATEDIFF(SECOND, %s, EntryTime) AS EntryOffset,
+           DATEDIFF(SECOND, %s, ExitTime) AS ExitOffset
+    FROM PARKING_RECORD
+    WHERE ParkingLotID = %s AND EntryTime < %s AND (ExitTime IS NULL OR ExitTime > %s)
+"""
+
+
+class LotIntervals:
+    """
+    Parking intervals of one lot overlapping [start, end), held as columns
+
+    Times are seconds since start. Vehicles still parked are treated as
+    leaving at min(now, end); they are excluded from dwell statistics.
+    """
+
+    def __init__(self, lot_id, start, end, entries, exits, completed, loaded_at=None):
+        self.lot_id = lot_id
+        self.start = start
+        self.end = end
+        self.span = int((end - start).total_seconds())
+        self.entries = entries
+        self.exits = exits
+        self.completed = completed
+        self.loaded_at = loaded_at or datetime.now()
+        self.reports = {}
+
+    @classmethod
+    def load(cls, lot_id, start, end):
+        """Load the intervals in EntryTime batches of BATCH_DAYS and concatenate the columns"""
+        now = datetime.now()
+        batches = [_columns(db_connector.execute_query(_CARRIED_OVER_QUERY, (start, start, lot_id, start, start)))]
+        batch_start = start
+        while batch_start < end:
+            batch_end = min(batch_start + timedelta(days=BATCH_DAYS), end)
+            rows = db_connector.execute_query(_LOAD_QUERY, (start, start, lot_id, batch_start, batch_end))
+            batches.append(_columns(rows))
+            batch_start = batch_end
+
+        entries = np.concatenate([batch[0] for batch in batches])
+        exits = np.concatenate([batch[1] for batch in batches])
+        completed = exits >= 0
+        # Still parked: occupied until now, or until the end of a window in the past
+        open_until = int((min(now, end) - start).total_seconds())
+        exits = np.where(completed, exits, max(open_until, 0))
+        return cls(lot_id, start, end, entries, exits, completed, loaded_at=now)
+
+    def occupied_seconds(self, edges):
+        """
+        Vehicle-seconds of occupancy in [0, t) for every t in edges
+
+        Sweep over the sorted interval boundaries: each entry before t adds
+        t - entry, each exit before t subtracts t - exit; prefix sums make
+        this O((n + m) log n) for n intervals and m edges.
+        """
+        entries = np.sort(np.clip(self.entries, 0, None)).astype(np.float64)
+        exits = np.sort(np.clip(self.exits, 0, None)).astype(np.float64)
+        entry_sums = np.concatenate(([0.0], np.cumsum(entries)))
+        exit_sums = np.concatenate(([0.0], np.cumsum(exits)))
+        edges = np.asarray(edges, dtype=np.float64)
+        entered = np.searchsorted(entries, edges, side='right')
+        exited = np.searchsorted(exits, edges, side='right')
+        return (entered * edges - entry_sums[entered]) - (exited * edges - exit_sums[exited])
+
+    def occupancy_curve(self, step_seconds):
+        """Time-weighted average occupancy per step over the window"""
+        edges = np.arange(0, self.span + step_seconds, step_seconds)
+        edges[-1] = min(edges[-1], self.span)
+        return np.diff(self.occupied_seconds(edges)) / np.diff(edges)
+
+    def heatmap(self, total_spaces=None):
+        """Average and peak-hour occupancy by hour of week (Monday = 0)"""
+        hourly = self.occupancy_curve(3600)
+        # Hours after the data was loaded have no occupancy yet and would drag the averages down
+        elapsed = (min(self.loaded_at, self.end) - self.start).total_seconds()
+        hourly = hourly[:max(0, -(-int(elapsed) // 3600))]
+        hours = np.arange(len(hourly))
+        slots = ((self.start.weekday() * 24 + self.start.hour + hours) % 168).astype(np.int64)
+        counts = np.bincount(slots, minlength=168)
+        sums = np.bincount(slots, weights=hourly, minlength=168)
+        peaks = np.zeros(168)
+        np.maximum.at(peaks, slots, hourly)
+        averages = np.divide(sums, counts, out=np.full(168, np.nan), where=counts > 0)
+
+        grid = []
+        for weekday in range(7):
+            row = []
+            for hour in range(24):
+                slot = weekday * 24 + hour
+                if not counts[slot]:
+                    row.append(None)
+                    continue
+                cell = {'avg': round(float(averages[slot]), 2), 'peak': round(float(peaks[slot]), 2)}
+                if total_spaces:
+                    cell['rate'] = round(float(averages[slot]) / total_spaces * 100, 1)
+                row.append(cell)
+            grid.append(row)
+        return {'weekdays': grid, 'peakOccupancy': round(float(hourly.max()), 2) if len(hourly) else 0}
+
+    def dwell(self):
+        """Histogram and percentiles of completed stays that began inside the window, in minutes"""
+        mask = self.completed & (self.entries >= 0)
+        minutes = (self.exits[mask] - self.entries[mask]) / 60.0
+        edges = np.array(DWELL_BUCKETS + (np.inf,), dtype=np.float64)
+        counts, _ = np.histogram(minutes, bins=edges)
+        buckets = [
+            {'fromMinutes': int(low), 'toMinutes': None if np.isinf(high) else int(high), 'count': int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ]
+        if not len(minutes):
+            return {'count': 0, 'buckets': buckets, 'meanMinutes': None, 'percentiles': None}
+        p50, p90, p99 = np.percentile(minutes, (50, 90, 99))
+        return {
+            'count': int(len(minutes)),
+            'buckets': buckets,
+            'meanMinutes': round(float(minutes.mean()), 1),
+            'percentiles': {'p50': round(float(p50), 1), 'p90': round(float(p90), 1), 'p99': round(float(p99), 1)}
+        }
+
+    def turnover(self, total_spaces=None):
+        """Entries per day and per space per day"""
+        days = -(-self.span // 86400)
+        inside = self.entries >= 0
+        per_day = np.bincount(self.entries[inside] // 86400, minlength=days)[:days]
+        rates = per_day / total_spaces if total_spaces else None
+        return {
+            'days': [
+                {
+                    'date': (self.start + timedelta(days=day)).date().isoformat(),
+                    'entries': int(per_day[day]),
+                    'turnover': round(float(rates[day]), 3) if rates is not None else None
+                }
+                for day in range(days)
+            ],
+            'totalEntries': int(per_day.sum()),
+            'averageTurnover': round(float(rates.mean()), 3) if rates is not None and days else None
+        }
+
+
+def _columns(rows):
+    """Entry and exit offset columns of a batch; -1 marks a record without ExitTime"""
+    count = len(rows)
+    entries = np.fromiter((row['EntryOffset'] for row in rows), dtype=np.int64, count=count)
+    exits = np.fromiter(
+        (row['ExitOffset'] if row['ExitOffset'] is not None else -1 for row in rows), dtype=np.int64, count=count)
+    return entries, exits
+
+
+class AnalyticsCache:
+    """
+    LRU of loaded LotIntervals (with their computed reports) per lot and date range
+
+    Ranges that are entirely in the past only change through late exits
+    or admin corrections and are kept for closed_ttl seconds; ranges that
+    include today are reloaded after open_ttl seconds.
+    """
+
+    def __init__(self, max_entries=64, open_ttl=60, closed_ttl=3600):
+        self.max_entries = max_entries
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self._entries = OrderedDict()   # (lot_id, start, end) -> (LotIntervals, expires_at)
+        self._lock = threading.Lock()
+
+    def intervals(self, lot_id, start, end):
+        key = (lot_id, start, end)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        with db_connector.lot_shard(lot_id):
+            intervals = LotIntervals.load(lot_id, start, end)
+        ttl = self.open_ttl if end > intervals.loaded_at else self.closed_ttl
+        with self._lock:
+            self._entries[key] = (intervals, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return intervals
+
+    def report(self, kind, lot_id, start, end, total_spaces=None):
+        """Computed report ('heatmap', 'dwell' or 'turnover'), memoized with the intervals"""
+        intervals = self.intervals(lot_id, start, end)
+        result = intervals.reports.get(kind)
+        if result is None:
+            if kind == 'heatmap':
+                result = intervals.heatmap(total_spaces)
+            elif kind == 'turnover':
+                result = intervals.turnover(total_spaces)
+            else:
+                result = intervals.dwell()
+            intervals.reports[kind] = result
+        return {**result, 'records': int(len(intervals.entries)), 'computedAt': intervals.loaded_at}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global analytics cache
+analytics_cache = AnalyticsCache()
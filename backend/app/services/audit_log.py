@@ -0,0 +1,272 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from flask import has_request_context, request, session
+from ..utils.db_connector import db_connector
+from ..utils.metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process per fallback file, the thread lock is enough
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+AUDIT_EVENTS = registry.counter(
+    'audit_events_total', 'Audit events by how they were persisted', ('outcome',))
+AUDIT_QUEUE_DEPTH = registry.gauge('audit_queue_depth', 'Audit events waiting to be written')
+
+# SQL Server allows 2100 parameters per statement; audit rows have 9
+_INSERT_ROWS = 200
+
+_COLUMNS = ('OccurredAt', 'AdminID', 'Username', 'Action', 'TargetType', 'TargetID',
+            'ParkingLotID', 'Details', 'ClientIP')
+
+
+class AuditLog:
+    """
+    Append-only audit trail of admin overrides and account changes
+
+    record() only enqueues the event, so an audited handler pays no extra
+    commit; a writer thread inserts queued events into AUDIT_LOG in batches.
+    When the queue stays full for block_seconds the caller writes the event
+    to the fallback file itself (backpressure without loss), and events the
+    database refuses also go to that file. The file is replayed into the
+    table once writes succeed again, and the queue is drained at shutdown.
+    Workers share the file: appends and the hand-over to replay hold an
+    flock on {file}.lock, and only one process replays at a time.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_seconds=2.0, block_seconds=0.2,
+                 fallback_path=None):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.block_seconds = block_seconds
+        self.fallback_path = fallback_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def record(self, action, target_type, target_id=None, lot_id=None, details=None):
+        """Queue one event; the acting admin and client address come from the current request"""
+        event = {
+            'OccurredAt': datetime.now(),
+            'AdminID': None,
+            'Username': None,
+            'Action': action,
+            'TargetType': target_type,
+            'TargetID': None if target_id is None else str(target_id),
+            'ParkingLotID': lot_id,
+            'Details': json.dumps(details, default=str, ensure_ascii=False) if details else None,
+            'ClientIP': None
+        }
+        if has_request_context():
+            event['AdminID'] = session.get('admin_id')
+            event['Username'] = session.get('username')
+            event['ClientIP'] = request.remote_addr
+
+        if not self.running:
+            # No writer (CLI, tests, writer disabled): write through
+            self._write([event])
+            return
+        try:
+            self._queue.put(event, timeout=self.block_seconds)
+            AUDIT_EVENTS.inc(outcome='queued')
+            AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+        except queue.Full:
+            self._spill([event])
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self, app):
+        from ..utils.health import health_monitor
+
+        if self.running:
+            return
+        self._app = app
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        health_monitor.register_worker('audit-writer', max(3 * self.flush_seconds, 15))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self, timeout=5.0):
+        """Stop the writer and persist whatever is still queued"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        batch = self._take(self._queue.qsize(), wait=False)
+        if batch:
+            with self._app.app_context():
+                self._write(batch)
+
+    def _run(self):
+        from ..utils.health import health_monitor
+
+        with self._app.app_context():
+            replay = True
+            while not self._stop.is_set():
+                # One failed batch (e.g. the fallback file is not writable) must not end the writer,
+                # or every record() after it would write inside its request
+                try:
+                    if replay:
+                        self.replay()
+                    batch = self._take(self.batch_size)
+                    replay = bool(batch) and self._write(batch) and self._has_spilled()
+                except Exception as e:
+                    logger.exception("Audit writer iteration failed: %s", e)
+                    replay = False
+                    self._stop.wait(self.flush_seconds)
+                AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+                health_monitor.heartbeat('audit-writer')
+
+    def _take(self, limit, wait=True):
+        """Up to limit queued events, waiting at most flush_seconds for the first"""
+        batch = []
+        try:
+            if wait:
+                batch.append(self._queue.get(timeout=self.flush_seconds))
+            while len(batch) < limit:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, events):
+        """Insert events into AUDIT_LOG in one transaction; on failure spill them to the fallback file"""
+        try:
+            _insert(events)
+            AUDIT_EVENTS.inc(len(events), outcome='written')
+            return True
+        except Exception as e:
+            logger.warning("Audit log write failed, spilling %d events: %s", len(events), e)
+            self._spill(events)
+            return False
+
+    def _spill(self, events):
+        if not self.fallback_path:
+            logger.error("Audit events lost, no fallback file configured: %s", events)
+            AUDIT_EVENTS.inc(len(events), outcome='lost')
+            return
+        with self._file_lock, _flock(f'{self.fallback_path}.lock'):
+            with open(self.fallback_path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event, default=str, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        AUDIT_EVENTS.inc(len(events), outcome='spilled')
+
+    def _has_spilled(self):
+        return bool(self.fallback_path) and os.path.exists(self.fallback_path)
+
+    def replay(self):
+        """Move events from the fallback file into AUDIT_LOG; returns the number replayed"""
+        if not self._has_spilled():
+            return 0
+        with _flock(f'{self.fallback_path}.replay.lock', blocking=False) as acquired:
+            # Another worker is replaying; it takes whatever this one spilled as well
+            if not acquired:
+                return 0
+            return self._replay()
+
+    def _replay(self):
+        replay_path = f'{self.fallback_path}.replay'
+        with self._file_lock, _flock(f'{self.fallback_path}.lock'):
+            # Only the replay lock holder gets here, so an existing .replay file is left over from a crash
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.fallback_path):
+                    return 0
+                os.replace(self.fallback_path, replay_path)
+        events = []
+        bad_lines = []
+        with open(replay_path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                    event['OccurredAt'] = datetime.fromisoformat(event['OccurredAt'])
+                except (ValueError, TypeError, KeyError):
+                    # e.g. a line torn by a crash mid-append; kept aside instead of blocking the rest
+                    bad_lines.append(line if line.endswith('\n') else line + '\n')
+                    continue
+                events.append(event)
+        try:
+            # One transaction, so a failed replay leaves nothing half-inserted
+            _insert(events)
+        except Exception as e:
+            logger.warning("Audit log replay failed, keeping %s: %s", replay_path, e)
+            return 0
+        if bad_lines:
+            with open(f'{self.fallback_path}.bad', 'a', encoding='utf-8') as f:
+                f.writelines(bad_lines)
+            AUDIT_EVENTS.inc(len(bad_lines), outcome='undecodable')
+            logger.error("Moved %d undecodable audit lines to %s.bad", len(bad_lines), self.fallback_path)
+        os.remove(replay_path)
+        AUDIT_EVENTS.inc(len(events), outcome='replayed')
+        logger.info("Replayed %d spilled audit events", len(events))
+        return len(events)
+
+
+@contextmanager
+def _flock(path, blocking=True):
+    """Exclusive lock on path across processes; yields False if busy and not blocking"""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _insert(events):
+    statements = []
+    for offset in range(0, len(events), _INSERT_ROWS):
+        chunk = events[offset:offset + _INSERT_ROWS]
+        placeholders = ', '.join(['(' + ', '.join(['%s'] * len(_COLUMNS)) + ')'] * len(chunk))
+        statements.append((
+            f"INSERT INTO AUDIT_LOG ({', '.join(_COLUMNS)}) VALUES {placeholders}",
+            tuple(event[column] for event in chunk for column in _COLUMNS)
+        ))
+    # AUDIT_LOG is only kept on the primary, also for events recorded inside a lot's shard
+    with db_connector.primary():
+        db_connector.execute_transaction(statements)
+
+
+# Global audit log
+audit_log = AuditLog()
+
+
+def init_app(app):
+    """Configure the queue and start the batch writer"""
+    audit_log.max_queue = app.config.get('AUDIT_QUEUE_SIZE', 10000)
+    audit_log.batch_size = app.config.get('AUDIT_BATCH_SIZE', 500)
+    audit_log.flush_seconds = app.config.get('AUDIT_FLUSH_SECONDS', 2.0)
+    audit_log.block_seconds = app.config.get('AUDIT_BLOCK_SECONDS', 0.2)
+    audit_log.fallback_path = app.config.get('AUDIT_FALLBACK_FILE')
+
+    if app.config.get('AUDIT_WRITER_ENABLED', True):
+        audit_log.start(app)
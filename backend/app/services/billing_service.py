@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta
 import math
-from ..utils.db_connector import db_connector
+from ..utils.db_connector import db_connector, StaleRowError
+from .fee_cache import fee_cache
+from .tariff_cache import tariff_cache
+from ..utils.tracing import traced
+from ..utils.transaction_ids import transaction_ids
 
 class BillingService:
     """Core billing logic for parking fees calculation"""
     
     @staticmethod
-    def calculate_parking_fee(record_id):
+    @traced
+    def calculate_parking_fee(record_id, use_cache=True):
         """
         Calculate parking fee based on complex billing logic
         
@@ -16,6 +21,10 @@ class BillingService:
         - Free parking for first 15 minutes (Scenario A only)
         - After 15 min: CEILING(hours) * hourly_rate
         - Apply daily maximum cap if applicable
+        
+        The record is always read, so another worker's payment is seen; with
+        use_cache the fee for its current PaidUntilTime may then come from
+        the fee cache. Pass use_cache=False where the fee is charged.
         """
         try:
             # Get parking record with lot information
@@ -30,65 +39,148 @@ class BillingService:
             if not result:
                 raise ValueError("Parking record not found")
             
-            record = result[0]
-            current_time = datetime.now()
-            
-            # Determine calculation start time based on scenario
-            if record['PaidUntilTime'] is None:
-                # Scenario A: First payment
-                calculation_start_time = record['EntryTime']
-                apply_free_period = True
-            else:
-                # Scenario B: Subsequent payment
-                calculation_start_time = record['PaidUntilTime']
-                apply_free_period = False
-            
-            # Calculate parking duration in minutes
-            duration_delta = current_time - calculation_start_time
-            duration_minutes = duration_delta.total_seconds() / 60
-            
-            # Apply 15-minute free period for first-time payment only
-            if apply_free_period and duration_minutes <= 15:
-                return {
-                    'fee': 0,
-                    'duration_minutes': duration_minutes,
-                    'duration_display': BillingService._format_duration(duration_minutes),
-                    'calculation_start_time': calculation_start_time,
-                    'current_time': current_time,
-                    'scenario': 'A',
-                    'record': record
-                }
-            
-            # Calculate billable hours (ceiling)
-            duration_hours = duration_minutes / 60
-            billable_hours = math.ceil(duration_hours)
-            
-            # Calculate base fee
-            base_fee = billable_hours * record['HourlyRate']
-            
-            # Apply daily maximum cap if set
-            if record['DailyMaxRate'] and base_fee > record['DailyMaxRate']:
-                # Calculate number of days (24-hour periods)
-                duration_days = math.ceil(duration_hours / 24)
-                final_fee = duration_days * record['DailyMaxRate']
-            else:
-                final_fee = base_fee
+            if use_cache:
+                return BillingService.current_fee_for_record(result[0])
+            fee_info = BillingService.calculate_fee_for_record(result[0])
+            fee_cache.put(fee_info)
+            return fee_info
             
+        except Exception as e:
+            raise Exception(f"Billing calculation error: {str(e)}")
+    
+    @staticmethod
+    def current_fee_for_record(record, current_time=None):
+        """
+        Fee for an already loaded record, served from the fee cache while it
+        is unchanged (same PaidUntilTime, before the next price change)
+        """
+        if current_time is None:
+            current_time = datetime.now()
+        
+        cached = fee_cache.get(record['RecordID'], current_time, paid_until=record['PaidUntilTime'])
+        if cached is not None:
+            return BillingService._refresh_duration({**cached, 'record': record}, current_time)
+        
+        fee_info = BillingService.calculate_fee_for_record(record, current_time)
+        fee_cache.put(fee_info)
+        return fee_info
+    
+    @staticmethod
+    def calculate_fee_for_record(record, current_time=None):
+        """
+        Calculate the fee for an already loaded record (no database access)
+        
+        The record needs EntryTime, PaidUntilTime, HourlyRate and DailyMaxRate.
+        For a lot with time-of-day / weekday rules (ParkingLotID given) the
+        started hours are priced with its compiled schedule instead of
+        HourlyRate; the free period, PaidUntilTime and daily cap apply alike.
+        The result includes next_change_at, the instant the fee next changes:
+        the end of the free period, the next hourly ceiling, or the next
+        24-hour period once the daily cap applies.
+        """
+        if current_time is None:
+            current_time = datetime.now()
+        
+        # Determine calculation start time based on scenario
+        if record['PaidUntilTime'] is None:
+            # Scenario A: First payment
+            calculation_start_time = record['EntryTime']
+            apply_free_period = True
+        else:
+            # Scenario B: Subsequent payment
+            calculation_start_time = record['PaidUntilTime']
+            apply_free_period = False
+        
+        # Calculate parking duration in minutes
+        duration_delta = current_time - calculation_start_time
+        duration_minutes = duration_delta.total_seconds() / 60
+        
+        # Apply 15-minute free period for first-time payment only
+        if apply_free_period and duration_minutes <= 15:
             return {
-                'fee': final_fee,
-                'base_fee': base_fee,
-                'billable_hours': billable_hours,
+                'fee': 0,
                 'duration_minutes': duration_minutes,
                 'duration_display': BillingService._format_duration(duration_minutes),
                 'calculation_start_time': calculation_start_time,
                 'current_time': current_time,
-                'scenario': 'A' if apply_free_period else 'B',
+                'scenario': 'A',
                 'record': record,
-                'capped': record['DailyMaxRate'] and base_fee > record['DailyMaxRate']
+                'next_change_at': calculation_start_time + timedelta(minutes=15)
             }
-            
-        except Exception as e:
-            raise Exception(f"Billing calculation error: {str(e)}")
+        
+        # Calculate billable hours (ceiling)
+        duration_hours = duration_minutes / 60
+        billable_hours = math.ceil(duration_hours)
+        
+        # Calculate base fee
+        schedule = tariff_cache.schedule(record['ParkingLotID']) if record.get('ParkingLotID') else None
+        if schedule is not None:
+            base_fee = schedule.price(calculation_start_time, calculation_start_time + timedelta(hours=billable_hours))
+        else:
+            base_fee = billable_hours * record['HourlyRate']
+        
+        # Apply daily maximum cap if set
+        if record['DailyMaxRate'] and base_fee > record['DailyMaxRate']:
+            # Calculate number of days (24-hour periods)
+            duration_days = math.ceil(duration_hours / 24)
+            final_fee = duration_days * record['DailyMaxRate']
+            # Once capped the base fee only grows, so the fee steps once per 24 hours
+            next_change_at = calculation_start_time + timedelta(days=duration_days)
+        else:
+            final_fee = base_fee
+            next_change_at = calculation_start_time + timedelta(hours=billable_hours)
+        
+        return {
+            'fee': final_fee,
+            'base_fee': base_fee,
+            'billable_hours': billable_hours,
+            'duration_minutes': duration_minutes,
+            'duration_display': BillingService._format_duration(duration_minutes),
+            'calculation_start_time': calculation_start_time,
+            'current_time': current_time,
+            'scenario': 'A' if apply_free_period else 'B',
+            'record': record,
+            'capped': record['DailyMaxRate'] and base_fee > record['DailyMaxRate'],
+            'scheduled_tariff': schedule is not None,
+            'next_change_at': next_change_at
+        }
+    
+    @staticmethod
+    def calculate_fees_batch(durations, entry_positions, hourly_rate, daily_max_rate=None, schedule=None):
+        """
+        First-payment (scenario A) fees of many stays at once, as NumPy arrays
+        
+        The rules of calculate_fee_for_record in vectorized form: free for
+        15 minutes, then started hours at hourly_rate (or priced over the
+        compiled schedule from each entry's week position), capped per
+        started 24-hour period once the base fee exceeds daily_max_rate.
+        durations are in seconds.
+        """
+        import numpy as np
+        
+        durations = np.asarray(durations, dtype=np.float64)
+        billable_hours = np.ceil(durations / 3600)
+        if schedule is not None:
+            entry_positions = np.asarray(entry_positions, dtype=np.float64)
+            base_fees = schedule.price_positions(entry_positions, entry_positions + billable_hours * 3600)
+        else:
+            base_fees = (billable_hours * hourly_rate).astype(np.int64)
+        
+        fees = base_fees
+        if daily_max_rate:
+            fees = np.where(base_fees > daily_max_rate, np.ceil(durations / 86400) * daily_max_rate, base_fees)
+        return np.where(durations <= 15 * 60, 0, fees).astype(np.int64)
+    
+    @staticmethod
+    def _refresh_duration(fee_info, current_time):
+        """Cached fee with the elapsed-time fields brought up to current_time"""
+        duration_minutes = (current_time - fee_info['calculation_start_time']).total_seconds() / 60
+        return {
+            **fee_info,
+            'duration_minutes': duration_minutes,
+            'duration_display': BillingService._format_duration(duration_minutes),
+            'current_time': current_time
+        }
     
     @staticmethod
     def _format_duration(minutes):
@@ -102,104 +194,139 @@ class BillingService:
             return f"{mins} 分鐘"
     
     @staticmethod
-    def apply_coupon_discount(record_id, coupon_codes):
+    @traced
+    def apply_coupon_discount(record_id, coupon_codes, fee_info=None):
         """
         Apply coupon discounts to parking fee
         Returns updated fee calculation with applied discounts
+        
+        A previously computed fee_info (e.g. from a kiosk quote) is reused
+        instead of reloading the record and recomputing the fee.
         """
         from .coupon_service import CouponService
         
         try:
             # Get current fee calculation
-            fee_info = BillingService.calculate_parking_fee(record_id)
-            original_fee = fee_info['fee']
-            
-            applied_coupons = []
-            total_discount = 0
+            if fee_info is None:
+                fee_info = BillingService.calculate_parking_fee(record_id)
             
             for coupon_code in coupon_codes:
                 # Validate coupon
-                validation = CouponService.validate_coupon(coupon_code, record_id)
+                validation = CouponService.validate_coupon(coupon_code, record_id, record=fee_info['record'])
                 
-                if validation['valid']:
-                    # Calculate discount (1 hour per coupon)
-                    hourly_rate = fee_info['record']['HourlyRate']
-                    discount_amount = min(hourly_rate, original_fee - total_discount)
-                    
-                    if discount_amount > 0:
-                        applied_coupons.append({
-                            'code': coupon_code,
-                            'discount': discount_amount
-                        })
-                        total_discount += discount_amount
-                else:
+                if not validation['valid']:
                     raise ValueError(f"Invalid coupon: {validation['reason']}")
             
-            final_fee = max(0, original_fee - total_discount)
-            
-            return {
-                **fee_info,
-                'original_fee': original_fee,
-                'total_discount': total_discount,
-                'final_fee': final_fee,
-                'applied_coupons': applied_coupons
-            }
+            return BillingService.calculate_coupon_discount(fee_info, coupon_codes)
             
         except Exception as e:
             raise Exception(f"Coupon application error: {str(e)}")
     
     @staticmethod
-    def process_payment(record_id, payment_amount, payment_method, applied_coupons=None):
+    def calculate_coupon_discount(fee_info, coupon_codes):
+        """Apply already validated coupons (1 hour each) to a fee calculation"""
+        original_fee = fee_info['fee']
+        hourly_rate = fee_info['record']['HourlyRate']
+        
+        applied_coupons = []
+        total_discount = 0
+        
+        for coupon_code in coupon_codes:
+            # Calculate discount (1 hour per coupon)
+            discount_amount = min(hourly_rate, original_fee - total_discount)
+            
+            if discount_amount > 0:
+                applied_coupons.append({
+                    'code': coupon_code,
+                    'discount': discount_amount
+                })
+                total_discount += discount_amount
+        
+        final_fee = max(0, original_fee - total_discount)
+        
+        return {
+            **fee_info,
+            'original_fee': original_fee,
+            'total_discount': total_discount,
+            'final_fee': final_fee,
+            'applied_coupons': applied_coupons
+        }
+    
+    @staticmethod
+    @traced
+    def process_payment(record_id, payment_amount, payment_method, applied_coupons=None, quoted_fee=None):
         """
         Process payment and update records
+        
+        quoted_fee is a fee calculation whose coupons (applied_coupons) were
+        already validated, e.g. from a kiosk quote; it is charged as-is while
+        the record is still in the state it was quoted for. If it was paid,
+        marked paid or exited since, the fee is recomputed instead.
         """
         try:
-            # Get current fee calculation
-            fee_info = BillingService.calculate_parking_fee(record_id)
-            expected_amount = fee_info['fee']
-            
-            # Apply coupons if provided
-            if applied_coupons:
-                coupon_fee_info = BillingService.apply_coupon_discount(record_id, applied_coupons)
-                expected_amount = coupon_fee_info['final_fee']
+            if quoted_fee is not None:
+                fee_info = quoted_fee
+                expected_amount = quoted_fee.get('final_fee', quoted_fee['fee'])
+            else:
+                # Get current fee calculation
+                fee_info = BillingService.calculate_parking_fee(record_id, use_cache=False)
+                expected_amount = fee_info['fee']
                 
-                # Mark coupons as used
-                for coupon in applied_coupons:
-                    CouponService.use_coupon(coupon, record_id)
+                # Apply coupons if provided
+                if applied_coupons:
+                    coupon_fee_info = BillingService.apply_coupon_discount(record_id, applied_coupons, fee_info)
+                    expected_amount = coupon_fee_info['final_fee']
             
             if payment_amount < expected_amount:
                 raise ValueError(f"Insufficient payment. Expected: {expected_amount}, Received: {payment_amount}")
             
             current_time = datetime.now()
             exit_deadline = current_time + timedelta(minutes=15)
+            paid_until = fee_info['record']['PaidUntilTime']
             
-            # Update parking record
+            # TotalFee accumulates every payment of the stay (a later payment covers only the time
+            # since PaidUntilTime); PAYMENT_RECORD stores the amount charged, net of change, so the
+            # two always add up. The update only matches the record as it was priced (same
+            # PaidUntilTime, not exited); the payment row and the coupons are written in the same
+            # transaction, so a concurrent payment, mark-paid or forced exit rolls all of it back.
             update_query = """
                 UPDATE PARKING_RECORD 
-                SET PaidUntilTime = %s, TotalFee = %s
-                WHERE RecordID = %s
+                SET PaidUntilTime = %s, TotalFee = ISNULL(TotalFee, 0) + %s
+                WHERE RecordID = %s AND ExitTime IS NULL
+                  AND (PaidUntilTime = %s OR (PaidUntilTime IS NULL AND %s IS NULL))
             """
-            db_connector.execute_query(update_query, (exit_deadline, expected_amount, record_id), fetch=False)
-            
-            # Insert payment record
             payment_query = """
                 INSERT INTO PAYMENT_RECORD (RecordID, PaymentAmount, PaymentMethod, PaymentTime, TransactionID)
                 VALUES (%s, %s, %s, %s, %s)
             """
-            transaction_id = f"TXN{current_time.strftime('%Y%m%d%H%M%S')}{record_id}"
-            db_connector.execute_query(payment_query, 
-                                     (record_id, payment_amount, payment_method, current_time, transaction_id), 
-                                     fetch=False)
-            
-            return {
-                'success': True,
-                'transaction_id': transaction_id,
-                'exit_deadline': exit_deadline,
-                'paid_amount': payment_amount,
-                'change': payment_amount - expected_amount if payment_amount > expected_amount else 0
-            }
+            transaction_id = transaction_ids.next_id('TXN')
+            statements = [
+                (update_query, (exit_deadline, expected_amount, record_id, paid_until, paid_until), 1),
+                (payment_query, (record_id, expected_amount, payment_method, current_time, transaction_id))
+            ]
+            for coupon in applied_coupons or []:
+                query, params = CouponService.use_coupon_statement(coupon, record_id, current_time)
+                statements.append((query, params, 1))
+            try:
+                db_connector.execute_transaction(statements)
+            except StaleRowError:
+                fee_cache.invalidate(record_id)
+                if quoted_fee is None:
+                    raise ValueError("Parking record or coupon changed during payment, please try again")
+            else:
+                fee_cache.invalidate(record_id)
+                return {
+                    'success': True,
+                    'transaction_id': transaction_id,
+                    'exit_deadline': exit_deadline,
+                    'paid_amount': payment_amount,
+                    'change': payment_amount - expected_amount if payment_amount > expected_amount else 0
+                }
             
         except Exception as e:
             raise Exception(f"Payment processing error: {str(e)}")
+        
+        # The quote is stale: charge what is owed now (0 if it was paid meanwhile)
+        return BillingService.process_payment(record_id, payment_amount, payment_method, applied_coupons)
 
 from .coupon_service import CouponService
\ No newline at end of file
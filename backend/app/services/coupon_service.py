@@ -2,11 +2,13 @@ import string
 import random
 from datetime import datetime, timedelta
 from ..utils.db_connector import db_connector
+from ..utils.tracing import traced
 
 class CouponService:
     """Service for managing parking discount coupons"""
     
     @staticmethod
+    @traced
     def generate_coupon(parking_lot_id, partner_name=None):
         """
         Generate a new discount coupon for a specific parking lot
@@ -59,13 +61,15 @@ class CouponService:
             raise Exception(f"Coupon generation error: {str(e)}")
     
     @staticmethod
-    def validate_coupon(coupon_code, record_id):
+    @traced
+    def validate_coupon(coupon_code, record_id, record=None):
         """
         Validate a coupon against all required criteria
         
         Args:
             coupon_code: The coupon code to validate
             record_id: The parking record ID to validate against
+            record: Optional already loaded parking record (needs ParkingLotID), skips the lookup
             
         Returns:
             dict: Validation result with details
@@ -95,17 +99,18 @@ class CouponService:
                 return {'valid': False, 'reason': '優惠券已過期'}
             
             # Get parking record information
-            record_query = """
-                SELECT ParkingLotID, VehicleNumber
-                FROM PARKING_RECORD
-                WHERE RecordID = %s
-            """
-            record_result = db_connector.execute_query(record_query, (record_id,))
-            
-            if not record_result:
-                return {'valid': False, 'reason': '停車記錄不存在'}
-            
-            record = record_result[0]
+            if record is None:
+                record_query = """
+                    SELECT ParkingLotID, VehicleNumber
+                    FROM PARKING_RECORD
+                    WHERE RecordID = %s
+                """
+                record_result = db_connector.execute_query(record_query, (record_id,))
+                
+                if not record_result:
+                    return {'valid': False, 'reason': '停車記錄不存在'}
+                
+                record = record_result[0]
             
             # Check if coupon is for the same parking lot
             if coupon['ParkingLotID'] != record['ParkingLotID']:
@@ -122,6 +127,17 @@ class CouponService:
             return {'valid': False, 'reason': f'驗證錯誤: {str(e)}'}
     
     @staticmethod
+    def use_coupon_statement(coupon_code, record_id, used_at):
+        """(query, params) marking an unused coupon as used, for use inside a payment transaction"""
+        query = """
+            UPDATE DISCOUNT 
+            SET UsedTime = %s, RecordID = %s
+            WHERE Code = %s AND UsedTime IS NULL
+        """
+        return query, (used_at, record_id, coupon_code)
+    
+    @staticmethod
+    @traced
     def use_coupon(coupon_code, record_id):
         """
         Mark a coupon as used
@@ -134,16 +150,10 @@ class CouponService:
             bool: Success status
         """
         try:
-            current_time = datetime.now()
-            
             # Update coupon as used
-            query = """
-                UPDATE DISCOUNT 
-                SET UsedTime = %s, RecordID = %s
-                WHERE Code = %s AND UsedTime IS NULL
-            """
+            query, params = CouponService.use_coupon_statement(coupon_code, record_id, datetime.now())
             
-            affected_rows = db_connector.execute_query(query, (current_time, record_id, coupon_code), fetch=False)
+            affected_rows = db_connector.execute_query(query, params, fetch=False)
             
             if affected_rows > 0:
                 return True
@@ -154,6 +164,7 @@ class CouponService:
             raise Exception(f"Coupon usage error: {str(e)}")
     
     @staticmethod
+    @traced
     def get_coupon_history(parking_lot_id=None, days=30):
         """
         Get coupon generation and usage history
@@ -190,6 +201,7 @@ class CouponService:
             raise Exception(f"Coupon history error: {str(e)}")
     
     @staticmethod
+    @traced
     def cleanup_expired_coupons():
         """
         Clean up expired and old used coupons (for scheduled tasks)
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from ..utils.metrics import registry
+
+FEE_CACHE_LOOKUPS = registry.counter(
+    'fee_cache_lookups_total', 'Fee cache lookups by result', ('result',))
+
+
+class FeeCache:
+    """
+    Per-record cache of fee calculations, valid until the fee next changes
+
+    Fees are a step function of time (free period end, hourly ceilings,
+    daily cap), so a calculation stays exact until its next_change_at.
+    Entries additionally expire after max_age_seconds so records changed
+    by another worker are picked up, and are keyed on the record's
+    PaidUntilTime so a caller holding a fresher row never gets a stale fee.
+    """
+
+    def __init__(self, max_age_seconds=3600, max_entries=50000):
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()    # RecordID -> (PaidUntilTime, valid_until, fee_info)
+        self._lock = threading.Lock()
+
+    def get(self, record_id, current_time=None, paid_until=...):
+        """
+        Cached fee_info for record_id, or None when missing or no longer valid
+
+        Pass paid_until (the record's current PaidUntilTime, possibly None)
+        to reject an entry computed for a different payment state.
+        """
+        if current_time is None:
+            current_time = datetime.now()
+        with self._lock:
+            entry = self._entries.get(record_id)
+            if entry is None:
+                FEE_CACHE_LOOKUPS.inc(result='miss')
+                return None
+            cached_paid_until, valid_until, fee_info = entry
+            if current_time >= valid_until or (paid_until is not ... and paid_until != cached_paid_until):
+                del self._entries[record_id]
+                FEE_CACHE_LOOKUPS.inc(result='stale')
+                return None
+            self._entries.move_to_end(record_id)
+        FEE_CACHE_LOOKUPS.inc(result='hit')
+        return fee_info
+
+    def put(self, fee_info):
+        record = fee_info['record']
+        valid_until = min(
+            fee_info['next_change_at'],
+            fee_info['current_time'] + timedelta(seconds=self.max_age_seconds)
+        )
+        if valid_until <= fee_info['current_time']:
+            return
+        with self._lock:
+            self._entries[record['RecordID']] = (record['PaidUntilTime'], valid_until, fee_info)
+            self._entries.move_to_end(record['RecordID'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, record_id):
+        with self._lock:
+            self._entries.pop(record_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Global fee cache
+fee_cache = FeeCache()
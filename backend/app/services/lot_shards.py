@@ -0,0 +1,40 @@
+from ..utils.db_connector import db_connector
+
+# Each shard keeps copies of its own lots' PARKING_LOT rows, which its foreign
+# keys and the gate / kiosk joins need; the primary stays the source of truth.
+_COLUMNS = ('ParkingLotID', 'Name', 'Address', 'TotalSpaces', 'HourlyRate', 'DailyMaxRate', 'CreatedAt', 'UpdatedAt')
+
+_MERGE_LOT = f"""
+    SET IDENTITY_INSERT PARKING_LOT ON;
+    MERGE PARKING_LOT AS t
+    USING (SELECT {', '.join(f'%s AS {column}' for column in _COLUMNS)}) AS s
+        ON t.ParkingLotID = s.ParkingLotID
+    WHEN MATCHED THEN UPDATE SET Name = s.Name, Address = s.Address, TotalSpaces = s.TotalSpaces,
+        HourlyRate = s.HourlyRate, DailyMaxRate = s.DailyMaxRate, UpdatedAt = s.UpdatedAt
+    WHEN NOT MATCHED THEN INSERT ({', '.join(_COLUMNS)})
+        VALUES ({', '.join(f's.{column}' for column in _COLUMNS)});
+    SET IDENTITY_INSERT PARKING_LOT OFF;
+"""
+
+
+def sync_lots(lot_ids=None):
+    """Copy PARKING_LOT rows (default: every lot) from the primary to their shards; returns {shard: lots copied}"""
+    if not db_connector.sharded:
+        return {}
+    with db_connector.primary():
+        lots = db_connector.execute_query(f"SELECT {', '.join(_COLUMNS)} FROM PARKING_LOT")
+
+    by_shard = {}
+    for lot in lots:
+        if lot_ids is not None and lot['ParkingLotID'] not in lot_ids:
+            continue
+        shard = db_connector.shard_for(lot['ParkingLotID'])
+        if shard is not None:
+            by_shard.setdefault(shard, []).append(lot)
+
+    for shard_lots in by_shard.values():
+        with db_connector.lot_shard(shard_lots[0]['ParkingLotID']):
+            db_connector.execute_transaction([
+                (_MERGE_LOT, tuple(lot[column] for column in _COLUMNS)) for lot in shard_lots
+            ])
+    return {shard: len(shard_lots) for shard, shard_lots in by_shard.items()}
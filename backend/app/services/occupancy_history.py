@@ -0,0 +1,314 @@
+import base64
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime
+from .plate_index import plate_index
+from .tariff_cache import tariff_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared owner, every process samples for itself
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Peak value marking a slot with no sample (the array is unsigned 16-bit)
+_MISSING = 0xFFFF
+
+# name -> (seconds per slot, slots kept): two days of minutes, five weeks of
+# quarter hours and roughly thirteen months of hours, about 125 KB per lot
+TIERS = {
+    'minute': (60, 2 * 24 * 60),
+    '15min': (15 * 60, 35 * 24 * 4),
+    'hour': (60 * 60, 400 * 24)
+}
+
+
+class _Ring:
+    """Fixed-size ring of (average, peak) occupancy per time slot, indexed by absolute slot number"""
+
+    __slots__ = ('capacity', 'head', 'avg', 'peak')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.head = None                          # newest slot written
+        self.avg = array('f', [math.nan]) * capacity
+        self.peak = array('H', [_MISSING]) * capacity
+
+    def write(self, slot, avg, peak):
+        if self.head is None:
+            self.head = slot
+        elif slot > self.head:
+            # Slots skipped while nothing was sampled (e.g. the process was down) are gaps
+            for missing in range(max(self.head + 1, slot - self.capacity + 1), slot):
+                self.avg[missing % self.capacity] = math.nan
+                self.peak[missing % self.capacity] = _MISSING
+            self.head = slot
+        elif slot <= self.head - self.capacity:
+            return
+        self.avg[slot % self.capacity] = avg
+        self.peak[slot % self.capacity] = min(peak, _MISSING - 1)
+
+    def oldest(self):
+        return None if self.head is None else self.head - self.capacity + 1
+
+    def read(self, first, last):
+        """(slot, average, peak) for every sampled slot in [first, last]"""
+        if self.head is None:
+            return []
+        first = max(first, self.oldest())
+        last = min(last, self.head)
+        points = []
+        for slot in range(first, last + 1):
+            peak = self.peak[slot % self.capacity]
+            if peak != _MISSING:
+                points.append((slot, self.avg[slot % self.capacity], peak))
+        return points
+
+    def dump(self):
+        return {
+            'head': self.head,
+            'avg': base64.b64encode(self.avg.tobytes()).decode('ascii'),
+            'peak': base64.b64encode(self.peak.tobytes()).decode('ascii')
+        }
+
+    def load(self, data):
+        avg = array('f')
+        avg.frombytes(base64.b64decode(data['avg']))
+        peak = array('H')
+        peak.frombytes(base64.b64decode(data['peak']))
+        if len(avg) != self.capacity or len(peak) != self.capacity:
+            raise ValueError('ring size does not match the configured tier')
+        self.head, self.avg, self.peak = data['head'], avg, peak
+
+
+class _LotSeries:
+    """Occupancy rings of one lot; coarser tiers are running aggregates of the minute samples"""
+
+    def __init__(self):
+        self.rings = {name: _Ring(capacity) for name, (_, capacity) in TIERS.items()}
+        self._buckets = {}     # tier -> [slot, sum, count, peak] of the slot being filled
+
+    def sample(self, timestamp, occupied):
+        for name, (step, _) in TIERS.items():
+            slot = int(timestamp // step)
+            if name == 'minute':
+                self.rings[name].write(slot, occupied, occupied)
+                continue
+            bucket = self._buckets.get(name)
+            if bucket is None or bucket[0] != slot:
+                bucket = self._buckets[name] = [slot, 0, 0, 0]
+            bucket[1] += occupied
+            bucket[2] += 1
+            bucket[3] = max(bucket[3], occupied)
+            # The slot being filled is rewritten every minute so it is readable before it completes
+            self.rings[name].write(slot, bucket[1] / bucket[2], bucket[3])
+
+    def restore_buckets(self):
+        """Rebuild the partial 15-minute / hourly slots from the minute ring after a load"""
+        self._buckets = {}
+        minute_step, _ = TIERS['minute']
+        for name, (step, _) in TIERS.items():
+            head = self.rings[name].head
+            if name == 'minute' or head is None:
+                continue
+            first = head * step // minute_step
+            points = self.rings['minute'].read(first, first + step // minute_step - 1)
+            if points:
+                self._buckets[name] = [head, sum(avg for _, avg, _ in points), len(points),
+                                       max(peak for _, _, peak in points)]
+
+
+class OccupancyHistory:
+    """
+    Per-lot occupancy time series kept in memory
+
+    A background sampler records every lot's live occupancy (from the plate
+    index) once a minute and folds it into 15-minute and hourly tiers, so
+    history charts never replay PARKING_RECORD. The rings are written to
+    a file periodically and reloaded on start.
+
+    Workers share the file: the one holding an flock on {path}.lock samples
+    and saves, the others reload the file whenever it changes (so their
+    history lags by up to persist_seconds) and take over if the owner exits.
+    """
+
+    def __init__(self, sample_seconds=60, persist_seconds=300, path=None):
+        self.sample_seconds = sample_seconds
+        self.persist_seconds = persist_seconds
+        self.path = path
+        self._lots = {}
+        self._lock = threading.Lock()
+        self._persisted_at = time.monotonic()
+        self._owner_file = None
+        self._loaded_mtime = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def sample(self, timestamp=None):
+        """Record the current occupancy of every known lot; returns False while the plate index is cold"""
+        if not plate_index.is_warm:
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        occupancy = plate_index.occupancy()
+        # Lots with no parked vehicle are absent from the plate index but still occupied by zero
+        if tariff_cache.is_warm:
+            for lot in tariff_cache.all():
+                occupancy.setdefault(lot['ParkingLotID'], 0)
+        with self._lock:
+            for lot_id, occupied in occupancy.items():
+                series = self._lots.get(lot_id)
+                if series is None:
+                    series = self._lots[lot_id] = _LotSeries()
+                series.sample(timestamp, occupied)
+        return True
+
+    def lot_ids(self):
+        with self._lock:
+            return sorted(self._lots)
+
+    def history(self, lot_id, start, end, resolution=None, max_points=1500):
+        """
+        Occupancy of lot_id between two epoch timestamps
+
+        Without an explicit resolution the finest tier that still holds
+        start and returns at most max_points slots is used.
+        """
+        if resolution is None:
+            resolution = self.pick_resolution(lot_id, start, end, max_points)
+        step, _ = TIERS[resolution]
+        with self._lock:
+            series = self._lots.get(lot_id)
+            points = series.rings[resolution].read(int(start // step), int(end // step)) if series else []
+        return {
+            'resolution': resolution,
+            'resolutionSeconds': step,
+            'points': [
+                {'time': datetime.fromtimestamp(slot * step), 'avg': round(avg, 2), 'peak': peak}
+                for slot, avg, peak in points
+            ]
+        }
+
+    def pick_resolution(self, lot_id, start, end, max_points=1500):
+        with self._lock:
+            series = self._lots.get(lot_id)
+            for name, (step, _) in TIERS.items():
+                oldest = series.rings[name].oldest() if series else None
+                covers = oldest is not None and oldest * step <= start
+                if covers and (end - start) / step <= max_points:
+                    return name
+        return 'hour'
+
+    def start(self, app):
+        from ..utils.health import health_monitor
+
+        if self._thread is not None and self._thread.is_alive():
+            return
+        health_monitor.register_worker('occupancy-sampler', max(3 * self.sample_seconds, 15))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='occupancy-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def is_owner(self):
+        """Whether this process samples and saves; claims ownership when the lock is free"""
+        if self._owner_file is not None or not self.path or fcntl is None:
+            return True
+        handle = open(f'{self.path}.lock', 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._owner_file = handle
+        # Start from what the previous owner saved last
+        self.load()
+        return True
+
+    def _run(self, app):
+        from ..utils.health import health_monitor
+
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    if self.is_owner():
+                        self.sample()
+                        if time.monotonic() - self._persisted_at >= self.persist_seconds:
+                            self.save()
+                    else:
+                        self.load(if_changed=True)
+                except Exception as e:
+                    logger.warning("Occupancy sampling failed: %s", e)
+            health_monitor.heartbeat('occupancy-sampler')
+            # Sample on minute boundaries so every worker fills the same slots
+            self._stop.wait(self.sample_seconds - time.time() % self.sample_seconds)
+
+    def save(self):
+        """Write all rings to the history file atomically"""
+        self._persisted_at = time.monotonic()
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                'version': 1,
+                'savedAt': time.time(),
+                'lots': {str(lot_id): {name: ring.dump() for name, ring in series.rings.items()}
+                         for lot_id, series in self._lots.items()}
+            }
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=f'{name}.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load(self, if_changed=False):
+        """Restore the rings saved by a previous run (or the owning worker), if any"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if if_changed and mtime == self._loaded_mtime:
+                return
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            lots = {}
+            for lot_id, rings in data.get('lots', {}).items():
+                series = _LotSeries()
+                for name, ring in rings.items():
+                    if name in series.rings:
+                        series.rings[name].load(ring)
+                series.restore_buckets()
+                lots[int(lot_id)] = series
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable occupancy history %s: %s", self.path, e)
+            return
+        with self._lock:
+            self._lots = lots
+        self._loaded_mtime = mtime
+
+
+# Global occupancy history
+occupancy_history = OccupancyHistory()
+
+
+def init_app(app):
+    """Restore persisted history and start the minute sampler"""
+    occupancy_history.sample_seconds = app.config.get('OCCUPANCY_SAMPLE_SECONDS', 60)
+    occupancy_history.persist_seconds = app.config.get('OCCUPANCY_PERSIST_SECONDS', 300)
+    occupancy_history.path = app.config.get('OCCUPANCY_HISTORY_FILE')
+    occupancy_history.load()
+
+    if app.config.get('OCCUPANCY_HISTORY_ENABLED', True):
+        occupancy_history.start(app)
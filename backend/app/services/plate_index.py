@@ -0,0 +1,242 @@
+import bisect
+import threading
+import time
+from ..utils.db_connector import db_connector
+
+# Characters license plate recognition commonly confuses, folded to one representative
+_CONFUSABLE = str.maketrans({
+    'O': '0', 'D': '0', 'Q': '0',
+    'I': '1', 'L': '1',
+    'Z': '2',
+    'S': '5',
+    'G': '6',
+    'B': '8'
+})
+
+
+def normalize_plate(plate):
+    """Uppercase, drop separators and fold confusable characters (8/B, 0/O, ...)"""
+    return ''.join(ch for ch in plate.upper() if ch.isalnum()).translate(_CONFUSABLE)
+
+
+def _bigrams(key):
+    padded = f'^{key}$'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance, giving up early once every path exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class _LotPlates:
+    """Active plates of one parking lot: bigram postings plus a sorted key list for prefixes"""
+
+    def __init__(self):
+        self.records = {}        # RecordID -> (VehicleNumber, normalized key)
+        self.grams = {}          # bigram -> set of RecordIDs
+        self.sorted_keys = []    # sorted (key, RecordID) for prefix search
+
+    def add(self, record_id, plate):
+        if record_id in self.records:
+            self.remove(record_id)
+        key = normalize_plate(plate)
+        self.records[record_id] = (plate, key)
+        for gram in _bigrams(key):
+            self.grams.setdefault(gram, set()).add(record_id)
+        bisect.insort(self.sorted_keys, (key, record_id))
+
+    def remove(self, record_id):
+        entry = self.records.pop(record_id, None)
+        if entry is None:
+            return
+        key = entry[1]
+        for gram in _bigrams(key):
+            postings = self.grams.get(gram)
+            if postings:
+                postings.discard(record_id)
+                if not postings:
+                    del self.grams[gram]
+        index = bisect.bisect_left(self.sorted_keys, (key, record_id))
+        if index < len(self.sorted_keys) and self.sorted_keys[index] == (key, record_id):
+            del self.sorted_keys[index]
+
+
+class PlateSearchIndex:
+    """
+    In-memory fuzzy / prefix search over vehicles currently parked, per lot
+
+    Loaded from PARKING_RECORD on first use and refreshed periodically so
+    changes made by other workers are picked up; gate entry/exit and admin
+    overrides keep it current in between.
+    """
+
+    def __init__(self, refresh_seconds=300):
+        self.refresh_seconds = refresh_seconds
+        self._lots = {}
+        self._record_lots = {}
+        self._loaded_at = None
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def is_warm(self):
+        return self._loaded_at is not None
+
+    def ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at <= self.refresh_seconds:
+            return
+        # A cold index blocks until loaded; a stale one is refreshed by one caller while others read it
+        if not self._reload_lock.acquire(blocking=loaded_at is None):
+            return
+        try:
+            if self._loaded_at == loaded_at:
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self):
+        """Rebuild the index from the active parking records of every shard"""
+        query = """
+            SELECT RecordID, ParkingLotID, VehicleNumber
+            FROM PARKING_RECORD
+            WHERE ExitTime IS NULL
+        """
+        rows, failed = db_connector.fan_out(query)
+        if failed:
+            # A partial index would hide parked vehicles until the next refresh
+            raise RuntimeError(f"Plate index reload incomplete: {failed}")
+
+        lots = {}
+        record_lots = {}
+        for row in rows:
+            lots.setdefault(row['ParkingLotID'], _LotPlates()).add(row['RecordID'], row['VehicleNumber'])
+            record_lots[row['RecordID']] = row['ParkingLotID']
+
+        with self._lock:
+            self._lots = lots
+            self._record_lots = record_lots
+            self._loaded_at = time.monotonic()
+
+    def add(self, lot_id, record_id, plate):
+        with self._lock:
+            if not self.is_warm:
+                return
+            self._lots.setdefault(lot_id, _LotPlates()).add(record_id, plate)
+            self._record_lots[record_id] = lot_id
+
+    def remove(self, record_id):
+        with self._lock:
+            lot_id = self._record_lots.pop(record_id, None)
+            if lot_id is not None:
+                self._lots[lot_id].remove(record_id)
+
+    def lot_of(self, record_id):
+        """Lot of an active record, or None if the index does not know it"""
+        with self._lock:
+            return self._record_lots.get(record_id)
+
+    def lots_of_plate(self, plate):
+        """Lots with an active record of exactly this plate (as the database compares it)"""
+        key = normalize_plate(plate)
+        if not key:
+            return set()
+        self.ensure_loaded()
+        typed = plate.strip().upper()
+        lots = set()
+
+        with self._lock:
+            for current_lot_id, lot in self._lots.items():
+                index = bisect.bisect_left(lot.sorted_keys, (key,))
+                while index < len(lot.sorted_keys) and lot.sorted_keys[index][0] == key:
+                    if lot.records[lot.sorted_keys[index][1]][0].upper() == typed:
+                        lots.add(current_lot_id)
+                        break
+                    index += 1
+        return lots
+
+    def occupancy(self):
+        """Number of active records per lot"""
+        with self._lock:
+            return {lot_id: len(lot.records) for lot_id, lot in self._lots.items()}
+
+    def _selected_lots(self, lot_id):
+        if lot_id is None:
+            return list(self._lots.items())
+        return [(lot_id, self._lots[lot_id])] if lot_id in self._lots else []
+
+    def search(self, query, lot_id=None, limit=5, max_distance=2):
+        """
+        Ranked candidates for a possibly misread plate
+
+        Candidates are pre-filtered on shared bigrams with the normalized
+        query and then ranked by edit distance (at most max_distance);
+        confusable characters already compare equal after normalization.
+        """
+        key = normalize_plate(query)
+        if not key:
+            return []
+        self.ensure_loaded()
+        grams = _bigrams(key)
+        # Each edit destroys at most two bigrams, so anything sharing fewer cannot be within range
+        min_shared = max(1, len(grams) - 2 * max_distance)
+        candidates = []
+
+        with self._lock:
+            for current_lot_id, lot in self._selected_lots(lot_id):
+                overlap = {}
+                for gram in grams:
+                    for record_id in lot.grams.get(gram, ()):
+                        overlap[record_id] = overlap.get(record_id, 0) + 1
+                for record_id, shared in overlap.items():
+                    if shared < min_shared:
+                        continue
+                    plate, candidate_key = lot.records[record_id]
+                    distance = _edit_distance(key, candidate_key, max_distance)
+                    if distance <= max_distance:
+                        candidates.append((distance, -shared, plate, record_id, current_lot_id))
+
+        candidates.sort()
+        return [
+            {'recordId': record_id, 'licensePlate': plate, 'lotId': current_lot_id, 'distance': distance}
+            for distance, _, plate, record_id, current_lot_id in candidates[:limit]
+        ]
+
+    def prefix(self, query, lot_id=None, limit=10):
+        """Plates whose normalized form starts with the normalized query (autocomplete)"""
+        key = normalize_plate(query)
+        if not key:
+            return []
+        self.ensure_loaded()
+        matches = []
+
+        with self._lock:
+            for current_lot_id, lot in self._selected_lots(lot_id):
+                index = bisect.bisect_left(lot.sorted_keys, (key,))
+                while index < len(lot.sorted_keys) and lot.sorted_keys[index][0].startswith(key):
+                    record_id = lot.sorted_keys[index][1]
+                    matches.append((lot.records[record_id][0], record_id, current_lot_id))
+                    index += 1
+                    if len(matches) >= limit * 4:
+                        break
+
+        matches.sort()
+        return [
+            {'recordId': record_id, 'licensePlate': plate, 'lotId': current_lot_id, 'distance': 0}
+            for plate, record_id, current_lot_id in matches[:limit]
+        ]
+
+
+# Global plate search index
+plate_index = PlateSearchIndex()
@@ -0,0 +1,100 @@
+import secrets
+import threading
+from datetime import datetime, timedelta
+from .billing_service import BillingService
+from .coupon_service import CouponService
+
+
+class KioskQuote:
+    """Fee snapshot for one kiosk session: record, tariff, fee breakdown and validated coupons"""
+
+    __slots__ = ('token', 'record_id', 'fee_info', 'coupon_codes', 'discount_info', 'expires_at')
+
+    def __init__(self, token, fee_info, expires_at):
+        self.token = token
+        self.record_id = fee_info['record']['RecordID']
+        self.fee_info = fee_info
+        self.coupon_codes = []
+        self.discount_info = BillingService.calculate_coupon_discount(fee_info, [])
+        self.expires_at = expires_at
+
+    @property
+    def expired(self):
+        return datetime.now() > self.expires_at
+
+
+class QuoteService:
+    """
+    Short-lived server-side quotes for the kiosk status -> fee -> discount -> pay flow
+
+    /kiosk/fee returns a quote token; apply-discount and pay reuse the
+    quoted record and fee instead of re-reading and recomputing them. An
+    unknown or expired token (e.g. issued by another worker) simply falls
+    back to the full recomputation.
+    """
+
+    def __init__(self, ttl_seconds=120, max_quotes=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_quotes = max_quotes
+        self._quotes = {}
+        self._lock = threading.Lock()
+
+    def create(self, fee_info):
+        """Store a quote for a freshly computed fee"""
+        token = secrets.token_urlsafe(16)
+        # Never quote past the instant the fee itself changes
+        expires_at = datetime.now() + timedelta(seconds=self.ttl_seconds)
+        if fee_info.get('next_change_at'):
+            expires_at = min(expires_at, fee_info['next_change_at'])
+        quote = KioskQuote(token, fee_info, expires_at)
+        with self._lock:
+            if len(self._quotes) >= self.max_quotes:
+                self._purge_expired()
+            self._quotes[token] = quote
+        return quote
+
+    def get(self, token, record_id=None):
+        """Live quote for token (and record), or None if unknown, expired or for another record"""
+        if not token:
+            return None
+        with self._lock:
+            quote = self._quotes.get(token)
+            if quote is None:
+                return None
+            if quote.expired:
+                del self._quotes[token]
+                return None
+        if record_id is not None and quote.record_id != record_id:
+            return None
+        return quote
+
+    def set_coupons(self, quote, coupon_codes):
+        """
+        Apply a set of coupons to a quote, validating only codes not already on it
+
+        Raises ValueError for an invalid coupon; the quote is unchanged then.
+        """
+        coupon_codes = list(dict.fromkeys(coupon_codes))
+        for code in coupon_codes:
+            if code in quote.coupon_codes:
+                continue
+            validation = CouponService.validate_coupon(code, quote.record_id, record=quote.fee_info['record'])
+            if not validation['valid']:
+                raise ValueError(validation['reason'])
+
+        quote.coupon_codes = coupon_codes
+        quote.discount_info = BillingService.calculate_coupon_discount(quote.fee_info, coupon_codes)
+        return quote.discount_info
+
+    def discard(self, token):
+        with self._lock:
+            self._quotes.pop(token, None)
+
+    def _purge_expired(self):
+        now = datetime.now()
+        for token in [t for t, q in self._quotes.items() if now > q.expires_at]:
+            del self._quotes[token]
+
+
+# Global kiosk quote store
+quote_service = QuoteService()
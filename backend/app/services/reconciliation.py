@@ -0,0 +1,270 @@
+import logging
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from ..utils.db_connector import db_connector
+
+logger = logging.getLogger(__name__)
+
+# DATEDIFF(DAY, 0, x) counts days since SQL Server's zero date
+_DAY_ZERO = datetime(1900, 1, 1)
+
+# Rows per keyset page when scanning for new records / payments
+CHUNK_SIZE = 5000
+
+# IDENTITY values are handed out at insert but become visible at commit, so a row can
+# appear below a high-water mark that was already stored; every incremental run rescans
+# this many IDs under each mark (their groups are simply reconciled again)
+RESCAN_IDS = 1000
+
+# Entry dates reconciled per query pair, so each batch is an index seek on (ParkingLotID, EntryTime)
+BATCH_DAYS = 7
+
+# SQL Server allows 2100 parameters per statement; discrepancy rows have 7
+_INSERT_ROWS = 250
+
+_NEW_RECORDS_QUERY = """
+    SELECT TOP (%s) RecordID, ParkingLotID, DATEDIFF(DAY, 0, EntryTime) AS EntryDay
+    FROM PARKING_RECORD
+    WHERE RecordID > %s
+    ORDER BY RecordID
+"""
+
+_NEW_PAYMENTS_QUERY = """
+    SELECT TOP (%s) p.PaymentID, pr.ParkingLotID, DATEDIFF(DAY, 0, pr.EntryTime) AS EntryDay
+    FROM PAYMENT_RECORD p
+    JOIN PARKING_RECORD pr ON p.RecordID = pr.RecordID
+    WHERE p.PaymentID > %s
+    ORDER BY p.PaymentID
+"""
+
+_BATCH_RECORDS_QUERY = """
+    SELECT RecordID, DATEDIFF(DAY, 0, EntryTime) AS EntryDay, TotalFee
+    FROM PARKING_RECORD
+    WHERE ParkingLotID = %s AND EntryTime >= %s AND EntryTime < %s
+"""
+
+_BATCH_PAYMENTS_QUERY = """
+    SELECT p.RecordID, p.PaymentAmount
+    FROM PAYMENT_RECORD p
+    JOIN PARKING_RECORD pr ON p.RecordID = pr.RecordID
+    WHERE pr.ParkingLotID = %s AND pr.EntryTime >= %s AND pr.EntryTime < %s
+"""
+
+_MERGE_DAY = """
+    MERGE RECONCILIATION_DAY AS t
+    USING (SELECT %s AS ParkingLotID, %s AS EntryDate) AS s
+        ON t.ParkingLotID = s.ParkingLotID AND t.EntryDate = s.EntryDate
+    WHEN MATCHED THEN UPDATE SET Records = %s, FeeTotal = %s, PaidTotal = %s,
+        Discrepancies = %s, Checksum = %s, CheckedAt = %s
+    WHEN NOT MATCHED THEN INSERT (ParkingLotID, EntryDate, Records, FeeTotal, PaidTotal, Discrepancies, Checksum, CheckedAt)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+_MERGE_STATE = """
+    MERGE RECONCILIATION_STATE AS t
+    USING (SELECT 1 AS StateID) AS s ON t.StateID = s.StateID
+    WHEN MATCHED THEN UPDATE SET LastRecordID = %s, LastPaymentID = %s, RunAt = %s
+    WHEN NOT MATCHED THEN INSERT (StateID, LastRecordID, LastPaymentID, RunAt) VALUES (1, %s, %s, %s);
+"""
+
+# Odd 64-bit multipliers mixing RecordID, TotalFee and the paid total into one row hash
+_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+
+def _day(day_number):
+    return _DAY_ZERO + timedelta(days=int(day_number))
+
+
+def _row_hashes(record_ids, fees, paid):
+    """Per-record 64-bit hashes; XOR-ing them gives an order-independent checksum"""
+    with np.errstate(over='ignore'):
+        return ((record_ids.astype(np.uint64) * _MIX[0])
+                ^ ((fees.astype(np.int64) + 1).astype(np.uint64) * _MIX[1])
+                ^ (paid.astype(np.uint64) * _MIX[2]))
+
+
+def compare_batch(records, payments):
+    """
+    Join a batch of PARKING_RECORD rows with their PAYMENT_RECORD rows and compare
+
+    Payments are grouped onto their records with searchsorted/bincount
+    rather than a per-row dict. Returns per-day aggregates and the
+    records whose TotalFee differs from the sum of their payments
+    (unpaid records, NULL TotalFee and no payments, are consistent).
+    """
+    count = len(records)
+    if not count:
+        return [], []
+    record_ids = np.fromiter((row['RecordID'] for row in records), dtype=np.int64, count=count)
+    days = np.fromiter((row['EntryDay'] for row in records), dtype=np.int64, count=count)
+    fee_missing = np.fromiter((row['TotalFee'] is None for row in records), dtype=bool, count=count)
+    fees = np.fromiter((row['TotalFee'] or 0 for row in records), dtype=np.int64, count=count)
+
+    order = np.argsort(record_ids)
+    record_ids, days, fee_missing, fees = record_ids[order], days[order], fee_missing[order], fees[order]
+
+    payment_records = np.fromiter((row['RecordID'] for row in payments), dtype=np.int64, count=len(payments))
+    amounts = np.fromiter((row['PaymentAmount'] for row in payments), dtype=np.int64, count=len(payments))
+    positions = np.searchsorted(record_ids, payment_records)
+    known = positions < count
+    known[known] = record_ids[positions[known]] == payment_records[known]
+    paid = np.bincount(positions[known], weights=amounts[known], minlength=count).astype(np.int64)
+    payment_counts = np.bincount(positions[known], minlength=count)
+
+    mismatched = np.where(fee_missing, paid != 0, fees != paid)
+    hashes = _row_hashes(record_ids, np.where(fee_missing, -1, fees), paid)
+
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    groups = len(unique_days)
+    by_day = np.argsort(day_index, kind='stable')
+    checksums = np.bitwise_xor.reduceat(hashes[by_day], np.searchsorted(day_index[by_day], np.arange(groups)))
+    record_counts = np.bincount(day_index, minlength=groups)
+    fee_totals = np.bincount(day_index, weights=fees, minlength=groups)
+    paid_totals = np.bincount(day_index, weights=paid, minlength=groups)
+    mismatch_counts = np.bincount(day_index, weights=mismatched, minlength=groups)
+    summaries = [
+        {
+            'day': int(unique_days[i]),
+            'records': int(record_counts[i]),
+            'feeTotal': int(fee_totals[i]),
+            'paidTotal': int(paid_totals[i]),
+            'discrepancies': int(mismatch_counts[i]),
+            # Stored in a signed BIGINT column
+            'checksum': int(checksums[i].view(np.int64))
+        }
+        for i in range(groups)
+    ]
+
+    discrepancies = [
+        {
+            'recordId': int(record_ids[i]),
+            'day': int(days[i]),
+            'totalFee': None if fee_missing[i] else int(fees[i]),
+            'paidTotal': int(paid[i]),
+            'payments': int(payment_counts[i])
+        }
+        for i in np.flatnonzero(mismatched)
+    ]
+    return summaries, discrepancies
+
+
+class PaymentReconciler:
+    """
+    Incremental reconciliation of PARKING_RECORD.TotalFee against PAYMENT_RECORD
+
+    A run pages through records and payments above the stored high-water
+    marks (less RESCAN_IDS, for rows that committed late) to find the (lot, entry date) groups they belong to, then
+    re-reconciles only those groups in BATCH_DAYS batches and replaces
+    their stored summaries and discrepancies. full=True starts from zero.
+    """
+
+    def run(self, full=False):
+        if db_connector.sharded:
+            # Records and payments of sharded lots are not on the primary; a run would
+            # report them as reconciled by leaving them out
+            raise RuntimeError('Payment reconciliation does not support DB_SHARDS yet')
+        started = time.perf_counter()
+        run_at = datetime.now()
+        last_record_id, last_payment_id = (0, 0) if full else self.high_water_marks()
+
+        groups, max_record_id = self._scan(_NEW_RECORDS_QUERY, 'RecordID', max(0, last_record_id - RESCAN_IDS))
+        payment_groups, max_payment_id = self._scan(
+            _NEW_PAYMENTS_QUERY, 'PaymentID', max(0, last_payment_id - RESCAN_IDS))
+        groups |= payment_groups
+        max_record_id = max(max_record_id, last_record_id)
+        max_payment_id = max(max_payment_id, last_payment_id)
+
+        days_by_lot = {}
+        for lot_id, day in groups:
+            days_by_lot.setdefault(lot_id, []).append(day)
+
+        totals = {'groups': 0, 'records': 0, 'discrepancies': 0}
+        for lot_id, days in sorted(days_by_lot.items()):
+            for first_day, last_day in _day_runs(sorted(days)):
+                summaries, discrepancies = self._reconcile_batch(lot_id, first_day, last_day, run_at)
+                totals['groups'] += len(summaries)
+                totals['records'] += sum(summary['records'] for summary in summaries)
+                totals['discrepancies'] += len(discrepancies)
+
+        db_connector.execute_query(_MERGE_STATE, (max_record_id, max_payment_id, run_at,
+                                                  max_record_id, max_payment_id, run_at), fetch=False)
+        result = {
+            'full': full,
+            'runAt': run_at,
+            'lastRecordId': max_record_id,
+            'lastPaymentId': max_payment_id,
+            'durationMs': round((time.perf_counter() - started) * 1000, 1),
+            **totals
+        }
+        logger.info("Payment reconciliation: %s", result)
+        return result
+
+    @staticmethod
+    def high_water_marks():
+        rows = db_connector.execute_query(
+            "SELECT LastRecordID, LastPaymentID FROM RECONCILIATION_STATE WHERE StateID = 1")
+        return (rows[0]['LastRecordID'], rows[0]['LastPaymentID']) if rows else (0, 0)
+
+    @staticmethod
+    def _scan(query, id_column, after):
+        """(lot, entry day) groups of all rows with id_column above after, and the highest id seen"""
+        groups = set()
+        while True:
+            rows = db_connector.execute_query(query, (CHUNK_SIZE, after))
+            if not rows:
+                return groups, after
+            lots = np.fromiter((row['ParkingLotID'] for row in rows), dtype=np.int64, count=len(rows))
+            days = np.fromiter((row['EntryDay'] for row in rows), dtype=np.int64, count=len(rows))
+            keys = np.unique(lots << 32 | days)
+            groups.update((int(key >> 32), int(key & 0xFFFFFFFF)) for key in keys)
+            after = rows[-1][id_column]
+            if len(rows) < CHUNK_SIZE:
+                return groups, after
+
+    @staticmethod
+    def _reconcile_batch(lot_id, first_day, last_day, run_at):
+        start, end = _day(first_day), _day(last_day + 1)
+        records = db_connector.execute_query(_BATCH_RECORDS_QUERY, (lot_id, start, end))
+        payments = db_connector.execute_query(_BATCH_PAYMENTS_QUERY, (lot_id, start, end))
+        summaries, discrepancies = compare_batch(records, payments)
+
+        statements = [(
+            "DELETE FROM RECONCILIATION_DISCREPANCY WHERE ParkingLotID = %s AND EntryDate >= %s AND EntryDate < %s",
+            (lot_id, start.date(), end.date())
+        )]
+        for summary in summaries:
+            entry_date = _day(summary['day']).date()
+            values = (summary['records'], summary['feeTotal'], summary['paidTotal'],
+                      summary['discrepancies'], summary['checksum'], run_at)
+            statements.append((_MERGE_DAY, (lot_id, entry_date) + values + (lot_id, entry_date) + values))
+        for offset in range(0, len(discrepancies), _INSERT_ROWS):
+            chunk = discrepancies[offset:offset + _INSERT_ROWS]
+            placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+            params = []
+            for row in chunk:
+                params.extend((row['recordId'], lot_id, _day(row['day']).date(), row['totalFee'],
+                               row['paidTotal'], row['payments'], run_at))
+            statements.append((
+                "INSERT INTO RECONCILIATION_DISCREPANCY "
+                "(RecordID, ParkingLotID, EntryDate, TotalFee, PaidTotal, Payments, CheckedAt) "
+                f"VALUES {placeholders}",
+                tuple(params)
+            ))
+        db_connector.execute_transaction(statements)
+        return summaries, discrepancies
+
+
+def _day_runs(days):
+    """Split sorted day numbers into contiguous runs of at most BATCH_DAYS days"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + 1 and day - runs[-1][0] < BATCH_DAYS:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+# Global payment reconciler
+payment_reconciler = PaymentReconciler()
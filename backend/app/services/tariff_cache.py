@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from ..utils.db_connector import db_connector
+from .tariff_engine import compile_schedule
+
+logger = logging.getLogger(__name__)
+
+# SQL Server "Invalid object name": the TARIFF_RULE migration has not been applied
+_MISSING_TABLE_ERROR = 208
+
+
+class LotTariffCache:
+    """
+    In-memory copy of PARKING_LOT (name, capacity and tariff per lot)
+
+    Lots and their rates change rarely, so they are loaded once and
+    refreshed periodically; writes to PARKING_LOT or TARIFF_RULE invalidate
+    the cache. Lots with TARIFF_RULE rows also get a compiled schedule.
+    Writes made by other workers are noticed within version_check_seconds
+    by probing MAX(PARKING_LOT.UpdatedAt), which tariff updates also bump;
+    on_change callbacks run after a reload that saw a new version.
+    """
+
+    def __init__(self, refresh_seconds=300, version_check_seconds=5):
+        self.refresh_seconds = refresh_seconds
+        self.version_check_seconds = version_check_seconds
+        self._version = None
+        self._checked_at = float('-inf')
+        self._listeners = []
+        self._lots = {}
+        self._rules = {}
+        self._schedules = {}
+        self._loaded_at = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def is_warm(self):
+        return self._loaded_at is not None
+
+    def on_change(self, callback):
+        """Call callback after a reload that picked up another version of the lots or rules"""
+        self._listeners.append(callback)
+
+    def ensure_loaded(self):
+        loaded_at = self._loaded_at
+        now = time.monotonic()
+        if loaded_at is not None and now - loaded_at <= self.refresh_seconds:
+            if now - self._checked_at <= self.version_check_seconds or not self._version_changed(now):
+                return
+        # A cold cache blocks until loaded; a stale one is refreshed by one caller while others read it
+        if not self._reload_lock.acquire(blocking=loaded_at is None):
+            return
+        try:
+            if self._loaded_at == loaded_at:
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    @staticmethod
+    def _probe():
+        """Version of PARKING_LOT: a tariff or lot write anywhere bumps the newest UpdatedAt"""
+        with db_connector.primary():
+            rows = db_connector.execute_query(
+                "SELECT MAX(UpdatedAt) AS UpdatedAt, COUNT(*) AS Lots FROM PARKING_LOT")
+        return (rows[0]['UpdatedAt'], rows[0]['Lots']) if rows else None
+
+    def _version_changed(self, now):
+        self._checked_at = now
+        try:
+            return self._probe() != self._version
+        except Exception as e:
+            # Keep serving the loaded copy; the periodic refresh still bounds its age
+            logger.warning("Tariff version check failed: %s", e)
+            return False
+
+    def reload(self):
+        version = self._probe()
+        # Lots and tariff rules are global: read them from the primary even inside a lot's shard
+        with db_connector.primary():
+            query = """
+                SELECT ParkingLotID, Name, Address, TotalSpaces, HourlyRate, DailyMaxRate
+                FROM PARKING_LOT
+            """
+            rows = db_connector.execute_query(query)
+            lots = {row['ParkingLotID']: row for row in rows}
+
+            rules = {}
+            try:
+                rule_rows = db_connector.execute_query("""
+                    SELECT RuleID, ParkingLotID, DaysMask, StartMinute, EndMinute, RateType, Rate, Priority
+                    FROM TARIFF_RULE
+                """)
+            except Exception as e:
+                # Databases without the migration keep the flat HourlyRate / DailyMaxRate tariff
+                if not (e.args and e.args[0] == _MISSING_TABLE_ERROR):
+                    raise
+                logger.warning("TARIFF_RULE table missing, using flat rates: %s", e)
+                rule_rows = []
+        for row in rule_rows:
+            rules.setdefault(row['ParkingLotID'], []).append(row)
+
+        self._schedules = {
+            lot_id: compile_schedule(lots[lot_id]['HourlyRate'], lot_rules)
+            for lot_id, lot_rules in rules.items() if lot_id in lots
+        }
+        self._rules = rules
+        self._lots = lots
+        self._loaded_at = self._checked_at = time.monotonic()
+        changed = self._version is not None and version != self._version
+        self._version = version
+        if changed:
+            for callback in self._listeners:
+                callback()
+
+    def get(self, lot_id):
+        """PARKING_LOT row for lot_id, or None if there is no such lot"""
+        self.ensure_loaded()
+        return self._lots.get(lot_id)
+
+    def schedule(self, lot_id):
+        """CompiledTariff of a lot with time-of-day / weekday rules, or None for a flat tariff"""
+        self.ensure_loaded()
+        return self._schedules.get(lot_id)
+
+    def rules(self, lot_id):
+        self.ensure_loaded()
+        return list(self._rules.get(lot_id, ()))
+
+    def all(self):
+        self.ensure_loaded()
+        return list(self._lots.values())
+
+    def invalidate(self):
+        """Mark the cache stale so the next lookup reloads it (readers keep the old copy meanwhile)"""
+        if self._loaded_at is not None:
+            self._loaded_at = float('-inf')
+
+
+# Global parking lot / tariff cache
+tariff_cache = LotTariffCache()
@@ -0,0 +1,214 @@
+import bisect
+import math
+from array import array
+from datetime import datetime
+import numpy as np
+
+WEEK_SECONDS = 7 * 24 * 3600
+WEEK_MINUTES = 7 * 24 * 60
+
+# A Monday midnight; positions in the weekly schedule are measured from it (local time, like all timestamps)
+WEEK_ORIGIN = datetime(2000, 1, 3)
+
+RATE_TYPES = ('hourly', 'flat')
+
+
+def week_position(moment):
+    """Seconds since WEEK_ORIGIN (not reduced modulo a week)"""
+    return (moment - WEEK_ORIGIN).total_seconds()
+
+
+def days_from_mask(mask):
+    """DaysMask bit 0 is Monday ... bit 6 is Sunday"""
+    return [day for day in range(7) if mask & (1 << day)]
+
+
+class CompiledTariff:
+    """
+    One lot's weekly schedule compiled into cumulative price tables
+
+    Hourly segments are priced by the integral of their rate over the
+    billed interval; a flat window (e.g. a night rate) costs its amount
+    once if the interval touches it. Both are looked up with a binary
+    search over the segment boundaries, so pricing any interval costs
+    O(log segments) however long it is.
+    """
+
+    def __init__(self, bounds, rates, flats):
+        # Hourly part: segment i covers [bounds[i], bounds[i + 1]) seconds of the week at rates[i] per hour
+        self.bounds = bounds
+        self.rates = rates
+        self.cumulative = [0.0]
+        for i, rate in enumerate(rates):
+            end = bounds[i + 1] if i + 1 < len(bounds) else WEEK_SECONDS
+            self.cumulative.append(self.cumulative[-1] + rate * (end - bounds[i]) / 3600)
+        self.week_hourly = self.cumulative[-1]
+
+        # Flat part: windows (start, end, amount) sorted by start; a window may run past the week end
+        self.flats = flats
+        self.flat_starts = [start for start, _, _ in flats]
+        self.flat_cumulative = [0]
+        for _, _, amount in flats:
+            self.flat_cumulative.append(self.flat_cumulative[-1] + amount)
+        self.week_flat = self.flat_cumulative[-1]
+
+    def _hourly_until(self, position):
+        weeks, offset = divmod(position, WEEK_SECONDS)
+        i = bisect.bisect_right(self.bounds, offset) - 1
+        return weeks * self.week_hourly + self.cumulative[i] + self.rates[i] * (offset - self.bounds[i]) / 3600
+
+    def _flats_starting_before(self, position):
+        """Total of the flat windows starting strictly before position"""
+        weeks, offset = divmod(position, WEEK_SECONDS)
+        return weeks * self.week_flat + self.flat_cumulative[bisect.bisect_left(self.flat_starts, offset)]
+
+    def _flat_containing(self, position):
+        """Amount of the flat window that started before position and is still running, or 0"""
+        if not self.flats:
+            return 0
+        offset = position % WEEK_SECONDS
+        # Windows starting exactly at position are already counted as starting inside the interval
+        i = bisect.bisect_left(self.flat_starts, offset) - 1
+        if i >= 0 and offset < self.flats[i][1]:
+            return self.flats[i][2]
+        # The last window of the previous week may run into this one
+        start, end, amount = self.flats[-1]
+        return amount if offset < end - WEEK_SECONDS else 0
+
+    def price(self, start, end):
+        """Price of the interval [start, end) (datetimes)"""
+        a, b = week_position(start), week_position(end)
+        if b <= a:
+            return 0
+        total = self._hourly_until(b) - self._hourly_until(a)
+        if self.flats:
+            total += self._flats_starting_before(b) - self._flats_starting_before(a) + self._flat_containing(a)
+        # Half up; the epsilon absorbs float error in partial hours (e.g. 12.5 summed as 12.4999...)
+        return int(math.floor(total + 0.5 + 1e-6))
+
+    def price_positions(self, starts, ends):
+        """
+        Vectorized price() for arrays of week positions (seconds since the week origin)
+
+        Same tables and rounding as price(), with searchsorted in place of bisect.
+        """
+        bounds = np.asarray(self.bounds, dtype=np.float64)
+        rates = np.asarray(self.rates, dtype=np.float64)
+        cumulative = np.asarray(self.cumulative, dtype=np.float64)
+
+        def hourly_until(positions):
+            weeks, offsets = np.divmod(positions, WEEK_SECONDS)
+            i = np.searchsorted(bounds, offsets, side='right') - 1
+            return weeks * self.week_hourly + cumulative[i] + rates[i] * (offsets - bounds[i]) / 3600
+
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        total = hourly_until(ends) - hourly_until(starts)
+
+        if self.flats:
+            flat_starts = np.asarray(self.flat_starts, dtype=np.float64)
+            flat_ends = np.asarray([end for _, end, _ in self.flats], dtype=np.float64)
+            amounts = np.asarray([amount for _, _, amount in self.flats], dtype=np.float64)
+            flat_cumulative = np.asarray(self.flat_cumulative, dtype=np.float64)
+
+            def flats_starting_before(positions):
+                weeks, offsets = np.divmod(positions, WEEK_SECONDS)
+                return weeks * self.week_flat + flat_cumulative[np.searchsorted(flat_starts, offsets, side='left')]
+
+            offsets = np.mod(starts, WEEK_SECONDS)
+            i = np.searchsorted(flat_starts, offsets, side='left') - 1
+            inside = (i >= 0) & (offsets < flat_ends[np.maximum(i, 0)])
+            containing = np.where(inside, amounts[np.maximum(i, 0)], 0.0)
+            containing = np.where(~inside & (offsets < flat_ends[-1] - WEEK_SECONDS), amounts[-1], containing)
+            total += flats_starting_before(ends) - flats_starting_before(starts) + containing
+
+        return np.where(ends > starts, np.floor(total + 0.5 + 1e-6), 0).astype(np.int64)
+
+
+def compile_schedule(hourly_rate, rules):
+    """
+    Compile a lot's base HourlyRate and its TARIFF_RULE rows
+
+    Each rule applies its rate on the weekdays in DaysMask from StartMinute
+    to EndMinute (an end at or before the start runs past midnight).
+    Rules are painted onto the week in Priority order, later ones winning
+    where they overlap; everything else is charged at hourly_rate.
+    """
+    owners = array('i', [0]) * WEEK_MINUTES
+    occurrences = [('hourly', hourly_rate)]
+    for rule in sorted(rules, key=lambda rule: (rule['Priority'], rule['RuleID'])):
+        start, end = rule['StartMinute'], rule['EndMinute']
+        length = (end - start) % 1440 or 1440
+        for day in days_from_mask(rule['DaysMask']):
+            # Every day a flat rule applies is a separate window, charged separately
+            occurrences.append((rule['RateType'], rule['Rate']))
+            first = day * 1440 + start
+            for minute in range(first, first + length):
+                owners[minute % WEEK_MINUTES] = len(occurrences) - 1
+
+    # Run-length encode the painted week into segments
+    runs = []
+    for minute, owner in enumerate(owners):
+        if not runs or runs[-1][1] != owner:
+            runs.append([minute, owner])
+
+    bounds, rates, flats = [], [], []
+    for i, (minute, owner) in enumerate(runs):
+        rate_type, rate = occurrences[owner]
+        end_minute = runs[i + 1][0] if i + 1 < len(runs) else WEEK_MINUTES
+        bounds.append(minute * 60)
+        rates.append(rate if rate_type == 'hourly' else 0)
+        if rate_type == 'flat':
+            flats.append([minute * 60, end_minute * 60, rate])
+
+    # A flat window split by the week boundary is one window that starts late in the week
+    if len(flats) > 1 and flats[0][0] == 0 and flats[-1][1] == WEEK_SECONDS and runs[0][1] == runs[-1][1]:
+        flats[-1][1] = WEEK_SECONDS + flats[0][1]
+        flats.pop(0)
+
+    return CompiledTariff(bounds, rates, [tuple(flat) for flat in flats])
+
+
+def rule_from_json(data):
+    """Validate one rule of an admin request into TARIFF_RULE column values"""
+    rate_type = data.get('rateType', 'hourly')
+    if rate_type not in RATE_TYPES:
+        raise ValueError(f"rateType must be one of {', '.join(RATE_TYPES)}")
+    days = data.get('days', list(range(7)))
+    if not days or any(not isinstance(day, int) or not 0 <= day <= 6 for day in days):
+        raise ValueError('days must be a non-empty list of weekdays 0 (Monday) to 6 (Sunday)')
+    try:
+        start_hour, start_min = (int(part) for part in data['start'].split(':'))
+        end_hour, end_min = (int(part) for part in data['end'].split(':'))
+    except (KeyError, ValueError, AttributeError):
+        raise ValueError('start and end must be HH:MM')
+    if not (0 <= start_hour <= 23 and 0 <= end_hour <= 24 and 0 <= start_min <= 59 and 0 <= end_min <= 59):
+        raise ValueError('start and end must be HH:MM')
+    if end_hour == 24 and end_min != 0:
+        raise ValueError('end after 23:59 must be 24:00')
+    rate = data.get('rate')
+    if not isinstance(rate, int) or rate < 0:
+        raise ValueError('rate must be a non-negative integer')
+    priority = data.get('priority', 0)
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        raise ValueError('priority must be an integer')
+    return {
+        'DaysMask': sum(1 << day for day in set(days)),
+        'StartMinute': start_hour * 60 + start_min,
+        'EndMinute': (end_hour * 60 + end_min) % 1440,
+        'RateType': rate_type,
+        'Rate': rate,
+        'Priority': priority
+    }
+
+
+def rule_to_json(rule):
+    return {
+        'id': rule['RuleID'],
+        'days': days_from_mask(rule['DaysMask']),
+        'start': f"{rule['StartMinute'] // 60:02d}:{rule['StartMinute'] % 60:02d}",
+        'end': f"{rule['EndMinute'] // 60:02d}:{rule['EndMinute'] % 60:02d}",
+        'rateType': rule['RateType'],
+        'rate': rule['Rate'],
+        'priority': rule['Priority']
+    }
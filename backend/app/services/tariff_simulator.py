@@ -0,0 +1,187 @@
+import time
+from datetime import timedelta
+import numpy as np
+from ..utils.db_connector import db_connector
+from .billing_service import BillingService
+from .tariff_cache import tariff_cache
+from .tariff_engine import WEEK_ORIGIN, compile_schedule, rule_from_json
+
+# EntryTime span loaded per query (all lots at once, an index seek on EntryTime)
+BATCH_DAYS = 7
+
+# Fee distribution buckets (NT$); the last bucket is open-ended
+FEE_BUCKETS = (0, 1, 51, 101, 201, 501, 1001)
+
+# EntryPosition is the week position the tariff engine prices from
+_CLOSED_STAYS_QUERY = """
+    SELECT ParkingLotID,
+           DATEDIFF(SECOND, %s, EntryTime) AS EntryPosition,
+           DATEDIFF(SECOND, EntryTime, ExitTime) AS Duration,
+           TotalFee
+    FROM PARKING_RECORD
+    WHERE EntryTime >= %s AND EntryTime < %s AND ExitTime IS NOT NULL
+"""
+
+
+class Tariff:
+    """HourlyRate / DailyMaxRate plus an optional compiled schedule"""
+
+    def __init__(self, hourly_rate, daily_max_rate=None, schedule=None):
+        self.hourly_rate = hourly_rate
+        self.daily_max_rate = daily_max_rate
+        self.schedule = schedule
+
+    @classmethod
+    def current(cls, lot):
+        return cls(lot['HourlyRate'], lot['DailyMaxRate'], tariff_cache.schedule(lot['ParkingLotID']))
+
+    @classmethod
+    def proposed(cls, lot, proposal):
+        """The lot's current tariff with the fields given in proposal replaced"""
+        hourly_rate = proposal.get('hourlyRate', lot['HourlyRate'])
+        daily_max_rate = proposal.get('dailyMaxRate', lot['DailyMaxRate'])
+        if 'rules' in proposal:
+            rules = [{'RuleID': i, **rule_from_json(rule)} for i, rule in enumerate(proposal['rules'])]
+        else:
+            # The lot's own rules, with the proposed HourlyRate wherever none applies
+            rules = tariff_cache.rules(lot['ParkingLotID'])
+        return cls(hourly_rate, daily_max_rate, compile_schedule(hourly_rate, rules) if rules else None)
+
+    def fees(self, durations, entry_positions):
+        return BillingService.calculate_fees_batch(
+            durations, entry_positions, self.hourly_rate, self.daily_max_rate, self.schedule)
+
+
+def validate_proposal(proposal):
+    """Raise ValueError for a malformed proposed tariff"""
+    if not isinstance(proposal, dict) or not proposal:
+        raise ValueError('tariff must give hourlyRate, dailyMaxRate and/or rules')
+    # Unlike dailyMaxRate (null = no cap), an explicit null hourlyRate has no meaning
+    if 'hourlyRate' in proposal:
+        hourly_rate = proposal['hourlyRate']
+        if not isinstance(hourly_rate, int) or isinstance(hourly_rate, bool) or hourly_rate <= 0:
+            raise ValueError('hourlyRate must be a positive integer')
+    daily_max_rate = proposal.get('dailyMaxRate')
+    if daily_max_rate is not None and (not isinstance(daily_max_rate, int) or daily_max_rate <= 0):
+        raise ValueError('dailyMaxRate must be a positive integer or null')
+    rules = proposal.get('rules', [])
+    if not isinstance(rules, list):
+        raise ValueError('rules must be a list')
+    for rule in rules:
+        rule_from_json(rule)
+
+
+def _load_stays(start, end, lot_ids):
+    """Closed stays that entered in [start, end) as columns, loaded in BATCH_DAYS batches"""
+    columns = {'lots': [], 'positions': [], 'durations': [], 'fees': []}
+    batch_start = start
+    while batch_start < end:
+        batch_end = min(batch_start + timedelta(days=BATCH_DAYS), end)
+        rows, failed = db_connector.fan_out(_CLOSED_STAYS_QUERY, (WEEK_ORIGIN, batch_start, batch_end), lot_ids)
+        if failed:
+            raise RuntimeError(f"Stays unavailable from shards: {', '.join(failed)}")
+        count = len(rows)
+        lots = np.fromiter((row['ParkingLotID'] for row in rows), dtype=np.int64, count=count)
+        keep = np.isin(lots, lot_ids)
+        columns['lots'].append(lots[keep])
+        columns['positions'].append(
+            np.fromiter((row['EntryPosition'] for row in rows), dtype=np.int64, count=count)[keep])
+        columns['durations'].append(np.fromiter((row['Duration'] for row in rows), dtype=np.int64, count=count)[keep])
+        columns['fees'].append(np.fromiter((row['TotalFee'] or 0 for row in rows), dtype=np.int64, count=count)[keep])
+        batch_start = batch_end
+    return {name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            for name, parts in columns.items()}
+
+
+def _distribution(fees):
+    edges = np.array(FEE_BUCKETS + (np.inf,), dtype=np.float64)
+    counts, _ = np.histogram(fees, bins=edges)
+    return [
+        {'from': int(low), 'to': None if np.isinf(high) else int(high) - 1, 'count': int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+
+def simulate(start, end, proposal, lot_ids=None):
+    """
+    Re-price every closed stay that entered in [start, end) under a proposed tariff
+
+    Each stay is priced as a single first payment under both the lot's
+    current tariff and the proposal, so the delta isolates the tariff
+    change; the recorded TotalFee sum is reported alongside. Returns
+    per-lot and per-lot/day revenue and the shift in the fee distribution.
+    """
+    started = time.perf_counter()
+    lots = {lot['ParkingLotID']: lot for lot in tariff_cache.all()}
+    lot_ids = sorted(lots) if not lot_ids else [lot_id for lot_id in lot_ids if lot_id in lots]
+    stays = _load_stays(start, end, lot_ids)
+
+    current = np.zeros(len(stays['lots']), dtype=np.int64)
+    proposed = np.zeros(len(stays['lots']), dtype=np.int64)
+    for lot_id in lot_ids:
+        mask = stays['lots'] == lot_id
+        if not mask.any():
+            continue
+        durations, positions = stays['durations'][mask], stays['positions'][mask]
+        current[mask] = Tariff.current(lots[lot_id]).fees(durations, positions)
+        proposed[mask] = Tariff.proposed(lots[lot_id], proposal).fees(durations, positions)
+
+    # Group by (lot, entry day); the week origin is a midnight so whole days divide evenly
+    days = stays['positions'] // 86400
+    keys, group = np.unique(stays['lots'] << 32 | days, return_inverse=True)
+    sums = {
+        name: np.bincount(group, weights=values, minlength=len(keys))
+        for name, values in (('current', current), ('proposed', proposed), ('recorded', stays['fees']))
+    }
+    stay_counts = np.bincount(group, minlength=len(keys))
+    by_day = [
+        {
+            'lotId': int(key >> 32),
+            'date': (WEEK_ORIGIN + timedelta(days=int(key & 0xFFFFFFFF))).date().isoformat(),
+            'stays': int(stay_counts[i]),
+            'currentRevenue': int(sums['current'][i]),
+            'proposedRevenue': int(sums['proposed'][i]),
+            'delta': int(sums['proposed'][i] - sums['current'][i]),
+            'recordedRevenue': int(sums['recorded'][i])
+        }
+        for i, key in enumerate(keys)
+    ]
+
+    by_lot = []
+    for lot_id in lot_ids:
+        mask = stays['lots'] == lot_id
+        current_total, proposed_total = int(current[mask].sum()), int(proposed[mask].sum())
+        by_lot.append({
+            'lotId': lot_id,
+            'name': lots[lot_id]['Name'],
+            'stays': int(mask.sum()),
+            'currentRevenue': current_total,
+            'proposedRevenue': proposed_total,
+            'delta': proposed_total - current_total,
+            'deltaPercent': round((proposed_total - current_total) / current_total * 100, 2) if current_total else None,
+            'recordedRevenue': int(stays['fees'][mask].sum())
+        })
+
+    deltas = proposed - current
+    percentiles = np.percentile(deltas, (10, 50, 90)) if len(deltas) else None
+    return {
+        'stays': int(len(deltas)),
+        'currentRevenue': int(current.sum()),
+        'proposedRevenue': int(proposed.sum()),
+        'delta': int(deltas.sum()),
+        'lots': by_lot,
+        'days': by_day,
+        'distribution': {
+            'current': _distribution(current),
+            'proposed': _distribution(proposed),
+            'staysPayingMore': int((deltas > 0).sum()),
+            'staysPayingLess': int((deltas < 0).sum()),
+            'staysUnchanged': int((deltas == 0).sum()),
+            'deltaPercentiles': {
+                'p10': round(float(percentiles[0]), 1),
+                'p50': round(float(percentiles[1]), 1),
+                'p90': round(float(percentiles[2]), 1)
+            } if percentiles is not None else None
+        },
+        'durationMs': round((time.perf_counter() - started) * 1000, 1)
+    }
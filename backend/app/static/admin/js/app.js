@@ -764,9 +764,9 @@ async function loadParkingLotsForModal() {
             const lots = Array.isArray(data) ? data : (data.lots || []);
             container.innerHTML = lots.map(lot => `
                 <div class="form-check">
-                    <input class="form-check-input" type="checkbox" value="${lot.ParkingLotID}" id="lot-${lot.ParkingLotID}">
-                    <label class="form-check-label" for="lot-${lot.ParkingLotID}">
-                        ${lot.Name}
+                    <input class="form-check-input" type="checkbox" value="${lot.id}" id="lot-${lot.id}">
+                    <label class="form-check-label" for="lot-${lot.id}">
+                        ${lot.name}
                     </label>
                 </div>
             `).join('');
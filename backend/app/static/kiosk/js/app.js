@@ -3,6 +3,18 @@
 // API Configuration
 const API_BASE_URL = window.location.origin;
 
+// Request timeouts and retries for /api/v1/kiosk calls. Retries back off
+// exponentially with full jitter (and honour Retry-After), so kiosks coming
+// back from an outage do not hit the API in lockstep.
+const REQUEST_TIMEOUT_MS = 8000;
+const PAYMENT_TIMEOUT_MS = 20000;
+const MAX_RETRIES = 3;
+const RETRY_BASE_MS = 500;
+const RETRY_MAX_MS = 8000;
+
+// Jittered check for a new deployment; it is applied while the kiosk is idle
+const UPDATE_CHECK_MS = 30 * 60 * 1000;
+
 // Global state
 let currentFeeData = null;
 let appliedCoupons = [];
@@ -10,6 +22,7 @@ let currentPaymentMethod = null;
 let autoReturnTimer = null;
 let licensePlateInput = '';
 let isQRScannerActive = false;
+let updateRequested = false;
 
 // Initialize application
 document.addEventListener('DOMContentLoaded', function() {
@@ -29,6 +42,136 @@ function initializeKiosk() {
     
     // Initialize virtual keyboard display
     updateLicensePlateDisplay();
+    
+    // Offline boot and lot rates (answered from cache first by the service worker)
+    registerServiceWorker();
+    loadLotRates();
+}
+
+async function kioskFetch(path, options = {}, { timeout = REQUEST_TIMEOUT_MS, idempotent = true } = {}) {
+    // Non-idempotent calls (payment) are only retried when the server turned
+    // them away unprocessed: 429, or 503 with Retry-After from load shedding
+    for (let attempt = 0; ; attempt++) {
+        const controller = new AbortController();
+        const timer = setTimeout(() => controller.abort(), timeout);
+        let response = null;
+        try {
+            response = await fetch(`${API_BASE_URL}${path}`, { ...options, signal: controller.signal });
+        } catch (error) {
+            // Timed out or no connection: the request may still have reached the server
+            if (!idempotent || attempt >= MAX_RETRIES) {
+                throw error;
+            }
+        } finally {
+            clearTimeout(timer);
+        }
+        
+        if (response) {
+            const turnedAway = response.status === 429 ||
+                (response.status === 503 && response.headers.has('Retry-After'));
+            const retryable = turnedAway || (idempotent && [502, 503, 504].includes(response.status));
+            if (!retryable || attempt >= MAX_RETRIES) {
+                return response;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, retryDelay(attempt, response)));
+    }
+}
+
+function retryDelay(attempt, response) {
+    const retryAfter = response ? parseFloat(response.headers.get('Retry-After')) : NaN;
+    const jitter = Math.random() * Math.min(RETRY_MAX_MS, RETRY_BASE_MS * 2 ** attempt);
+    return isNaN(retryAfter) ? jitter : retryAfter * 1000 + jitter;
+}
+
+function registerServiceWorker() {
+    if (!('serviceWorker' in navigator)) {
+        return;
+    }
+    
+    navigator.serviceWorker.register('/kiosk-sw.js')
+        .then(registration => scheduleUpdateCheck(registration))
+        .catch(error => console.warn('Service worker not registered:', error));
+    
+    // Reload once into the new version, only after this page asked for it
+    navigator.serviceWorker.addEventListener('controllerchange', () => {
+        if (updateRequested) {
+            updateRequested = false;
+            location.reload();
+        }
+    });
+}
+
+function scheduleUpdateCheck(registration) {
+    // Spread checks between 0.5x and 1.5x the interval so a fleet never asks at once
+    setTimeout(async () => {
+        try {
+            await registration.update();
+        } catch (error) {
+            console.warn('Service worker update check failed:', error);
+        }
+        activateWaitingWorker(registration);
+        scheduleUpdateCheck(registration);
+    }, UPDATE_CHECK_MS * (0.5 + Math.random()));
+}
+
+function activateWaitingWorker(registration) {
+    // Never interrupt a customer: switch versions only on an untouched welcome screen
+    const currentScreen = document.querySelector('.screen.active');
+    if (registration.waiting && currentScreen && currentScreen.id === 'welcome-screen' && !licensePlateInput) {
+        updateRequested = true;
+        registration.waiting.postMessage('skipWaiting');
+    }
+}
+
+async function loadLotRates() {
+    const container = document.getElementById('lot-rates');
+    if (!container) {
+        return;
+    }
+    
+    try {
+        const response = await kioskFetch('/api/v1/kiosk/lots');
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        container.innerHTML = '';
+        data.lots.forEach(lot => {
+            const line = document.createElement('div');
+            line.textContent = lot.dailyMaxRate
+                ? `${lot.name}：每小時 $${lot.hourlyRate}，每日上限 $${lot.dailyMaxRate}`
+                : `${lot.name}：每小時 $${lot.hourlyRate}`;
+            container.appendChild(line);
+            // Time-of-day / weekday rules override the base rate in their windows
+            (lot.rules || []).forEach(rule => {
+                const detail = document.createElement('div');
+                detail.className = 'lot-rate-rule';
+                const price = rule.rateType === 'flat' ? `均一價 $${rule.rate}` : `每小時 $${rule.rate}`;
+                detail.textContent = `${formatRuleDays(rule.days)} ${rule.start}–${rule.end}：${price}`;
+                container.appendChild(detail);
+            });
+        });
+    } catch (error) {
+        // Rates are informational; keep whatever is shown
+        console.warn('Lot rates unavailable:', error);
+    }
+}
+
+function formatRuleDays(days) {
+    // Weekdays 0 (Monday) to 6 (Sunday), as the tariff API numbers them
+    const names = ['一', '二', '三', '四', '五', '六', '日'];
+    const key = [...days].sort().join(',');
+    if (key === '0,1,2,3,4,5,6') {
+        return '每日';
+    }
+    if (key === '0,1,2,3,4') {
+        return '週一至週五';
+    }
+    if (key === '5,6') {
+        return '週末';
+    }
+    return `週${[...days].sort().map(day => names[day]).join('、')}`;
 }
 
 function bindEventListeners() {
@@ -310,7 +453,7 @@ async function queryFee() {
         }
         
         // First check vehicle status
-        const statusResponse = await fetch(`${API_BASE_URL}/api/v1/kiosk/vehicle-status/${encodeURIComponent(licensePlate)}`);
+        const statusResponse = await kioskFetch(`/api/v1/kiosk/vehicle-status/${encodeURIComponent(licensePlate)}`);
         const statusData = await statusResponse.json();
         
         console.log('車輛狀態回應:', statusResponse.status, statusData); // 調試信息
@@ -333,7 +476,7 @@ async function queryFee() {
         }
         
         // Proceed with fee calculation
-        const response = await fetch(`${API_BASE_URL}/api/v1/kiosk/fee?plate=${encodeURIComponent(licensePlate)}`);
+        const response = await kioskFetch(`/api/v1/kiosk/fee?plate=${encodeURIComponent(licensePlate)}`);
         const data = await response.json();
         
         console.log('費用查詢回應:', response.status, data); // 調試信息
@@ -343,6 +486,10 @@ async function queryFee() {
             appliedCoupons = [];
             displayFeeInfo(data);
             showScreen('fee-screen');
+        } else if (data.candidates && data.candidates.length > 0) {
+            // Likely misread or mistyped plate: suggest the closest active vehicles
+            const suggestions = data.candidates.map(c => c.licensePlate).join('、');
+            showError(`${data.message} 您是否要查詢：${suggestions}？`);
         } else {
             showError(data.message || '查詢失敗，請稍後再試');
         }
@@ -416,14 +563,16 @@ async function applyCouponByCode(couponCode) {
     }
     
     try {
-        const response = await fetch(`${API_BASE_URL}/api/v1/kiosk/apply-discount`, {
+        // Sending the full coupon list makes the call safe to retry
+        const response = await kioskFetch('/api/v1/kiosk/apply-discount', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
                 recordId: currentFeeData.recordId,
-                couponCode: couponCode
+                coupons: [...appliedCoupons, couponCode],
+                quoteToken: currentFeeData.quoteToken
             })
         });
         
@@ -484,14 +633,15 @@ async function removeCoupon(couponCode) {
     // Recalculate fee with remaining coupons
     if (appliedCoupons.length > 0) {
         try {
-            const response = await fetch(`${API_BASE_URL}/api/v1/kiosk/apply-discount`, {
+            const response = await kioskFetch('/api/v1/kiosk/apply-discount', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
                     recordId: currentFeeData.recordId,
-                    couponCode: appliedCoupons[0] // Apply first remaining coupon
+                    coupons: appliedCoupons, // Re-apply all remaining coupons
+                    quoteToken: currentFeeData.quoteToken
                 })
             });
             
@@ -568,7 +718,7 @@ async function processPayment() {
         const finalAmountText = document.getElementById('final-fee').textContent;
         const finalAmount = parseInt(finalAmountText.replace('$', '').replace(',', ''));
         
-        const response = await fetch(`${API_BASE_URL}/api/v1/kiosk/pay`, {
+        const response = await kioskFetch('/api/v1/kiosk/pay', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -577,9 +727,10 @@ async function processPayment() {
                 recordId: currentFeeData.recordId,
                 amountPaid: finalAmount,
                 paymentMethod: currentPaymentMethod,
-                coupons: appliedCoupons
+                coupons: appliedCoupons,
+                quoteToken: currentFeeData.quoteToken
             })
-        });
+        }, { timeout: PAYMENT_TIMEOUT_MS, idempotent: false });
         
         const data = await response.json();
         
@@ -631,6 +782,7 @@ function startOver() {
     }
     
     showScreen('welcome-screen');
+    loadLotRates();
 }
 
 function goBack() {
@@ -754,15 +906,6 @@ function formatDateTime(dateString) {
     });
 }
 
-// Auto-refresh page every 5 minutes to prevent memory leaks
-setInterval(() => {
-    const currentScreen = document.querySelector('.screen.active');
-    if (currentScreen && currentScreen.id === 'welcome-screen') {
-        // Only refresh if on welcome screen to avoid interrupting user flow
-        location.reload();
-    }
-}, 5 * 60 * 1000);
-
 // Handle page visibility changes (screen saver mode)
 document.addEventListener('visibilitychange', function() {
     if (document.visibilityState === 'visible') {
@@ -801,6 +944,7 @@ document.addEventListener('keydown', function(e) {
 // Error handling for network issues
 window.addEventListener('online', function() {
     console.log('Network connection restored');
+    loadLotRates();
 });
 
 window.addEventListener('offline', function() {
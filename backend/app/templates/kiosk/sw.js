@@ -0,0 +1,101 @@
+// Parking Payment Kiosk service worker
+//
+// Rendered by /kiosk-sw.js. The precache list holds the kiosk page and its
+// hashed assets, and CACHE_VERSION changes whenever the page or an asset
+// does, so a deployment installs a new worker next to the running one
+// instead of every kiosk refetching everything on each boot.
+
+const CACHE_VERSION = '{{ version }}';
+const PRECACHE = `kiosk-precache-${CACHE_VERSION}`;
+const RUNTIME = 'kiosk-runtime';
+
+const PAGE_URL = '{{ url_for("kiosk") }}';
+const PRECACHE_URLS = [
+    PAGE_URL,
+    '{{ asset_url("kiosk/css/style.css") }}',
+    '{{ asset_url("kiosk/js/app.js") }}'
+];
+
+// Third-party assets are versioned in their URLs; a CDN outage must not block installing
+const CDN_URLS = [
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js'
+];
+
+// Lot names and rates: answered from cache at once, refreshed in the background
+const STALE_WHILE_REVALIDATE = ['/api/v1/kiosk/lots'];
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(PRECACHE);
+        await cache.addAll(PRECACHE_URLS);
+        await Promise.all(CDN_URLS.map(url => cache.add(url).catch(error => {
+            console.warn('CDN asset not precached:', url, error);
+        })));
+    })());
+    // No skipWaiting here: the page activates a new version once the kiosk is idle
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('kiosk-precache-') && name !== PRECACHE)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('message', event => {
+    if (event.data === 'skipWaiting') {
+        self.skipWaiting();
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (request.mode === 'navigate' && url.origin === self.location.origin && url.pathname === PAGE_URL) {
+        event.respondWith(cacheFirst(PAGE_URL, request));
+    } else if (url.origin === self.location.origin && STALE_WHILE_REVALIDATE.includes(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, request));
+    } else if (url.origin === self.location.origin ? PRECACHE_URLS.includes(url.pathname) : url.hostname === 'cdn.jsdelivr.net') {
+        // Hashed and CDN-versioned URLs never change content
+        event.respondWith(cacheFirst(request, request));
+    }
+    // Everything else (other /api/v1/kiosk calls, admin pages) goes to the network untouched
+});
+
+async function cacheFirst(key, request) {
+    const cached = await caches.match(key);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(RUNTIME);
+        cache.put(key, response.clone());
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await caches.open(RUNTIME);
+    const cached = await cache.match(request);
+    const refresh = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+    }
+    return refresh;
+}
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from flask import request, send_from_directory, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - only gzip variants are built then
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# File types worth precompressing (images and fonts are already compressed)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.html', '.json', '.svg', '.txt', '.map')
+
+# Hashed asset URLs never change content, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest[:10]}{ext}'
+
+
+def build_assets(static_folder, output_folder, min_compress_size=256):
+    """
+    Copy static assets to output_folder under content-hashed names
+
+    Each compressible file gets .gz (and .br when brotli is installed)
+    siblings; a manifest maps logical names (kiosk/js/app.js) to hashed
+    ones. Returns the manifest.
+    """
+    if os.path.isdir(output_folder):
+        shutil.rmtree(output_folder)
+    os.makedirs(output_folder)
+
+    manifest = {}
+    output_path = os.path.realpath(output_folder)
+    for directory, subdirectories, files in os.walk(static_folder):
+        # Never fingerprint a previous build
+        subdirectories[:] = [d for d in subdirectories
+                             if os.path.realpath(os.path.join(directory, d)) != output_path]
+        for filename in sorted(files):
+            source = os.path.join(directory, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            hashed = _hashed_name(logical, hashlib.sha256(content).hexdigest())
+            target = os.path.join(output_folder, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+
+            if logical.endswith(COMPRESSIBLE_EXTENSIONS) and len(content) >= min_compress_size:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+
+            manifest[logical] = hashed
+
+    with open(os.path.join(output_folder, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """Logical -> hashed asset names, loaded from the last build"""
+
+    def __init__(self):
+        self.folder = None
+        self.entries = {}
+
+    def load(self, folder):
+        self.folder = folder
+        try:
+            with open(os.path.join(folder, MANIFEST_NAME), encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+            logger.info("No asset manifest in %s; serving unhashed static files", folder)
+
+    def url(self, filename):
+        """Hashed, immutable URL for a static file, or the plain static URL if it was not built"""
+        hashed = self.entries.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+
+# Global asset manifest
+asset_manifest = AssetManifest()
+
+
+def _accepted_encodings():
+    accept = request.accept_encodings
+    return [encoding for encoding in ('br', 'gzip') if accept[encoding]]
+
+
+def serve_asset(filename):
+    """Serve a hashed asset, preferring a precompressed variant the client accepts"""
+    folder = asset_manifest.folder
+    if folder is None or os.path.basename(filename) == MANIFEST_NAME:
+        abort(404)
+
+    for encoding in _accepted_encodings():
+        suffix = '.br' if encoding == 'br' else '.gz'
+        variant = safe_join(folder, filename + suffix)
+        if variant is not None and os.path.isfile(variant):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(folder, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(folder, filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Serve built assets under /assets and expose asset_url() to templates"""
+    folder = app.config.get('ASSET_BUILD_FOLDER') or os.path.join(app.static_folder, 'dist')
+    asset_manifest.load(folder)
+
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.add_template_global(asset_manifest.url, 'asset_url')
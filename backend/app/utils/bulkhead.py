@@ -0,0 +1,133 @@
+import math
+import threading
+import time
+from flask import g, jsonify, request
+from .metrics import registry
+from .rate_limit import GATE_ENDPOINTS
+
+BULKHEAD_REJECTED = registry.counter(
+    'bulkhead_rejected_total', 'Requests rejected because their bulkhead was full', ('bulkhead', 'reason'))
+BULKHEAD_WAIT = registry.histogram(
+    'bulkhead_wait_seconds', 'Time requests queued for a bulkhead slot', ('bulkhead',))
+
+
+class BulkheadFull(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Bulkhead:
+    """
+    Bounded concurrency for one traffic class
+
+    At most max_concurrent requests run at once; up to max_queue more wait
+    at most timeout seconds for a slot, anything beyond is rejected
+    immediately. The WSGI server already provides the threads, so the
+    bulkhead bounds how many of them a class may occupy.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._active = 0
+        self._queued = 0
+        self._rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        start = time.perf_counter()
+        with self._cond:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise BulkheadFull('queue_full')
+            self._queued += 1
+            try:
+                while self._active >= self.max_concurrent:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise BulkheadFull('timeout')
+                    self._cond.wait(remaining)
+                self._active += 1
+            finally:
+                self._queued -= 1
+        BULKHEAD_WAIT.observe(time.perf_counter() - start, bulkhead=self.name)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'maxConcurrent': self.max_concurrent,
+                'maxQueue': self.max_queue,
+                'timeoutSeconds': self.timeout,
+                'active': self._active,
+                'queued': self._queued,
+                'rejected': self._rejected
+            }
+
+
+# Bulkheads by partition name
+bulkheads = {}
+
+
+def partition_of(endpoint, blueprint):
+    """Bulkhead / DB pool partition of a request: 'gate' for gate entry/exit, else its blueprint
+
+    Gate entry/exit gets its own partition so unauthenticated hardware routes
+    (coupon, status, vehicle lists) cannot fill the slots and connections a
+    waiting car needs.
+    """
+    if endpoint in GATE_ENDPOINTS:
+        return 'gate'
+    return blueprint
+
+
+def parse_bulkheads(value):
+    """Parse 'hardware=16/32/2,admin=4/8/10' (concurrent / queue / timeout seconds)"""
+    settings = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, setting = item.split('=', 1)
+        concurrent, queue, timeout = (setting.split('/') + ['0', '5'])[:3]
+        settings[name.strip()] = (int(concurrent), int(queue), float(timeout))
+    return settings
+
+
+def init_app(app):
+    """Admit each partition's requests (gate, then per blueprint) through its own bulkhead"""
+    bulkheads.clear()
+    for name, (concurrent, queue, timeout) in parse_bulkheads(app.config.get('BULKHEADS')).items():
+        bulkheads[name] = Bulkhead(name, concurrent, queue, timeout)
+
+    @app.before_request
+    def enter_bulkhead():
+        bulkhead = bulkheads.get(partition_of(request.endpoint, request.blueprint))
+        if bulkhead is None:
+            return None
+        try:
+            bulkhead.acquire()
+        except BulkheadFull as e:
+            BULKHEAD_REJECTED.inc(bulkhead=bulkhead.name, reason=e.reason)
+            retry_after = max(1, math.ceil(bulkhead.timeout))
+            response = jsonify({'error': 'Service busy, please retry shortly', 'retryAfter': retry_after})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        g.bulkhead = bulkhead
+
+    @app.teardown_request
+    def leave_bulkhead(exc=None):
+        bulkhead = g.pop('bulkhead', None)
+        if bulkhead is not None:
+            bulkhead.release()
@@ -0,0 +1,31 @@
+import gzip
+from flask import request
+
+# API payloads worth compressing; static assets are precompressed by the asset build
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/msgpack', 'text/plain')
+
+
+def init_app(app):
+    """Gzip large API responses on the fly for clients that accept it"""
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
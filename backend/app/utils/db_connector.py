@@ -1,118 +1,743 @@
 import pymssql
-from flask import current_app
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+from datetime import datetime
+from flask import current_app, request, has_request_context, g, session
 import logging
+from .logging_config import PRESAMPLED, sampled
+from .metrics import record_db_query, registry
+from .query_stats import query_stats, fingerprint
+from .query_cache import query_cache, written_tables
+from .tracing import tracer
+from .bulkhead import partition_of
 
-class DatabaseConnector:
-    def __init__(self):
-        self.connection = None
+logger = logging.getLogger(__name__)
+
+# SQL Server error numbers for unique index / UNIQUE constraint violations
+DUPLICATE_KEY_ERRORS = (2601, 2627)
+
+_OPERATION_RE = re.compile(r'\b(SELECT|INSERT|UPDATE|DELETE|MERGE|EXEC)\b', re.IGNORECASE)
+
+DB_POOL_WAIT = registry.histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled database connection')
+SHARD_QUERIES = registry.counter(
+    'db_shard_fanout_total', 'Fan-out queries per shard by outcome', ('shard', 'outcome'))
+
+# Shard the current request or task is routed to; None is the primary database
+_current_shard = ContextVar('db_shard', default=None)
+
+class DuplicateKeyError(Exception):
+    """Raised when a write violates a unique index or constraint"""
+    pass
+
+class StaleRowError(Exception):
+    """Raised when a guarded statement of a transaction matched fewer rows than expected"""
+    pass
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection became free within the pool timeout"""
+    pass
+
+class ConnectionPool:
+    """
+    Bounded pool of pymssql connections shared by request and background threads
     
-    def get_connection(self):
-        """Get database connection using current app config"""
+    Connections idle for longer than ping_idle_seconds are checked with a
+    SELECT 1 on checkout; busy connections are reused without a round trip.
+    """
+    
+    def __init__(self, connect, size=10, timeout=30, ping_idle_seconds=30):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_idle_seconds = ping_idle_seconds
+        self._idle = []          # (connection, last released at), most recent last
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._last_wait = 0.0
+        self._wait_ewma = 0.0
+        self._last_checkout_at = time.monotonic()
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        start = time.perf_counter()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._in_use >= self.size:
+                    remaining = self.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(f"No database connection available within {self.timeout}s")
+                    self._cond.wait(remaining)
+                self._in_use += 1
+                entry = self._idle.pop() if self._idle else None
+            finally:
+                self._waiting -= 1
+            waited = time.perf_counter() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._last_wait = waited
+            self._wait_ewma = self.recent_wait + 0.2 * (waited - self.recent_wait)
+            self._last_checkout_at = time.monotonic()
+        DB_POOL_WAIT.observe(waited)
+        
         try:
-            if self.connection is None or self._connection_closed():
-                # Parse connection string for pymssql
-                config = current_app.config
-                self.connection = pymssql.connect(
-                    server=config['DB_SERVER'],
-                    user=config['DB_USERNAME'], 
-                    password=config['DB_PASSWORD'],
-                    database=config['DB_DATABASE'],
-                    port=int(config.get('DB_PORT', 1433)),
-                    timeout=30,
-                    as_dict=True
-                )
-            return self.connection
-        except Exception as e:
-            current_app.logger.error(f"Database connection error: {str(e)}")
+            connection = None
+            if entry is not None:
+                connection, released_at = entry
+                if time.monotonic() - released_at > self.ping_idle_seconds and not self._is_alive(connection):
+                    self._close(connection)
+                    connection = None
+            if connection is None:
+                connection = self._connect()
+            return connection
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
             raise
     
-    def _connection_closed(self):
-        """Check if connection is closed (pymssql doesn't have .closed attribute)"""
-        if self.connection is None:
-            return True
+    def release(self, connection, discard=False):
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+    
+    @property
+    def waiting(self):
+        return self._waiting
+    
+    @property
+    def recent_wait(self):
+        """Exponentially weighted recent checkout wait in seconds, decaying (1 s half-life) when idle"""
+        return self._wait_ewma * 0.5 ** (time.monotonic() - self._last_checkout_at)
+    
+    def close_all(self):
+        with self._cond:
+            for connection, _ in self._idle:
+                self._close(connection)
+            self._idle = []
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'inUse': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'saturation': round(self._in_use / self.size, 3) if self.size else 1.0,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'avgWaitMs': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'lastWaitMs': round(self._last_wait * 1000, 3),
+                'recentWaitMs': round(self.recent_wait * 1000, 3)
+            }
+    
+    @staticmethod
+    def _is_alive(connection):
         try:
-            # Try a simple query to check if connection is alive
-            cursor = self.connection.cursor()
+            cursor = connection.cursor()
             cursor.execute("SELECT 1")
+            cursor.fetchall()
             cursor.close()
+            return True
+        except Exception:
             return False
-        except:
+    
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+def parse_partitions(value):
+    """Parse 'hardware=6/2,admin=3/10' (size / checkout timeout seconds) into {name: (size, timeout)}"""
+    partitions = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, setting = item.split('=', 1)
+        size, _, timeout = setting.partition('/')
+        partitions[name.strip()] = (int(size), float(timeout) if timeout else None)
+    return partitions
+
+def parse_shards(value):
+    """Parse 'east=sql-east:1433/ParkingLot,west=/ParkingLot_West' into {name: (server, port, database)}; blanks use the primary's"""
+    shards = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, target = item.split('=', 1)
+        address, _, database = target.strip().partition('/')
+        server, _, port = address.partition(':')
+        shards[name.strip()] = (server or None, int(port) if port else None, database or None)
+    return shards
+
+def parse_shard_map(value):
+    """Parse '1-100=east,101-200=west,250=east' into [(first lot ID, last lot ID, shard name)]"""
+    ranges = []
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        lots, name = item.split('=', 1)
+        first, _, last = lots.strip().partition('-')
+        ranges.append((int(first), int(last or first), name.strip()))
+    return ranges
+
+class ReplicaRouter:
+    """
+    Read-only replica target for reporting and listing SELECTs
+    
+    Lag is measured with a heartbeat row the primary writes and the replica
+    replays; reads go to the primary whenever the replica is down, lags
+    more than max_staleness seconds (0 disables the check), or has not
+    been measured recently.
+    """
+    
+    HEARTBEAT_WRITE = """
+        MERGE REPLICA_HEARTBEAT AS t
+        USING (SELECT 1 AS HeartbeatID) AS s ON t.HeartbeatID = s.HeartbeatID
+        WHEN MATCHED THEN UPDATE SET BeatAt = %s
+        WHEN NOT MATCHED THEN INSERT (HeartbeatID, BeatAt) VALUES (1, %s);
+    """
+    HEARTBEAT_READ = "SELECT BeatAt FROM REPLICA_HEARTBEAT WHERE HeartbeatID = 1"
+    
+    def __init__(self, pool, max_staleness=30, sticky_seconds=30, retry_seconds=30):
+        self.pool = pool
+        self.max_staleness = max_staleness
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.lag = None
+        self.checked_at = None
+        self.down_until = 0.0
+        self.last_error = None
+        self._last_beat = None
+    
+    def usable(self, check_interval):
+        if time.monotonic() < self.down_until:
+            return False
+        if not self.max_staleness:
             return True
+        if self.lag is None or self.checked_at is None:
+            return False
+        # A lag measured too long ago says nothing about the replica now
+        if time.monotonic() - self.checked_at > 3 * check_interval:
+            return False
+        return self.lag <= self.max_staleness
+    
+    def mark_down(self, error):
+        self.down_until = time.monotonic() + self.retry_seconds
+        self.last_error = str(error)
+        logger.warning("Read replica unavailable, using primary for %ss: %s", self.retry_seconds, error)
+    
+    def status(self):
+        return {
+            'lagSeconds': round(self.lag, 3) if self.lag is not None else None,
+            'maxStalenessSeconds': self.max_staleness,
+            'down': time.monotonic() < self.down_until,
+            'lastError': self.last_error,
+            'pool': self.pool.stats()
+        }
+
+class DatabaseConnector:
+    """
+    Pooled access to SQL Server
+    
+    Each partition listed in DB_POOL_PARTITIONS ('gate' for entry/exit, else
+    the blueprint name) gets its own pool so a burst of admin reports or
+    coupon requests cannot take the connections gate entry/exit needs;
+    everything else (other routes, background threads) uses 'default'.
+    
+    With DB_SHARDS and DB_SHARD_MAP, parking and payment data of the mapped
+    lots lives in shard databases: code inside lot_shard(lot_id) runs on
+    that lot's shard (unmapped lots stay on the primary), and fan_out runs
+    one SELECT on several databases concurrently. Admin accounts, audit and
+    reconciliation tables are only kept on the primary.
+    """
+    
+    def __init__(self):
+        self.config = None
+        self.pools = {'default': ConnectionPool(self._connect)}
+        self.replica = None
+        self.replica_check_interval = 5.0
+        self.shards = {}
+        self.shard_targets = {}
+        self.shard_map = []
+        self.shard_timeout = 5.0
+        self._fanout = None
     
-    def execute_query(self, query, params=None, fetch=True):
-        """Execute a query and return results"""
-        cursor = None
+    def init_app(self, app):
+        """Bind to the app config so background threads can query outside a request"""
+        self.config = app.config
+        ping_idle_seconds = app.config.get('DB_POOL_PING_IDLE_SECONDS', 30)
+        default_timeout = app.config.get('DB_POOL_TIMEOUT', 30)
+        
+        self.close_connection()
+        self.pools = {'default': ConnectionPool(self._connect, app.config.get('DB_POOL_SIZE', 10),
+                                                default_timeout, ping_idle_seconds)}
+        for name, (size, timeout) in parse_partitions(app.config.get('DB_POOL_PARTITIONS')).items():
+            self.pools[name] = ConnectionPool(self._connect, size, timeout or default_timeout, ping_idle_seconds)
+        
+        self.replica = None
+        self.replica_check_interval = app.config.get('HEALTH_PROBE_INTERVAL', 5.0)
+        if app.config.get('REPLICA_DB_SERVER'):
+            pool = ConnectionPool(functools.partial(self._connect, replica=True),
+                                  app.config.get('REPLICA_POOL_SIZE', 4), app.config.get('REPLICA_POOL_TIMEOUT', 2),
+                                  ping_idle_seconds)
+            self.replica = ReplicaRouter(
+                pool,
+                max_staleness=app.config.get('REPLICA_MAX_STALENESS_SECONDS', 30),
+                sticky_seconds=app.config.get('REPLICA_STICKY_SECONDS', 30)
+            )
+        
+        self.shard_targets = parse_shards(app.config.get('DB_SHARDS'))
+        self.shard_map = parse_shard_map(app.config.get('DB_SHARD_MAP'))
+        unknown = {name for _, _, name in self.shard_map} - set(self.shard_targets)
+        if unknown:
+            raise ValueError(f"DB_SHARD_MAP refers to undefined shards: {', '.join(sorted(unknown))}")
+        self.shards = {
+            name: ConnectionPool(functools.partial(self._connect, shard=name),
+                                 app.config.get('DB_SHARD_POOL_SIZE', 4), default_timeout, ping_idle_seconds)
+            for name in self.shard_targets
+        }
+        self.shard_timeout = app.config.get('DB_SHARD_TIMEOUT', 5.0)
+        if self._fanout is not None:
+            self._fanout.shutdown(wait=False)
+        self._fanout = None
+        if self.shards:
+            self._fanout = ThreadPoolExecutor(max_workers=app.config.get('DB_FANOUT_WORKERS', 8),
+                                              thread_name_prefix='db-fanout')
+    
+    @property
+    def sharded(self):
+        return bool(self.shards)
+    
+    def shard_for(self, lot_id):
+        """Name of the shard holding a lot's records, or None for the primary"""
+        for first, last, name in self.shard_map:
+            if first <= lot_id <= last:
+                return name
+        return None
+    
+    def shards_for(self, lot_ids=None):
+        """Databases (None = primary) holding any of lot_ids, or every database"""
+        if lot_ids is None:
+            return [None] + list(self.shards)
+        return sorted({self.shard_for(lot_id) for lot_id in lot_ids}, key=lambda name: name or '')
+    
+    @contextmanager
+    def _routed(self, shard):
+        token = _current_shard.set(shard)
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(as_dict=True)
-            
-            current_app.logger.info(f"Executing query: {query}")
-            current_app.logger.info(f"Query params: {params}")
-            current_app.logger.info(f"Fetch mode: {fetch}")
-            
-            if params:
-                cursor.execute(query, params)
+            yield
+        finally:
+            _current_shard.reset(token)
+    
+    def lot_shard(self, lot_id):
+        """Route the queries of the block to the shard holding lot_id"""
+        return self._routed(self.shard_for(lot_id) if lot_id is not None else None)
+    
+    def primary(self):
+        """Route the queries of the block to the primary, e.g. global tables read inside lot_shard"""
+        return self._routed(None)
+    
+    def fan_out(self, query, params=None, lot_ids=None, timeout=None):
+        """
+        Run a SELECT on every database holding lot_ids (default: all) concurrently
+        
+        Returns (rows, failed): the merged rows and {shard: error} for the
+        databases that failed or did not answer within timeout seconds
+        (DB_SHARD_TIMEOUT). Rows carrying a ParkingLotID are only kept from
+        the database the map routes that lot to, so records left behind by a
+        remapped lot are not counted twice. Unsharded, this is execute_query.
+        """
+        if not self.shards:
+            return self.execute_query(query, params), {}
+        timeout = self.shard_timeout if timeout is None else timeout
+        futures = {
+            name: self._fanout.submit(self._query_shard, name, query, params)
+            for name in self.shards_for(lot_ids)
+        }
+        done, _ = wait(futures.values(), timeout=timeout)
+        
+        rows = []
+        failed = {}
+        for name, future in futures.items():
+            label = name or 'primary'
+            if future not in done:
+                # The query keeps its worker until it returns; only this caller stops waiting
+                failed[label] = f'no answer within {timeout}s'
+                SHARD_QUERIES.inc(shard=label, outcome='timeout')
+            elif future.exception() is not None:
+                failed[label] = str(future.exception())
+                SHARD_QUERIES.inc(shard=label, outcome='error')
             else:
-                cursor.execute(query)
+                rows.extend(row for row in future.result()
+                            if 'ParkingLotID' not in row or self.shard_for(row['ParkingLotID']) == name)
+                SHARD_QUERIES.inc(shard=label, outcome='ok')
+        if failed:
+            logger.warning("Fan-out query incomplete: %s", failed)
+        return rows, failed
+    
+    def _query_shard(self, name, query, params):
+        with self._routed(name):
+            return self.execute_query(query, params)
+    
+    @property
+    def pool(self):
+        """Pool of the current lot shard, else the request's partition (gate / blueprint), else the default pool"""
+        shard = _current_shard.get()
+        if shard is not None:
+            return self.shards[shard]
+        if has_request_context():
+            pool = self.pools.get(partition_of(request.endpoint, request.blueprint))
+            if pool is not None:
+                return pool
+        return self.pools['default']
+    
+    def pool_stats(self):
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        if self.replica is not None:
+            stats['replica'] = self.replica.pool.stats()
+        for name, pool in self.shards.items():
+            stats[f'shard:{name}'] = pool.stats()
+        return stats
+    
+    def check_replica(self):
+        """Write a heartbeat on the primary and measure how far the replica trails it"""
+        replica = self.replica
+        if replica is None:
+            return None
+        beat = datetime.now()
+        self.execute_query(ReplicaRouter.HEARTBEAT_WRITE, (beat, beat), fetch=False)
+        previous_beat, replica._last_beat = replica._last_beat, beat
+        try:
+            with self.connection(replica.pool) as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    cursor.execute(ReplicaRouter.HEARTBEAT_READ)
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+        except Exception as e:
+            replica.mark_down(e)
+            return replica.status()
+        
+        replayed = row['BeatAt'] if row else None
+        if replayed is None:
+            replica.lag = None
+        elif previous_beat is not None and replayed >= previous_beat:
+            # Caught up with everything written before this probe
+            replica.lag = 0.0
+        else:
+            replica.lag = max(0.0, (beat - replayed).total_seconds())
+        replica.checked_at = time.monotonic()
+        return replica.status()
+    
+    def _read_pool(self):
+        """Replica pool for a SELECT in a replica-routed request, or None to use the primary"""
+        replica = self.replica
+        if replica is None or not has_request_context() or not g.get('db_read_replica'):
+            return None
+        # The replica mirrors the primary only; shards have no replica
+        if _current_shard.get() is not None:
+            return None
+        # Read-your-writes: a session that just wrote keeps reading from the primary
+        if session.get('db_primary_until', 0) > time.time():
+            return None
+        return replica.pool if replica.usable(self.replica_check_interval) else None
+    
+    def _note_write(self):
+        """Pin a logged-in admin's reads to the primary for a while after they write"""
+        if self.replica is not None and has_request_context() and 'admin_id' in session:
+            session['db_primary_until'] = time.time() + self.replica.sticky_seconds
+    
+    def _connect(self, replica=False, shard=None):
+        """Open a new database connection using the app config"""
+        try:
+            config = self.config if self.config is not None else current_app.config
+            prefix = 'REPLICA_' if replica else ''
+            server = config[f'{prefix}DB_SERVER']
+            database = config.get(f'{prefix}DB_DATABASE') or config['DB_DATABASE']
+            port = config.get(f'{prefix}DB_PORT') or config.get('DB_PORT', 1433)
+            if shard is not None:
+                # Shards share the primary's credentials; blank parts of the target default to it too
+                shard_server, shard_port, shard_database = self.shard_targets[shard]
+                server, port, database = shard_server or server, shard_port or port, shard_database or database
+            return pymssql.connect(
+                server=server,
+                user=config.get(f'{prefix}DB_USERNAME') or config['DB_USERNAME'], 
+                password=config.get(f'{prefix}DB_PASSWORD') or config['DB_PASSWORD'],
+                database=database,
+                port=int(port),
+                timeout=30,
+                as_dict=True
+            )
+        except Exception as e:
+            logger.error("Database connection error: %s", e)
+            raise
+    
+    @contextmanager
+    def connection(self, pool=None):
+        """Check a connection out of the pool, rolling back if the block fails"""
+        pool = pool or self.pool
+        conn = pool.acquire()
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                # A connection that cannot roll back is broken; do not return it to the pool
+                discard = True
+            raise
+        finally:
+            pool.release(conn, discard=discard)
+    
+    def execute_query(self, query, params=None, fetch=True, cache_ttl=None, cache_tags=None):
+        """
+        Execute a query and return results
+        
+        SELECTs given a cache_ttl are served from the query result cache;
+        cache_tags defaults to the cacheable tables the statement reads.
+        """
+        if fetch and query.lstrip().upper().startswith('SELECT'):
+            if cache_ttl and query_cache.enabled:
+                key = query_cache.key(query, params)
+                if _current_shard.get() is not None:
+                    key = (_current_shard.get(),) + key
+                cached = query_cache.get(key)
+                if cached is not None:
+                    return cached
+                results = self.execute_query(query, params)
+                query_cache.put(key, results, ttl=cache_ttl, tags=cache_tags)
+                return results
             
-            if fetch:
-                if query.strip().upper().startswith('SELECT'):
+            read_pool = self._read_pool()
+            if read_pool is not None:
+                try:
+                    return self._execute_read(read_pool, query, params)
+                except (pymssql.OperationalError, pymssql.InterfaceError, PoolTimeoutError) as e:
+                    self.replica.mark_down(e)
+        else:
+            self._note_write()
+        
+        start = None
+        rows = None
+        error = None
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    start = time.perf_counter()
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    
+                    if fetch:
+                        if query.strip().upper().startswith('SELECT'):
+                            results = cursor.fetchall()
+                            rows = len(results)
+                            return results
+                        else:
+                            rows = cursor.rowcount
+                            self._invalidate_cached(query)
+                            return rows
+                    else:
+                        rows = cursor.rowcount
+                        conn.commit()
+                        self._invalidate_cached(query)
+                        return rows
+                finally:
+                    cursor.close()
+                
+        except Exception as e:
+            error = e
+            logger.error("Query execution error: %s", e, extra={'sql': query, 'params': params})
+            if self._is_duplicate_key(e):
+                raise DuplicateKeyError(str(e)) from e
+            raise
+        finally:
+            if start is not None:
+                self._after_statement(query, params, time.perf_counter() - start, rows,
+                                     committed=not fetch, error=error)
+    
+    def _execute_read(self, pool, query, params):
+        """Run a SELECT on the replica; connection failures propagate so the caller can fall back"""
+        start = None
+        rows = None
+        error = None
+        try:
+            with self.connection(pool) as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    start = time.perf_counter()
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
                     results = cursor.fetchall()
-                    current_app.logger.info(f"Query returned {len(results)} rows")
+                    rows = len(results)
                     return results
-                else:
-                    rowcount = cursor.rowcount
-                    current_app.logger.info(f"Query affected {rowcount} rows")
-                    return rowcount
-            else:
-                rowcount = cursor.rowcount
-                current_app.logger.info(f"Before commit: Query affected {rowcount} rows")
-                conn.commit()
-                current_app.logger.info(f"Transaction committed successfully")
-                return rowcount
-                
+                finally:
+                    cursor.close()
         except Exception as e:
-            current_app.logger.error(f"Query execution error: {str(e)}")
-            if self.connection:
-                self.connection.rollback()
+            error = e
             raise
         finally:
-            if cursor:
-                cursor.close()
+            if start is not None:
+                self._after_statement(query, params, time.perf_counter() - start, rows,
+                                     error=error, target='replica')
     
-    def execute_transaction(self, queries_with_params):
-        """Execute multiple queries in a transaction"""
-        cursor = None
+    def execute_returning(self, query, params=None):
+        """
+        Execute a write that returns rows and commit it
+        
+        For INSERT/UPDATE batches that report their outcome through
+        OUTPUT ... INTO and a trailing SELECT, so the write and its result
+        need a single round trip.
+        """
+        self._note_write()
+        start = None
+        rows = None
+        error = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            for query, params in queries_with_params:
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-            
-            conn.commit()
-            return True
+            with self.connection() as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    start = time.perf_counter()
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+                    results = cursor.fetchall() if cursor.description else []
+                    rows = len(results)
+                    conn.commit()
+                    self._invalidate_cached(query)
+                    return results
+                finally:
+                    cursor.close()
             
         except Exception as e:
-            current_app.logger.error(f"Transaction error: {str(e)}")
-            if self.connection:
-                self.connection.rollback()
+            error = e
+            logger.error("Query execution error: %s", e, extra={'sql': query, 'params': params})
+            if self._is_duplicate_key(e):
+                raise DuplicateKeyError(str(e)) from e
             raise
         finally:
-            if cursor:
-                cursor.close()
+            if start is not None:
+                self._after_statement(query, params, time.perf_counter() - start, rows,
+                                     committed=True, error=error)
+    
+    @staticmethod
+    def _invalidate_cached(query):
+        """Drop cached results that depend on the tables a committed statement wrote"""
+        tables = written_tables(query)
+        if tables:
+            query_cache.invalidate(tables)
+    
+    @staticmethod
+    def _is_duplicate_key(error):
+        return (isinstance(error, pymssql.IntegrityError)
+                and bool(error.args) and error.args[0] in DUPLICATE_KEY_ERRORS)
+    
+    @staticmethod
+    def _operation(query):
+        """First DML keyword of a statement or batch, used to label query metrics"""
+        match = _OPERATION_RE.search(query)
+        return match.group(1).upper() if match else 'OTHER'
+    
+    def _after_statement(self, query, params, duration, rows, committed=False, error=None, target='primary'):
+        """Record metrics, fingerprint statistics, trace span and SQL log line for an executed statement"""
+        operation = self._operation(query)
+        record_db_query(operation, duration)
+        endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'background'
+        query_stats.record(query, params, duration, rows, endpoint)
+        tracer.record_span(f'db.{operation}', duration, kind='client', error=error,
+                           **{'db.statement': fingerprint(query), 'db.rows': rows, 'db.target': target})
+        
+        # Formatting the SQL text is the expensive part; skip it unless this statement is logged
+        if sampled(logger, logging.DEBUG):
+            logger.debug(
+                "%s statement: %s rows in %.2f ms", operation, rows, duration * 1000,
+                extra={'sql': ' '.join(query.split()), 'params': params, 'rows': rows,
+                       'duration_ms': round(duration * 1000, 2), 'committed': committed, 'target': target,
+                       PRESAMPLED: True}
+            )
+    
+    def execute_transaction(self, queries_with_params):
+        """
+        Execute multiple queries in a transaction
+        
+        A statement given as (query, params, min_rows) must affect at least
+        min_rows rows, otherwise the transaction is rolled back and
+        StaleRowError raised (optimistic checks such as "still unpaid").
+        """
+        self._note_write()
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    for query, params, *guard in queries_with_params:
+                        start = time.perf_counter()
+                        try:
+                            if params:
+                                cursor.execute(query, params)
+                            else:
+                                cursor.execute(query)
+                        except Exception as e:
+                            self._after_statement(query, params, time.perf_counter() - start, None, error=e)
+                            raise
+                        self._after_statement(query, params, time.perf_counter() - start, cursor.rowcount)
+                        if guard and cursor.rowcount < guard[0]:
+                            raise StaleRowError(f"Expected {guard[0]} rows, statement affected {cursor.rowcount}")
+                    
+                    conn.commit()
+                    for query, *_ in queries_with_params:
+                        self._invalidate_cached(query)
+                    return True
+                finally:
+                    cursor.close()
+            
+        except Exception as e:
+            logger.error("Transaction error: %s", e)
+            raise
     
     def close_connection(self):
-        """Close database connection"""
-        if self.connection:
-            try:
-                self.connection.close()
-            except:
-                pass
-            self.connection = None
+        """Close all idle pooled connections"""
+        for pool in list(self.pools.values()) + list(self.shards.values()):
+            pool.close_all()
 
 # Global database connector instance
-db_connector = DatabaseConnector()
\ No newline at end of file
+db_connector = DatabaseConnector()
+
+def read_replica(f):
+    """Route the SELECTs of a read-only view to the replica when it is fresh enough"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+def lot_sharded(f):
+    """Route the queries of a view to the shard of its lot_id URL argument"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        with db_connector.lot_shard(kwargs.get('lot_id')):
+            return f(*args, **kwargs)
+    return decorated_function
\ No newline at end of file
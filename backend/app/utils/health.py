@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Background prober whose last results answer /health and /ready from memory
+
+    Every interval it checks database reachability with one SELECT 1,
+    samples the saturation of every pool partition, warms the registered
+    caches and records a heartbeat. Other background workers report their
+    own heartbeats so a stalled worker shows up as not ready.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._caches = {}          # name -> (is_warm callable, warm-up callable)
+        self._workers = {}         # name -> max seconds between heartbeats
+        self._heartbeats = {}      # name -> monotonic time of last heartbeat
+        self._state = {'database': {'status': 'unknown'}, 'pool': {}, 'checkedAt': None}
+        self._probed_at = None
+        self._probe_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register_cache(self, name, is_warm, warm=None):
+        self._caches[name] = (is_warm, warm)
+
+    def register_worker(self, name, max_silence_seconds):
+        """Track a background worker that must call heartbeat() at least every max_silence_seconds"""
+        self._workers[name] = max_silence_seconds
+        self._heartbeats.setdefault(name, time.monotonic())
+
+    def heartbeat(self, name):
+        self._heartbeats[name] = time.monotonic()
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.register_worker('health-prober', max(3 * self.interval, 15))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='health-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    self.probe()
+                except Exception as e:
+                    logger.exception("Health probe failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def probe(self):
+        """Run all checks once and publish the results"""
+        from .db_connector import db_connector
+
+        with self._probe_lock:
+            start = time.perf_counter()
+            try:
+                db_connector.execute_query("SELECT 1 as test")
+                database = {'status': 'connected', 'latencyMs': round((time.perf_counter() - start) * 1000, 3)}
+            except Exception as e:
+                database = {'status': 'disconnected', 'error': str(e)}
+
+            # Warm-up only makes sense with a reachable database
+            if database['status'] == 'connected':
+                for name, (is_warm, warm) in self._caches.items():
+                    if warm is None:
+                        continue
+                    try:
+                        warm()
+                    except Exception as e:
+                        logger.warning("Warming cache %s failed: %s", name, e)
+
+            replica = None
+            if db_connector.replica is not None and database['status'] == 'connected':
+                try:
+                    replica = db_connector.check_replica()
+                except Exception as e:
+                    logger.warning("Replica lag check failed: %s", e)
+
+            self._state = {
+                'database': database,
+                'replica': replica,
+                'pool': db_connector.pool_stats(),
+                'checkedAt': datetime.now()
+            }
+            self._probed_at = time.monotonic()
+            self.heartbeat('health-prober')
+
+    def _current_state(self):
+        # Without a running prober (e.g. in a CLI or test) probe inline, at most once per interval
+        running = self._thread is not None and self._thread.is_alive()
+        probed_at = self._probed_at
+        if not running and (probed_at is None or time.monotonic() - probed_at > self.interval):
+            self.probe()
+        return self._state
+
+    def liveness(self):
+        """
+        Process-level health: the prober thread has not died
+
+        Never waits on the database: a probe stuck on a slow or unreachable
+        database only stalls the prober's heartbeat, which fails readiness,
+        so an outage never gets every worker restarted. The database status
+        of the last probe is informational.
+        """
+        alive = self._thread is None or self._thread.is_alive()
+        state = self._state
+        return {
+            'status': 'healthy' if alive else 'unhealthy',
+            'database': state['database']['status'],
+            'checkedAt': state['checkedAt']
+        }, alive
+
+    def readiness(self):
+        """Whether this worker should receive traffic: database up, caches warm, workers alive"""
+        from .bulkhead import bulkheads
+
+        state = self._current_state()
+        caches = {name: bool(is_warm()) for name, (is_warm, _) in self._caches.items()}
+        workers = self._worker_status()
+        ready = (state['database']['status'] == 'connected'
+                 and all(caches.values())
+                 and all(worker['alive'] for worker in workers.values()))
+        return {
+            'status': 'ready' if ready else 'not_ready',
+            'database': state['database'],
+            'replica': state.get('replica'),
+            'pool': state['pool'],
+            'bulkheads': {name: bulkhead.stats() for name, bulkhead in bulkheads.items()},
+            'caches': caches,
+            'workers': workers,
+            'checkedAt': state['checkedAt']
+        }, ready
+
+    def _worker_status(self):
+        now = time.monotonic()
+        return {
+            name: {
+                'alive': now - self._heartbeats.get(name, 0) <= max_silence,
+                'lastHeartbeatSecondsAgo': round(now - self._heartbeats.get(name, 0), 1)
+            }
+            for name, max_silence in self._workers.items()
+        }
+
+
+# Global health monitor
+health_monitor = HealthMonitor()
+
+
+def init_app(app):
+    """Register the caches readiness waits for and start the background prober"""
+    from ..services.plate_index import plate_index
+    from ..services.tariff_cache import tariff_cache
+
+    health_monitor.interval = app.config.get('HEALTH_PROBE_INTERVAL', 5.0)
+    health_monitor.register_cache('activeVehicles', lambda: plate_index.is_warm, plate_index.ensure_loaded)
+    health_monitor.register_cache('tariffs', lambda: tariff_cache.is_warm, tariff_cache.ensure_loaded)
+
+    if app.config.get('HEALTH_PROBE_ENABLED', True):
+        health_monitor.start(app)
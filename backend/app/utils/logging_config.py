@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from flask.logging import default_handler
+from .metrics import registry
+
+LOG_RECORDS_DROPPED = registry.counter(
+    'log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+# Set (via extra=) on records whose call site already sampled them with sampled()
+PRESAMPLED = '_presampled'
+
+# Attributes every LogRecord has; anything else was passed via extra= and is a structured field
+_RESERVED_ATTRS = (frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None)))
+                   | {'message', 'asctime', PRESAMPLED})
+
+
+def _parse_mapping(value, convert):
+    """Parse 'logger.a=X,logger.b=Y' config strings into a dict"""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, setting = item.split('=', 1)
+        mapping[name.strip()] = convert(setting.strip())
+    return mapping
+
+
+def _match_logger(mapping, name):
+    """Longest configured logger prefix that covers name"""
+    best = None
+    for prefix in mapping:
+        if name == prefix or name.startswith(prefix + '.'):
+            if best is None or len(prefix) > len(best):
+                best = prefix
+    return best
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as text with key=value fields, or as one JSON object per line"""
+
+    def __init__(self, json_output=False):
+        super().__init__()
+        self.json_output = json_output
+
+    @staticmethod
+    def _fields(record):
+        return {k: v for k, v in vars(record).items() if k not in _RESERVED_ATTRS}
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')
+        message = record.getMessage()
+        fields = self._fields(record)
+
+        if self.json_output:
+            entry = {'ts': timestamp, 'level': record.levelname, 'logger': record.name, 'msg': message}
+            entry.update(fields)
+            if record.exc_info:
+                entry['exc'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+        line = f"{timestamp} {record.levelname} [{record.name}] {message}"
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v!r}" for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records for configured loggers"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def keep(self, name, levelno):
+        if levelno >= logging.WARNING or not self.rates:
+            return True
+        prefix = _match_logger(self.rates, name)
+        if prefix is None:
+            return True
+        return random.random() < self.rates[prefix]
+
+    def filter(self, record):
+        return getattr(record, PRESAMPLED, False) or self.keep(record.name, record.levelno)
+
+
+_sampling = SamplingFilter({})
+
+
+def sampled(logger, level=logging.DEBUG):
+    """
+    Whether a record would be logged, sampling included, decided before it is built
+
+    Hot call sites check this first so a dropped record costs neither its
+    message nor its extra fields; they pass {PRESAMPLED: True} in extra so
+    the record is not sampled a second time.
+    """
+    return logger.isEnabledFor(level) and _sampling.keep(logger.name, level)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to a background listener without formatting them
+
+    The stock QueueHandler formats the message on the calling thread so the
+    record can be pickled; our queue is in-process, so formatting is deferred
+    to the listener thread. When the queue is full the record is dropped
+    instead of blocking the request thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener = None
+
+
+def configure_logging(app):
+    """Route all logging through a bounded queue drained by a background thread"""
+    global _listener
+
+    config = app.config
+    formatter = StructuredFormatter(json_output=config.get('LOG_FORMAT', 'text') == 'json')
+
+    output_handlers = [logging.StreamHandler()]
+    if config.get('LOG_FILE'):
+        output_handlers.append(logging.FileHandler(config['LOG_FILE'], encoding='utf-8'))
+    for handler in output_handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.Queue(maxsize=config.get('LOG_QUEUE_SIZE', 10000))
+    _listener = QueueListener(log_queue, *output_handlers, respect_handler_level=True)
+    _listener.start()
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    _sampling.rates = _parse_mapping(config.get('LOG_SAMPLING'), float)
+    queue_handler.addFilter(_sampling)
+
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+
+    # Flask's own stderr handler would bypass the queue
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    for name, level in _parse_mapping(config.get('LOG_LEVELS'), str.upper).items():
+        logging.getLogger(name).setLevel(level)
+
+    atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    """Flush queued records on interpreter shutdown"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,274 @@
+import bisect
+import hmac
+import ipaddress
+import threading
+import time
+from flask import g, request, has_request_context
+
+# Latency buckets in seconds, tuned for gate/kiosk calls (ms) up to slow reports (s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class for labelled metrics"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide registry rendered in Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.metric_type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Global metrics registry
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint', ('endpoint', 'method'))
+REQUEST_COUNT = registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'method', 'status'))
+REQUEST_ERRORS = registry.counter(
+    'http_request_errors_total', 'HTTP requests that returned a 5xx status', ('endpoint', 'method'))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being processed')
+REQUEST_DB_TIME = registry.histogram(
+    'http_request_db_seconds', 'Time spent in the database per request', ('endpoint',))
+REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Database statements executed per request', ('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250))
+DB_QUERY_LATENCY = registry.histogram(
+    'db_query_duration_seconds', 'Database statement latency', ('operation',))
+
+
+def record_db_query(operation, duration):
+    """Account a database statement against the global histogram and the current request"""
+    DB_QUERY_LATENCY.observe(duration, operation=operation)
+    if has_request_context():
+        g.db_time = g.get('db_time', 0.0) + duration
+        g.db_queries = g.get('db_queries', 0) + 1
+
+
+def init_app(app):
+    """Register per-request metrics and profiling hooks on the app"""
+    from .profiler import request_profiler
+
+    request_profiler.max_profiles = app.config.get('PROFILER_MAX_PROFILES', 20)
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.db_time = 0.0
+        g.db_queries = 0
+        REQUESTS_IN_FLIGHT.inc()
+        request_profiler.start_request()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        duration = g.request_duration = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method
+        db_time = g.get('db_time', 0.0)
+        db_queries = g.get('db_queries', 0)
+
+        REQUEST_LATENCY.observe(duration, endpoint=endpoint, method=method)
+        REQUEST_COUNT.inc(endpoint=endpoint, method=method, status=str(response.status_code))
+        REQUEST_DB_TIME.observe(db_time, endpoint=endpoint)
+        REQUEST_DB_QUERIES.observe(db_queries, endpoint=endpoint)
+        if response.status_code >= 500:
+            REQUEST_ERRORS.inc(endpoint=endpoint, method=method)
+
+        # Lets browser dev tools show the Python vs SQL split of a single call
+        response.headers['Server-Timing'] = (
+            f'app;dur={(duration - db_time) * 1000:.1f}, '
+            f'db;dur={db_time * 1000:.1f};desc="{db_queries} queries"'
+        )
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        # after_request is skipped when a handler or another hook raises; the gauge and the
+        # profiler's single active slot must still be released
+        start = g.pop('request_start', None)
+        if start is None:
+            return
+        REQUESTS_IN_FLIGHT.dec()
+        duration = g.pop('request_duration', None)
+        if duration is None:
+            duration = time.perf_counter() - start
+        request_profiler.finish_request(request.endpoint or 'unmatched', duration,
+                                        g.get('db_time', 0.0), g.get('db_queries', 0))
+
+    token = app.config.get('METRICS_TOKEN')
+    # Without a token or allowlist only the local host may scrape
+    allowed = [ipaddress.ip_network(net.strip(), strict=False)
+               for net in (app.config.get('METRICS_ALLOWED_NETWORKS') or '').split(',') if net.strip()]
+    if not token and not allowed:
+        allowed = [ipaddress.ip_network('127.0.0.0/8'), ipaddress.ip_network('::1/128')]
+
+    def scrape_allowed():
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in allowed)
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint (bearer METRICS_TOKEN or an address in METRICS_ALLOWED_NETWORKS)"""
+        if not scrape_allowed():
+            return {'error': 'Forbidden'}, 403
+        return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -0,0 +1,130 @@
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask import g, request
+
+
+class RequestProfiler:
+    """
+    On-demand cProfile capture for individual requests
+
+    Admins arm the profiler either for the next N requests or for a sampled
+    fraction of traffic, optionally restricted to a path prefix. Captured
+    profiles are kept in memory (bounded) and can be downloaded in pstats
+    format for snakeviz / pstats, or viewed as a text summary.
+    """
+
+    def __init__(self, max_profiles=20):
+        self.max_profiles = max_profiles
+        self.remaining = 0
+        self.sample_rate = 0.0
+        self.path_prefix = None
+        self._profiles = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # cProfile hooks the interpreter globally, so only one request at a time
+        self._active = threading.Lock()
+
+    def configure(self, requests=0, sample_rate=0.0, path_prefix=None):
+        with self._lock:
+            self.remaining = max(0, int(requests))
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            self.path_prefix = path_prefix or None
+
+    def disable(self):
+        self.configure()
+
+    @property
+    def enabled(self):
+        return self.remaining > 0 or self.sample_rate > 0
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'remainingRequests': self.remaining,
+            'sampleRate': self.sample_rate,
+            'pathPrefix': self.path_prefix,
+            'maxProfiles': self.max_profiles
+        }
+
+    def _should_profile(self):
+        if not self.enabled:
+            return False
+        if self.path_prefix and not request.path.startswith(self.path_prefix):
+            return False
+        with self._lock:
+            if self.remaining > 0:
+                self.remaining -= 1
+                return True
+        return random.random() < self.sample_rate
+
+    def start_request(self):
+        if not self._should_profile() or not self._active.acquire(blocking=False):
+            return
+        profile = cProfile.Profile()
+        g.profile = profile
+        profile.enable()
+
+    def finish_request(self, endpoint, duration, db_time, db_queries):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        self._active.release()
+        profile.create_stats()
+
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles[profile_id] = {
+                'id': profile_id,
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'capturedAt': datetime.now(),
+                'durationMs': round(duration * 1000, 2),
+                'dbTimeMs': round(db_time * 1000, 2),
+                'dbQueries': db_queries,
+                'stats': marshal.dumps(profile.stats)
+            }
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def list_profiles(self):
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != 'stats'} for p in reversed(self._profiles.values())]
+
+    def get_profile(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+    @staticmethod
+    def format_text(profile, sort='cumulative', limit=50):
+        """Render a captured profile as a pstats text report"""
+        stream = io.StringIO()
+        stats = pstats.Stats(_MarshalledStats(profile['stats']), stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class _MarshalledStats:
+    """Adapter so pstats.Stats can load a marshalled stats dict from memory"""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+# Global profiler instance
+request_profiler = RequestProfiler()
@@ -0,0 +1,155 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from .metrics import registry
+
+QUERY_CACHE_LOOKUPS = registry.counter(
+    'query_cache_lookups_total', 'Query result cache lookups by result', ('result',))
+QUERY_CACHE_INVALIDATIONS = registry.counter(
+    'query_cache_invalidations_total', 'Query result cache entries dropped by table writes', ('table',))
+QUERY_CACHE_EVICTIONS = registry.counter(
+    'query_cache_evictions_total', 'Query result cache entries evicted to stay within the memory bound')
+
+# Tables whose rows are cached; a write to one of them invalidates every entry tagged with it
+CACHEABLE_TABLES = frozenset({'PARKING_LOT', 'TARIFF_RULE', 'ADMINS', 'ADMIN_LOT_ASSIGNMENTS'})
+
+_READ_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|DELETE|MERGE(?:\s+INTO)?)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+
+def read_tables(query):
+    return {name.upper() for name in _READ_TABLE_RE.findall(query)}
+
+
+def written_tables(query):
+    return {name.upper() for name in _WRITE_TABLE_RE.findall(query)}
+
+
+def _estimate_size(rows):
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row.values():
+            size += sys.getsizeof(value)
+    return size
+
+
+class QueryResultCache:
+    """
+    Opt-in, memory-bounded LRU cache of SELECT results tagged by table
+
+    Entries live for their statement's TTL at most and are dropped as soon
+    as this process writes to one of their tables; writes from other
+    workers are only bounded by the TTL.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, default_ttl=60):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.enabled = True
+        self._entries = OrderedDict()   # key -> (rows, expires_at, tags, size)
+        self._tags = {}                 # table -> set of keys
+        self._listeners = {}            # table -> callbacks run on invalidation
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query, params):
+        if isinstance(params, list):
+            params = tuple(params)
+        return query, params
+
+    def get(self, key):
+        """Copy of the cached rows for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                rows = entry[0]
+            else:
+                if entry is not None:
+                    self._remove(key)
+                self._misses += 1
+                rows = None
+        QUERY_CACHE_LOOKUPS.inc(result='hit' if rows is not None else 'miss')
+        # Callers may modify what they get back; never hand out the cached rows themselves
+        return [dict(row) for row in rows] if rows is not None else None
+
+    def put(self, key, rows, ttl=None, tags=None):
+        tags = frozenset(tags if tags is not None else read_tables(key[0]) & CACHEABLE_TABLES)
+        size = _estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        entry = ([dict(row) for row in rows], time.monotonic() + (ttl or self.default_ttl), tags, size)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                QUERY_CACHE_EVICTIONS.inc()
+
+    def invalidate(self, tables):
+        """Drop every entry tagged with one of tables and notify the listeners of those tables"""
+        tables = set(tables) & CACHEABLE_TABLES
+        if not tables:
+            return
+        with self._lock:
+            for table in tables:
+                keys = self._tags.pop(table, ())
+                for key in list(keys):
+                    self._remove(key)
+                if keys:
+                    QUERY_CACHE_INVALIDATIONS.inc(len(keys), table=table)
+        for table in tables:
+            for callback in self._listeners.get(table, ()):
+                callback()
+
+    def on_invalidate(self, table, callback):
+        """Run callback whenever a write through the connector touches table"""
+        listeners = self._listeners.setdefault(table.upper(), [])
+        if callback not in listeners:
+            listeners.append(callback)
+
+    def _remove(self, key):
+        rows, _, tags, size = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRatio': round(self._hits / lookups, 4) if lookups else None,
+                'tags': {tag: len(keys) for tag, keys in self._tags.items()}
+            }
+
+
+# Global query result cache
+query_cache = QueryResultCache()
@@ -0,0 +1,149 @@
+import functools
+import logging
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%s|%\(\w+\)s')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Endpoints tracked per fingerprint; beyond this they are folded into 'other'
+_MAX_ENDPOINTS = 20
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(query):
+    """
+    Normalize a statement so calls that differ only in literals share a key
+
+    String/numeric literals and driver placeholders become '?', IN lists
+    collapse to 'IN (...)', comments are dropped and whitespace is squeezed.
+    Statements are almost always the same string objects, so results are
+    memoized.
+    """
+    normalized = _COMMENT_RE.sub(' ', query)
+    normalized = _STRING_RE.sub('?', normalized)
+    normalized = _PARAM_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _IN_LIST_RE.sub('IN (...)', normalized)
+    return _WHITESPACE_RE.sub(' ', normalized).strip()
+
+
+class _QueryStat:
+    __slots__ = ('fingerprint', 'calls', 'total_time', 'max_time', 'rows', 'slow_calls',
+                 'endpoints', 'first_seen', 'last_seen')
+
+    def __init__(self, fingerprint_text):
+        self.fingerprint = fingerprint_text
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.slow_calls = 0
+        self.endpoints = Counter()
+        self.first_seen = datetime.now()
+        self.last_seen = self.first_seen
+
+    def to_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': self.calls,
+            'totalTimeMs': round(self.total_time * 1000, 2),
+            'meanTimeMs': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            'maxTimeMs': round(self.max_time * 1000, 2),
+            'rows': self.rows,
+            'meanRows': round(self.rows / self.calls, 2) if self.calls else 0,
+            'slowCalls': self.slow_calls,
+            'endpoints': dict(self.endpoints.most_common()),
+            'firstSeen': self.first_seen,
+            'lastSeen': self.last_seen
+        }
+
+
+class QueryStatistics:
+    """Per-fingerprint call counts and latency, plus the slow-query log"""
+
+    SORT_KEYS = {
+        'total': lambda s: s.total_time,
+        'mean': lambda s: s.total_time / s.calls if s.calls else 0,
+        'max': lambda s: s.max_time,
+        'calls': lambda s: s.calls,
+        'rows': lambda s: s.rows
+    }
+
+    def __init__(self, slow_threshold_ms=500, max_fingerprints=5000):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.max_fingerprints = max_fingerprints
+        self.dropped = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def configure(self, slow_threshold_ms=None, max_fingerprints=None):
+        if slow_threshold_ms is not None:
+            self.slow_threshold = slow_threshold_ms / 1000
+        if max_fingerprints is not None:
+            self.max_fingerprints = max_fingerprints
+
+    def record(self, query, params, duration, rows, endpoint):
+        key = fingerprint(query)
+        slow = duration >= self.slow_threshold
+
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    self.dropped += 1
+                    stat = None
+                else:
+                    stat = self._stats[key] = _QueryStat(key)
+            if stat is not None:
+                stat.calls += 1
+                stat.total_time += duration
+                stat.max_time = max(stat.max_time, duration)
+                stat.rows += rows if isinstance(rows, int) and rows > 0 else 0
+                stat.last_seen = datetime.now()
+                if slow:
+                    stat.slow_calls += 1
+                if endpoint in stat.endpoints or len(stat.endpoints) < _MAX_ENDPOINTS:
+                    stat.endpoints[endpoint] += 1
+                else:
+                    stat.endpoints['other'] += 1
+
+        if slow:
+            logger.warning(
+                "Slow query (%.1f ms, %s rows) from %s: %s", duration * 1000, rows, endpoint, key,
+                extra={'duration_ms': round(duration * 1000, 2), 'endpoint': endpoint,
+                       'fingerprint': key, 'params': params}
+            )
+
+    def top(self, limit=20, sort='total'):
+        sort_key = self.SORT_KEYS.get(sort, self.SORT_KEYS['total'])
+        with self._lock:
+            stats = sorted(self._stats.values(), key=sort_key, reverse=True)[:limit]
+            return [stat.to_dict() for stat in stats]
+
+    def summary(self):
+        with self._lock:
+            return {
+                'fingerprints': len(self._stats),
+                'totalCalls': sum(s.calls for s in self._stats.values()),
+                'totalTimeMs': round(sum(s.total_time for s in self._stats.values()) * 1000, 2),
+                'droppedFingerprints': self.dropped,
+                'slowThresholdMs': self.slow_threshold * 1000
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.dropped = 0
+
+
+# Global query statistics instance
+query_stats = QueryStatistics()
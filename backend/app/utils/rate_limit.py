@@ -0,0 +1,178 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+from .metrics import registry
+
+REQUESTS_REJECTED = registry.counter(
+    'http_requests_rejected_total', 'Requests rejected by rate limiting or load shedding',
+    ('reason', 'endpoint_class'))
+
+# Gate entry/exit is never limited or shed; everything else is classified by blueprint
+GATE_ENDPOINTS = frozenset({'hardware.vehicle_entry', 'hardware.vehicle_exit'})
+COUPON_ENDPOINTS = frozenset({'hardware.generate_coupon', 'kiosk.apply_discount'})
+
+# Shedding order under load: 'low' classes go at the soft limit, 'normal' ones at the hard limit
+CLASS_PRIORITY = {'coupon': 'low', 'admin': 'low', 'kiosk': 'normal', 'hardware': 'normal'}
+
+
+def endpoint_class(endpoint):
+    """Rate limit class of a Flask endpoint, or None for exempt traffic (gates, pages, health)"""
+    if endpoint is None or endpoint in GATE_ENDPOINTS:
+        return None
+    if endpoint in COUPON_ENDPOINTS:
+        return 'coupon'
+    blueprint = endpoint.partition('.')[0]
+    return blueprint if blueprint in CLASS_PRIORITY else None
+
+
+def parse_limits(value):
+    """Parse 'kiosk=5/20,coupon=1/5' (tokens per second / burst) into {class: (rate, burst)}"""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        name, setting = item.split('=', 1)
+        rate, _, burst = setting.partition('/')
+        rate = float(rate)
+        limits[name.strip()] = (rate, float(burst) if burst else max(rate, 1.0))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self, now):
+        """Consume one token; returns 0 on success or the seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class RateLimiter:
+    """
+    Per-client token buckets per endpoint class plus adaptive load shedding
+
+    Clients are identified by their address; X-Client-Id is only honoured
+    from trusted_addrs (e.g. a site gateway several kiosks share), since
+    anyone else could pick a fresh id per request. Shedding looks at this worker's in-flight requests and
+    the recent database pool wait: low-priority classes are shed at the
+    soft limits, all limited classes at the hard limits.
+    """
+
+    def __init__(self, limits=None, max_clients=10000):
+        self.limits = limits or {}
+        self.max_clients = max_clients
+        self.trusted_addrs = frozenset()
+        self.soft_in_flight = 32
+        self.hard_in_flight = 64
+        self.soft_pool_wait = 0.05
+        self.hard_pool_wait = 0.25
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire_slot(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def client_id(self, addr, header):
+        """Bucket key of a request: its address, or X-Client-Id when sent from a trusted address"""
+        if header and addr in self.trusted_addrs:
+            return f'{addr}/{header}'
+        return addr
+
+    def check_rate(self, client, klass):
+        """Seconds the client must wait before calling this class again (0 if allowed)"""
+        limit = self.limits.get(klass)
+        if limit is None:
+            return 0.0
+        key = (client, klass)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*limit)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(now)
+
+    def overload(self):
+        """'hard', 'soft' or None, from in-flight requests and database pool wait"""
+        from .db_connector import db_connector
+
+        pool_wait = db_connector.pool.recent_wait if db_connector.pool.waiting else 0.0
+        if self._in_flight >= self.hard_in_flight or pool_wait >= self.hard_pool_wait:
+            return 'hard'
+        if self._in_flight >= self.soft_in_flight or pool_wait >= self.soft_pool_wait:
+            return 'soft'
+        return None
+
+    def should_shed(self, klass):
+        level = self.overload()
+        if level is None:
+            return False
+        return level == 'hard' or CLASS_PRIORITY.get(klass) == 'low'
+
+
+# Global rate limiter
+rate_limiter = RateLimiter()
+
+
+def _reject(status, reason, klass, retry_after, message):
+    REQUESTS_REJECTED.inc(reason=reason, endpoint_class=klass)
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({'error': message, 'retryAfter': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_app(app):
+    """Rate limit and shed non-gate API traffic before it reaches the handlers"""
+    config = app.config
+    rate_limiter.limits = parse_limits(config.get('RATE_LIMITS'))
+    rate_limiter.trusted_addrs = frozenset(
+        addr.strip() for addr in (config.get('RATE_LIMIT_TRUSTED_ADDRS') or '').split(',') if addr.strip())
+    rate_limiter.soft_in_flight = config.get('SHED_SOFT_IN_FLIGHT', 32)
+    rate_limiter.hard_in_flight = config.get('SHED_HARD_IN_FLIGHT', 64)
+    rate_limiter.soft_pool_wait = config.get('SHED_SOFT_POOL_WAIT_MS', 50) / 1000
+    rate_limiter.hard_pool_wait = config.get('SHED_HARD_POOL_WAIT_MS', 250) / 1000
+
+    @app.before_request
+    def limit_request():
+        klass = endpoint_class(request.endpoint)
+        if klass is not None:
+            if rate_limiter.should_shed(klass):
+                return _reject(503, 'shed', klass, 2, 'Service busy, please retry shortly')
+            client = rate_limiter.client_id(request.remote_addr, request.headers.get('X-Client-Id'))
+            wait = rate_limiter.check_rate(client, klass)
+            if wait > 0:
+                return _reject(429, 'rate_limited', klass, wait, 'Too many requests')
+        rate_limiter.acquire_slot()
+        g.rate_limit_slot = True
+
+    @app.teardown_request
+    def release_request_slot(exc=None):
+        if g.pop('rate_limit_slot', False):
+            rate_limiter.release_slot()
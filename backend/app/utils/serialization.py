@@ -0,0 +1,100 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+from flask import request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - MessagePack is then simply not offered
+    msgpack = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def _default(o):
+    """Types neither encoder handles on its own; datetimes become ISO 8601 strings"""
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _wants_msgpack():
+    if msgpack is None or not has_request_context():
+        return False
+    accept = request.accept_mimetypes
+    best = accept.best_match(('application/json',) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES and accept[best] > accept['application/json']
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson (when installed) with MessagePack negotiation
+
+    Rows can be passed straight from the database: datetimes, dates and
+    times are written as ISO 8601 strings and tuples as arrays, so handlers
+    need not format each value. Clients sending Accept: application/msgpack
+    (gate controllers, internal services) get the same payload as
+    MessagePack from every jsonify() call.
+    """
+
+    default = staticmethod(_default)
+
+    def _orjson_option(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._orjson_option()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+
+        if _wants_msgpack():
+            body = msgpack.packb(obj, default=_default)
+            response = self._app.response_class(body, mimetype=MSGPACK_MIMETYPES[0])
+        else:
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            if orjson is not None:
+                body = orjson.dumps(obj, default=_default, option=self._orjson_option(indent)) + b'\n'
+            else:
+                body = json.dumps(
+                    obj, default=_default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                    **({'indent': 2} if indent else {'separators': (',', ':')})
+                ) + '\n'
+            response = self._app.response_class(body, mimetype=self.mimetype)
+
+        response.vary.add('Accept')
+        return response
+
+
+def init_app(app):
+    """Install the fast provider for every blueprint's jsonify()"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,298 @@
+import contextvars
+import functools
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_TRACE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_trace_id():
+    return f'{random.getrandbits(128):032x}'
+
+
+def _new_span_id():
+    return f'{random.getrandbits(64):016x}'
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'start_time', 'end_time',
+                 'attributes', 'status', 'error')
+
+    def __init__(self, trace_id, parent_id, name, kind='internal', attributes=None, start_time=None):
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time = None
+        self.attributes = attributes or {}
+        self.status = 'ok'
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        if self.end_time is None:
+            return None
+        return round((self.end_time - self.start_time) * 1000, 3)
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        self.status = 'error'
+        self.error = str(error)
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentId': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTime': self.start_time,
+            'durationMs': self.duration_ms,
+            'attributes': self.attributes,
+            'status': self.status,
+            'error': self.error
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent traces in memory for the admin trace API"""
+
+    def __init__(self, max_traces=1000):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span.to_dict())
+
+    def get_trace(self, trace_id):
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            return sorted(spans, key=lambda s: s['startTime']) if spans else None
+
+    def recent_traces(self, limit=50, min_duration_ms=0, name=None):
+        """Summaries of recent traces, newest first, keyed on their root span"""
+        summaries = []
+        with self._lock:
+            traces = list(reversed(self._traces.items()))
+        for trace_id, spans in traces:
+            root = next((s for s in spans if s['kind'] == 'server'), None) or spans[0]
+            if (root['durationMs'] or 0) < min_duration_ms:
+                continue
+            if name and name not in root['name']:
+                continue
+            summaries.append({
+                'traceId': trace_id,
+                'root': root['name'],
+                'startTime': root['startTime'],
+                'durationMs': root['durationMs'],
+                'spanCount': len(spans),
+                'dbTimeMs': round(sum(s['durationMs'] or 0 for s in spans if s['kind'] == 'client'), 3),
+                'status': 'error' if any(s['status'] == 'error' for s in spans) else 'ok'
+            })
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+class FileExporter:
+    """Appends finished spans as JSON lines from a background writer thread"""
+
+    def __init__(self, path, max_queue=10000):
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='trace-file-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            pass
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as output:
+            while True:
+                entry = self._queue.get()
+                output.write(json.dumps(entry, default=str, ensure_ascii=False) + '\n')
+                if self._queue.empty():
+                    output.flush()
+
+
+class Tracer:
+    """Minimal tracer: spans live in a context variable and are exported when they end"""
+
+    def __init__(self):
+        self.exporter = None
+        self.sample_rate = 1.0
+
+    def configure(self, exporter, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    @staticmethod
+    def current_span():
+        return _current_span.get()
+
+    def start_trace(self, name, traceparent=None, trace_id=None, attributes=None):
+        """
+        Begin a server span, continuing the caller's trace when one is supplied
+
+        Returns (span, token) or (None, None) when tracing is off or the
+        trace was not sampled; pass the token to end_span().
+        """
+        if not self.enabled:
+            return None, None
+
+        parent_id = None
+        match = _TRACEPARENT_RE.match((traceparent or '').strip().lower())
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            if not int(flags, 16) & 1:
+                return None, None
+        elif trace_id and _TRACE_ID_RE.match(trace_id.strip().lower()):
+            trace_id = trace_id.strip().lower()
+        else:
+            if random.random() >= self.sample_rate:
+                return None, None
+            trace_id = _new_trace_id()
+
+        span = Span(trace_id, parent_id, name, kind='server', attributes=attributes)
+        return span, _current_span.set(span)
+
+    def end_span(self, span, token=None):
+        span.end_time = time.time()
+        if token is not None:
+            _current_span.reset(token)
+        self.exporter.export(span)
+
+    @contextmanager
+    def start_span(self, name, kind='internal', **attributes):
+        """Child span of the current span; a no-op outside a sampled trace"""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            yield None
+            return
+
+        span = Span(parent.trace_id, parent.span_id, name, kind=kind, attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            self.end_span(span, token)
+
+    def record_span(self, name, duration, kind='internal', error=None, **attributes):
+        """Export an already-finished child span that ended just now"""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            return
+        end_time = time.time()
+        span = Span(parent.trace_id, parent.span_id, name, kind=kind, attributes=attributes,
+                    start_time=end_time - duration)
+        if error is not None:
+            span.record_error(error)
+        span.end_time = end_time
+        self.exporter.export(span)
+
+
+# Global tracer instance
+tracer = Tracer()
+
+
+def traced(func):
+    """Wrap a function in a span named after its qualified name"""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return func(*args, **kwargs)
+        with tracer.start_span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app):
+    """Configure the exporter and open a server span around every request"""
+    exporter_name = app.config.get('TRACE_EXPORTER', 'memory')
+    if exporter_name == 'memory':
+        exporter = InMemoryExporter(app.config.get('TRACE_MEMORY_MAX_TRACES', 1000))
+    elif exporter_name == 'file':
+        exporter = FileExporter(app.config.get('TRACE_FILE', 'traces.jsonl'))
+    else:
+        exporter = None
+    tracer.configure(exporter, app.config.get('TRACE_SAMPLE_RATE', 1.0))
+
+    if exporter is None:
+        return
+
+    @app.before_request
+    def start_request_span():
+        span, token = tracer.start_trace(
+            request.endpoint or 'unmatched',
+            traceparent=request.headers.get('traceparent'),
+            trace_id=request.headers.get('X-Trace-Id'),
+            attributes={
+                'http.method': request.method,
+                'http.route': request.url_rule.rule if request.url_rule else request.path,
+                'client.id': request.headers.get('X-Client-Id') or request.remote_addr
+            }
+        )
+        if span is not None:
+            g.trace_span = span
+            g.trace_token = token
+
+    @app.after_request
+    def finish_request_span(response):
+        span = g.pop('trace_span', None)
+        if span is None:
+            return response
+        span.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.status = 'error'
+        tracer.end_span(span, g.pop('trace_token', None))
+        # Echo the context so gate controllers can correlate with their own timing
+        response.headers['traceparent'] = span.traceparent
+        response.headers['X-Trace-Id'] = span.trace_id
+        return response
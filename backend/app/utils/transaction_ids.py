@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the process ID for the worker slot
+    fcntl = None
+
+# Milliseconds are counted from 2024-01-01 UTC; 41 bits last until 2093
+EPOCH_MS = 1704067200000
+
+TIMESTAMP_BITS = 41
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+NODE_BITS = 5                       # high half of the worker ID (host), the low half is a local slot
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MAX_WORKER = (1 << WORKER_BITS) - 1
+SLOTS_PER_NODE = 1 << (WORKER_BITS - NODE_BITS)
+
+# Crockford base32: digits then letters, so fixed-width strings sort like the numbers they encode
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_WIDTH = 13
+
+
+def _encode(value):
+    chars = []
+    for _ in range(_WIDTH):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class TransactionIdGenerator:
+    """
+    Time-ordered unique IDs for PAYMENT_RECORD.TransactionID
+
+    Each ID packs a millisecond timestamp, a worker ID and a per-millisecond
+    sequence (41/10/12 bits) into 13 base32 characters after the prefix,
+    e.g. TXN0A91WQ5Q80000. New IDs sort after older ones, so inserts stay at
+    the right edge of idx_transaction_id, and no database round trip is
+    needed. The worker ID is TXN_WORKER_ID when configured; otherwise it is
+    TXN_NODE_ID (one per host) combined with a slot the process claims with
+    an exclusive lock file, so processes on one host never share it.
+    """
+
+    def __init__(self, worker_id=None, node_id=0, lock_dir=None):
+        self.worker_id = worker_id
+        self.node_id = node_id
+        self.lock_dir = lock_dir or tempfile.gettempdir()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._slot_file = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def configure(self, worker_id=None, node_id=0, lock_dir=None):
+        with self._lock:
+            self.worker_id = worker_id
+            self.node_id = node_id
+            if lock_dir:
+                self.lock_dir = lock_dir
+            self._pid = None
+
+    def next_id(self, prefix='TXN'):
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked worker that must not reuse its parent's slot
+                self._worker = self._claim_worker()
+                self._pid = os.getpid()
+                self._last_ms, self._sequence = 0, 0
+
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms, self._sequence = now_ms, 0
+            elif self._sequence < MAX_SEQUENCE:
+                # Same millisecond, or the clock stepped back: keep counting from the last timestamp
+                self._sequence += 1
+            else:
+                # Sequence exhausted: borrow the next millisecond rather than wait for it
+                self._last_ms, self._sequence = self._last_ms + 1, 0
+
+            value = (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker << SEQUENCE_BITS) | self._sequence
+        return f'{prefix}{_encode(value)}'
+
+    def _claim_worker(self):
+        if self.worker_id is not None:
+            if not 0 <= self.worker_id <= MAX_WORKER:
+                raise ValueError(f'TXN_WORKER_ID must be between 0 and {MAX_WORKER}')
+            return self.worker_id
+        if not 0 <= self.node_id < (1 << NODE_BITS):
+            raise ValueError(f'TXN_NODE_ID must be between 0 and {(1 << NODE_BITS) - 1}')
+        return (self.node_id << (WORKER_BITS - NODE_BITS)) | self._claim_slot()
+
+    def _claim_slot(self):
+        """Hold an exclusive lock on one of SLOTS_PER_NODE files for the life of the process"""
+        if self._slot_file is not None:
+            self._slot_file.close()
+            self._slot_file = None
+        if fcntl is None:
+            return os.getpid() % SLOTS_PER_NODE
+        for slot in range(SLOTS_PER_NODE):
+            handle = open(os.path.join(self.lock_dir, f'parking-txn-worker-{self.node_id}-{slot}.lock'), 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                continue
+            self._slot_file = handle
+            return slot
+        raise RuntimeError(f'All {SLOTS_PER_NODE} transaction ID worker slots on this host are in use')
+
+
+def decode(transaction_id):
+    """(created at, worker ID, sequence) of an ID from this generator"""
+    value = 0
+    for char in transaction_id[-_WIDTH:]:
+        value = value * 32 + _ALPHABET.index(char)
+    sequence = value & MAX_SEQUENCE
+    worker = (value >> SEQUENCE_BITS) & MAX_WORKER
+    timestamp_ms = (value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    return datetime.fromtimestamp(timestamp_ms / 1000), worker, sequence
+
+
+# Global transaction ID generator
+transaction_ids = TransactionIdGenerator()
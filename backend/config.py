@@ -21,6 +21,138 @@ class Config:
     # For Docker connections, include port if not default
     if DB_PORT != '1433':
         DATABASE_URI = f"mssql+pymssql://{DB_USERNAME}:{DB_PASSWORD}@{DB_SERVER}:{DB_PORT}/{DB_DATABASE}"
+    
+    # Connection pool shared by request and background threads
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 4)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    DB_POOL_PING_IDLE_SECONDS = float(os.environ.get('DB_POOL_PING_IDLE_SECONDS') or 30)
+    # Dedicated pool partitions ("name=size/checkout timeout seconds"): 'gate' is gate
+    # entry/exit, the others are blueprints; other routes and background threads use
+    # the default pool above
+    DB_POOL_PARTITIONS = os.environ.get('DB_POOL_PARTITIONS') or 'gate=4/5,hardware=4/2,kiosk=4/5,admin=3/15'
+    
+    # Bulkheads per partition as above ("name=max concurrent/max queued/queue timeout seconds")
+    BULKHEADS = os.environ.get('BULKHEADS') or 'gate=16/64/5,hardware=8/16/2,kiosk=8/16/5,admin=4/8/15'
+    
+    # Optional read-only replica for admin reporting / listing SELECTs (unset = primary only).
+    # Credentials default to the primary's; a second local database can stand in for tests
+    # (set REPLICA_MAX_STALENESS_SECONDS=0 there, it never replays the lag heartbeat)
+    REPLICA_DB_SERVER = os.environ.get('REPLICA_DB_SERVER')
+    REPLICA_DB_PORT = os.environ.get('REPLICA_DB_PORT')
+    REPLICA_DB_DATABASE = os.environ.get('REPLICA_DB_DATABASE')
+    REPLICA_DB_USERNAME = os.environ.get('REPLICA_DB_USERNAME')
+    REPLICA_DB_PASSWORD = os.environ.get('REPLICA_DB_PASSWORD')
+    REPLICA_POOL_SIZE = int(os.environ.get('REPLICA_POOL_SIZE') or 4)
+    REPLICA_POOL_TIMEOUT = float(os.environ.get('REPLICA_POOL_TIMEOUT') or 2)
+    REPLICA_MAX_STALENESS_SECONDS = float(os.environ.get('REPLICA_MAX_STALENESS_SECONDS') or 30)
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS') or 30)
+    
+    # Optional lot shards for PARKING_RECORD / PAYMENT_RECORD / DISCOUNT data (unset = primary only).
+    # DB_SHARDS: "name=server[:port]/database,..."; blank parts and the credentials are the primary's,
+    # so separate local databases can stand in for shards. DB_SHARD_MAP: "1-100=east,101-200=west";
+    # lots it does not list stay on the primary. Fan-out queries wait DB_SHARD_TIMEOUT per shard
+    DB_SHARDS = os.environ.get('DB_SHARDS')
+    DB_SHARD_MAP = os.environ.get('DB_SHARD_MAP')
+    DB_SHARD_POOL_SIZE = int(os.environ.get('DB_SHARD_POOL_SIZE') or 4)
+    DB_SHARD_TIMEOUT = float(os.environ.get('DB_SHARD_TIMEOUT') or 5)
+    DB_FANOUT_WORKERS = int(os.environ.get('DB_FANOUT_WORKERS') or 8)
+    
+    # Observability: Prometheus metrics at /metrics and on-demand request profiling
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() == 'true'
+    # /metrics answers a "Bearer METRICS_TOKEN" header or scrapers in METRICS_ALLOWED_NETWORKS
+    # (comma-separated addresses / CIDRs); with neither set, only localhost
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_NETWORKS = os.environ.get('METRICS_ALLOWED_NETWORKS') or ''
+    PROFILER_MAX_PROFILES = int(os.environ.get('PROFILER_MAX_PROFILES') or 20)
+    
+    # Logging goes through a bounded in-memory queue drained by a background thread.
+    # LOG_LEVELS / LOG_SAMPLING take "logger=value" pairs, e.g.
+    # LOG_LEVELS="app.utils.db_connector=DEBUG" LOG_SAMPLING="app.utils.db_connector=0.05"
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_LEVELS = os.environ.get('LOG_LEVELS') or ''
+    LOG_SAMPLING = os.environ.get('LOG_SAMPLING') or ''
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'text'  # 'text' or 'json'
+    LOG_FILE = os.environ.get('LOG_FILE') or ''
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000)
+    
+    # Statements slower than this are logged by the slow-query log
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 500)
+    QUERY_STATS_MAX_FINGERPRINTS = int(os.environ.get('QUERY_STATS_MAX_FINGERPRINTS') or 5000)
+    
+    # Opt-in SELECT result cache (statements pass cache_ttl); writes to PARKING_LOT,
+    # ADMINS or ADMIN_LOT_ASSIGNMENTS through the connector invalidate dependent entries
+    QUERY_CACHE_ENABLED = (os.environ.get('QUERY_CACHE_ENABLED') or 'true').lower() == 'true'
+    QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES') or 8 * 1024 * 1024)
+    QUERY_CACHE_DEFAULT_TTL = float(os.environ.get('QUERY_CACHE_DEFAULT_TTL') or 60)
+    
+    # Request tracing (handler, service and DB spans). Gates/kiosks may send a W3C
+    # traceparent or X-Trace-Id header. TRACE_EXPORTER: 'memory', 'file' or 'none'
+    TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER') or 'memory'
+    TRACE_FILE = os.environ.get('TRACE_FILE') or 'traces.jsonl'
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE') or 1.0)
+    TRACE_MEMORY_MAX_TRACES = int(os.environ.get('TRACE_MEMORY_MAX_TRACES') or 1000)
+    
+    # In-memory fuzzy/prefix plate index; full reload interval picks up other workers' changes
+    PLATE_INDEX_REFRESH_SECONDS = int(os.environ.get('PLATE_INDEX_REFRESH_SECONDS') or 300)
+    
+    # Lifetime of kiosk fee quotes (status -> fee -> discount -> pay)
+    KIOSK_QUOTE_TTL_SECONDS = int(os.environ.get('KIOSK_QUOTE_TTL_SECONDS') or 120)
+    
+    # Upper bound on serving a cached fee (fees are otherwise reused until they next change)
+    FEE_CACHE_MAX_AGE_SECONDS = int(os.environ.get('FEE_CACHE_MAX_AGE_SECONDS') or 3600)
+    
+    # Static asset build (flask build-assets) and on-the-fly gzip of API responses
+    ASSET_BUILD_FOLDER = os.environ.get('ASSET_BUILD_FOLDER')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 1024)
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL') or 6)
+    
+    # Background health prober behind /health and /ready, and lot/tariff cache refresh
+    HEALTH_PROBE_ENABLED = (os.environ.get('HEALTH_PROBE_ENABLED') or 'true').lower() == 'true'
+    HEALTH_PROBE_INTERVAL = float(os.environ.get('HEALTH_PROBE_INTERVAL') or 5)
+    TARIFF_CACHE_REFRESH_SECONDS = int(os.environ.get('TARIFF_CACHE_REFRESH_SECONDS') or 300)
+    # Lot / tariff writes by other workers are picked up within this many seconds
+    # (one MAX(UpdatedAt) probe of PARKING_LOT per interval and worker)
+    TARIFF_VERSION_CHECK_SECONDS = float(os.environ.get('TARIFF_VERSION_CHECK_SECONDS') or 5)
+    
+    # In-memory occupancy history (minute / 15-minute / hourly rings per lot), saved to
+    # OCCUPANCY_HISTORY_FILE every OCCUPANCY_PERSIST_SECONDS and reloaded on start
+    OCCUPANCY_HISTORY_ENABLED = (os.environ.get('OCCUPANCY_HISTORY_ENABLED') or 'true').lower() == 'true'
+    OCCUPANCY_SAMPLE_SECONDS = int(os.environ.get('OCCUPANCY_SAMPLE_SECONDS') or 60)
+    OCCUPANCY_PERSIST_SECONDS = int(os.environ.get('OCCUPANCY_PERSIST_SECONDS') or 300)
+    OCCUPANCY_HISTORY_FILE = os.environ.get('OCCUPANCY_HISTORY_FILE') or 'occupancy_history.json'
+    
+    # Heatmap / dwell / turnover reports: loaded intervals cached per lot and date range,
+    # ANALYTICS_OPEN_TTL seconds for ranges that include today, ANALYTICS_CLOSED_TTL otherwise
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES') or 64)
+    ANALYTICS_OPEN_TTL = int(os.environ.get('ANALYTICS_OPEN_TTL') or 60)
+    ANALYTICS_CLOSED_TTL = int(os.environ.get('ANALYTICS_CLOSED_TTL') or 3600)
+    
+    # Write-behind audit log: events are queued and inserted into AUDIT_LOG in batches; when the
+    # queue stays full for AUDIT_BLOCK_SECONDS or the database fails they go to AUDIT_FALLBACK_FILE
+    AUDIT_WRITER_ENABLED = (os.environ.get('AUDIT_WRITER_ENABLED') or 'true').lower() == 'true'
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE') or 10000)
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE') or 500)
+    AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS') or 2)
+    AUDIT_BLOCK_SECONDS = float(os.environ.get('AUDIT_BLOCK_SECONDS') or 0.2)
+    AUDIT_FALLBACK_FILE = os.environ.get('AUDIT_FALLBACK_FILE') or 'audit_log.fallback.jsonl'
+    
+    # Payment transaction IDs: a fixed TXN_WORKER_ID (0-1023) per process, or TXN_NODE_ID (0-31,
+    # distinct per host) plus a per-process slot claimed with a lock file in TXN_LOCK_DIR
+    TXN_WORKER_ID = int(os.environ['TXN_WORKER_ID']) if os.environ.get('TXN_WORKER_ID') else None
+    TXN_NODE_ID = int(os.environ.get('TXN_NODE_ID') or 0)
+    TXN_LOCK_DIR = os.environ.get('TXN_LOCK_DIR') or None
+    
+    # Per-client token buckets per endpoint class ("class=tokens per second/burst") and load
+    # shedding thresholds; gate entry/exit is never limited or shed
+    RATE_LIMIT_ENABLED = (os.environ.get('RATE_LIMIT_ENABLED') or 'true').lower() == 'true'
+    RATE_LIMITS = os.environ.get('RATE_LIMITS') or 'kiosk=5/20,hardware=10/30,admin=20/60,coupon=1/5'
+    # Clients are keyed by address; X-Client-Id only splits buckets for these comma-separated
+    # addresses (e.g. a site gateway in front of several kiosks)
+    RATE_LIMIT_TRUSTED_ADDRS = os.environ.get('RATE_LIMIT_TRUSTED_ADDRS') or ''
+    SHED_SOFT_IN_FLIGHT = int(os.environ.get('SHED_SOFT_IN_FLIGHT') or 32)
+    SHED_HARD_IN_FLIGHT = int(os.environ.get('SHED_HARD_IN_FLIGHT') or 64)
+    SHED_SOFT_POOL_WAIT_MS = float(os.environ.get('SHED_SOFT_POOL_WAIT_MS') or 50)
+    SHED_HARD_POOL_WAIT_MS = float(os.environ.get('SHED_HARD_POOL_WAIT_MS') or 250)
 
 class DevelopmentConfig(Config):
     DEBUG = True
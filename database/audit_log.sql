@@ -0,0 +1,29 @@
+-- 管理員操作稽核紀錄
+-- 手動標記付款、強制出場、停車場/費率與管理員帳號異動由應用程式非同步批次寫入；僅新增不修改。
+USE ParkingLot;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'AUDIT_LOG')
+BEGIN
+    CREATE TABLE AUDIT_LOG (
+        AuditID BIGINT IDENTITY(1,1) PRIMARY KEY,
+        OccurredAt DATETIME2 NOT NULL,
+        AdminID INT NULL,
+        Username NVARCHAR(50) NULL,
+        Action NVARCHAR(50) NOT NULL,
+        TargetType NVARCHAR(30) NOT NULL,
+        TargetID NVARCHAR(50) NULL,
+        ParkingLotID INT NULL,
+        Details NVARCHAR(MAX) NULL,
+        ClientIP NVARCHAR(45) NULL
+    );
+    CREATE INDEX idx_audit_occurred ON AUDIT_LOG(OccurredAt);
+    CREATE INDEX idx_audit_admin ON AUDIT_LOG(AdminID, AuditID);
+    CREATE INDEX idx_audit_target ON AUDIT_LOG(TargetType, TargetID, AuditID);
+    CREATE INDEX idx_audit_lot ON AUDIT_LOG(ParkingLotID, AuditID);
+    CREATE INDEX idx_audit_action ON AUDIT_LOG(Action, AuditID);
+    PRINT '✅ AUDIT_LOG 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ AUDIT_LOG 資料表已存在';
+GO
@@ -16,6 +16,12 @@ IF OBJECT_ID('vw_current_parking', 'V') IS NOT NULL DROP VIEW vw_current_parking
 IF OBJECT_ID('vw_daily_revenue', 'V') IS NOT NULL DROP VIEW vw_daily_revenue;
 
 -- Drop tables in correct order (foreign key dependencies)
+IF OBJECT_ID('AUDIT_LOG', 'U') IS NOT NULL DROP TABLE AUDIT_LOG;
+IF OBJECT_ID('RECONCILIATION_DISCREPANCY', 'U') IS NOT NULL DROP TABLE RECONCILIATION_DISCREPANCY;
+IF OBJECT_ID('RECONCILIATION_DAY', 'U') IS NOT NULL DROP TABLE RECONCILIATION_DAY;
+IF OBJECT_ID('RECONCILIATION_STATE', 'U') IS NOT NULL DROP TABLE RECONCILIATION_STATE;
+IF OBJECT_ID('TARIFF_RULE', 'U') IS NOT NULL DROP TABLE TARIFF_RULE;
+IF OBJECT_ID('REPLICA_HEARTBEAT', 'U') IS NOT NULL DROP TABLE REPLICA_HEARTBEAT;
 IF OBJECT_ID('PAYMENT_RECORD', 'U') IS NOT NULL DROP TABLE PAYMENT_RECORD;
 IF OBJECT_ID('DISCOUNT', 'U') IS NOT NULL DROP TABLE DISCOUNT;
 IF OBJECT_ID('PARKING_RECORD', 'U') IS NOT NULL DROP TABLE PARKING_RECORD;
@@ -109,6 +115,69 @@ CREATE TABLE PAYMENT_RECORD (
     FOREIGN KEY (RecordID) REFERENCES PARKING_RECORD(RecordID)
 );
 
+-- 7. Replica Heartbeat Table (read replica lag measurement)
+CREATE TABLE REPLICA_HEARTBEAT (
+    HeartbeatID TINYINT PRIMARY KEY CHECK (HeartbeatID = 1),
+    BeatAt DATETIME2 NOT NULL
+);
+
+-- 8. Payment Reconciliation Tables (TotalFee vs. PAYMENT_RECORD, per lot and entry date)
+CREATE TABLE RECONCILIATION_STATE (
+    StateID TINYINT PRIMARY KEY CHECK (StateID = 1),
+    LastRecordID INT NOT NULL, -- High-water marks of the last incremental run
+    LastPaymentID INT NOT NULL,
+    RunAt DATETIME2 NOT NULL
+);
+
+CREATE TABLE RECONCILIATION_DAY (
+    ParkingLotID INT NOT NULL,
+    EntryDate DATE NOT NULL,
+    Records INT NOT NULL,
+    FeeTotal BIGINT NOT NULL,
+    PaidTotal BIGINT NOT NULL,
+    Discrepancies INT NOT NULL,
+    Checksum BIGINT NOT NULL, -- Order-independent hash of (RecordID, TotalFee, paid) for the day
+    CheckedAt DATETIME2 NOT NULL,
+    PRIMARY KEY (ParkingLotID, EntryDate)
+);
+
+CREATE TABLE RECONCILIATION_DISCREPANCY (
+    RecordID INT PRIMARY KEY,
+    ParkingLotID INT NOT NULL,
+    EntryDate DATE NOT NULL,
+    TotalFee INT NULL,
+    PaidTotal INT NOT NULL,
+    Payments INT NOT NULL,
+    CheckedAt DATETIME2 NOT NULL
+);
+
+-- 9. Tariff Rule Table (time-of-day / weekday rates; uncovered hours use PARKING_LOT.HourlyRate)
+CREATE TABLE TARIFF_RULE (
+    RuleID INT IDENTITY(1,1) PRIMARY KEY,
+    ParkingLotID INT NOT NULL,
+    DaysMask TINYINT NOT NULL CHECK (DaysMask BETWEEN 1 AND 127), -- bit 0: Monday ... bit 6: Sunday
+    StartMinute SMALLINT NOT NULL CHECK (StartMinute BETWEEN 0 AND 1439),
+    EndMinute SMALLINT NOT NULL CHECK (EndMinute BETWEEN 0 AND 1439), -- At or before StartMinute: runs past midnight
+    RateType NVARCHAR(10) NOT NULL CHECK (RateType IN ('hourly', 'flat')), -- 'flat': one charge per window
+    Rate INT NOT NULL CHECK (Rate >= 0),
+    Priority INT NOT NULL DEFAULT 0, -- Higher priority wins where rules overlap
+    FOREIGN KEY (ParkingLotID) REFERENCES PARKING_LOT(ParkingLotID) ON DELETE CASCADE
+);
+
+-- 10. Audit Log Table (append-only; written in batches by the application)
+CREATE TABLE AUDIT_LOG (
+    AuditID BIGINT IDENTITY(1,1) PRIMARY KEY,
+    OccurredAt DATETIME2 NOT NULL,
+    AdminID INT NULL, -- No foreign key: entries outlive deleted admins
+    Username NVARCHAR(50) NULL,
+    Action NVARCHAR(50) NOT NULL, -- e.g. 'record.mark_paid', 'admin.update'
+    TargetType NVARCHAR(30) NOT NULL,
+    TargetID NVARCHAR(50) NULL,
+    ParkingLotID INT NULL,
+    Details NVARCHAR(MAX) NULL, -- JSON
+    ClientIP NVARCHAR(45) NULL
+);
+
 -- ================================================
 -- Indexes for Performance
 -- ================================================
@@ -119,6 +188,8 @@ CREATE INDEX idx_parking_lot_entry_time ON PARKING_RECORD(ParkingLotID, EntryTim
 CREATE INDEX idx_entry_time ON PARKING_RECORD(EntryTime);
 CREATE INDEX idx_exit_time ON PARKING_RECORD(ExitTime);
 CREATE INDEX idx_active_records ON PARKING_RECORD(ParkingLotID, ExitTime) WHERE ExitTime IS NULL;
+-- One active record per vehicle per lot; gate entry relies on this instead of a prior SELECT
+CREATE UNIQUE INDEX idx_unique_active_vehicle ON PARKING_RECORD(VehicleNumber, ParkingLotID) INCLUDE (PaidUntilTime) WHERE ExitTime IS NULL;
 
 -- Discount Indexes
 CREATE INDEX idx_discount_code ON DISCOUNT(Code);
@@ -131,6 +202,19 @@ CREATE INDEX idx_payment_record ON PAYMENT_RECORD(RecordID);
 CREATE INDEX idx_payment_time ON PAYMENT_RECORD(PaymentTime);
 CREATE INDEX idx_transaction_id ON PAYMENT_RECORD(TransactionID);
 
+-- Tariff Rule Indexes
+CREATE INDEX idx_tariff_rule_lot ON TARIFF_RULE(ParkingLotID);
+
+-- Reconciliation Indexes
+CREATE INDEX idx_reconciliation_discrepancy_day ON RECONCILIATION_DISCREPANCY(ParkingLotID, EntryDate);
+
+-- Audit Log Indexes (keyset pages are ordered by AuditID)
+CREATE INDEX idx_audit_occurred ON AUDIT_LOG(OccurredAt);
+CREATE INDEX idx_audit_admin ON AUDIT_LOG(AdminID, AuditID);
+CREATE INDEX idx_audit_target ON AUDIT_LOG(TargetType, TargetID, AuditID);
+CREATE INDEX idx_audit_lot ON AUDIT_LOG(ParkingLotID, AuditID);
+CREATE INDEX idx_audit_action ON AUDIT_LOG(Action, AuditID);
+
 -- Admin Indexes
 CREATE INDEX idx_admin_username ON ADMINS(Username);
 CREATE INDEX idx_admin_role ON ADMINS(RoleLevel, IsActive);
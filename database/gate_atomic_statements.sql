@@ -0,0 +1,25 @@
+-- 閘門單一語句交易 (entry / exit)
+-- 進場改為 insert-if-absent，重複進場由篩選唯一索引擋下並回傳 409；
+-- 舊的 tr_prevent_duplicate_entry 觸發器重複了同一檢查，移除以減少每次進場的額外查詢。
+USE ParkingLot;
+GO
+
+-- 1. 移除重複檢查觸發器
+IF EXISTS (SELECT * FROM sys.triggers WHERE name = 'tr_prevent_duplicate_entry')
+    DROP TRIGGER tr_prevent_duplicate_entry;
+GO
+
+-- 2. 確保篩選唯一索引存在 (同一停車場同一車牌只能有一筆未離場記錄)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'idx_unique_active_vehicle')
+BEGIN
+    CREATE UNIQUE INDEX idx_unique_active_vehicle
+    ON PARKING_RECORD (VehicleNumber, ParkingLotID)
+    INCLUDE (PaidUntilTime)
+    WHERE ExitTime IS NULL;
+    PRINT '✅ 唯一索引 idx_unique_active_vehicle 建立成功';
+END
+ELSE
+    PRINT 'ℹ️ 唯一索引 idx_unique_active_vehicle 已存在';
+GO
+
+PRINT '✅ 閘門單一語句交易所需的結構調整完成';
@@ -0,0 +1,56 @@
+-- 付款對帳結果
+-- 對帳工作比對 PARKING_RECORD.TotalFee 與 PAYMENT_RECORD 付款總和，
+-- 依停車場/入場日期保存彙總、總和檢查碼與差異明細；高水位標記讓每晚只處理新資料。
+USE ParkingLot;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'RECONCILIATION_STATE')
+BEGIN
+    CREATE TABLE RECONCILIATION_STATE (
+        StateID TINYINT PRIMARY KEY CHECK (StateID = 1),
+        LastRecordID INT NOT NULL,
+        LastPaymentID INT NOT NULL,
+        RunAt DATETIME2 NOT NULL
+    );
+    PRINT '✅ RECONCILIATION_STATE 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ RECONCILIATION_STATE 資料表已存在';
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'RECONCILIATION_DAY')
+BEGIN
+    CREATE TABLE RECONCILIATION_DAY (
+        ParkingLotID INT NOT NULL,
+        EntryDate DATE NOT NULL,
+        Records INT NOT NULL,
+        FeeTotal BIGINT NOT NULL,
+        PaidTotal BIGINT NOT NULL,
+        Discrepancies INT NOT NULL,
+        Checksum BIGINT NOT NULL,
+        CheckedAt DATETIME2 NOT NULL,
+        PRIMARY KEY (ParkingLotID, EntryDate)
+    );
+    PRINT '✅ RECONCILIATION_DAY 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ RECONCILIATION_DAY 資料表已存在';
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'RECONCILIATION_DISCREPANCY')
+BEGIN
+    CREATE TABLE RECONCILIATION_DISCREPANCY (
+        RecordID INT PRIMARY KEY,
+        ParkingLotID INT NOT NULL,
+        EntryDate DATE NOT NULL,
+        TotalFee INT NULL,
+        PaidTotal INT NOT NULL,
+        Payments INT NOT NULL,
+        CheckedAt DATETIME2 NOT NULL
+    );
+    CREATE INDEX idx_reconciliation_discrepancy_day ON RECONCILIATION_DISCREPANCY(ParkingLotID, EntryDate);
+    PRINT '✅ RECONCILIATION_DISCREPANCY 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ RECONCILIATION_DISCREPANCY 資料表已存在';
+GO
@@ -0,0 +1,17 @@
+-- 唯讀副本延遲量測
+-- 主資料庫定期寫入心跳時間，應用程式從副本讀回同一列以計算複寫延遲；
+-- 超過 REPLICA_MAX_STALENESS_SECONDS 時報表查詢自動改回主資料庫。
+USE ParkingLot;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'REPLICA_HEARTBEAT')
+BEGIN
+    CREATE TABLE REPLICA_HEARTBEAT (
+        HeartbeatID TINYINT PRIMARY KEY CHECK (HeartbeatID = 1),
+        BeatAt DATETIME2 NOT NULL
+    );
+    PRINT '✅ REPLICA_HEARTBEAT 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ REPLICA_HEARTBEAT 資料表已存在';
+GO
@@ -0,0 +1,25 @@
+-- 時段 / 星期費率規則
+-- 每個停車場可設定尖峰、離峰、夜間均一價與週末費率；未涵蓋的時段仍以 PARKING_LOT.HourlyRate 計費，
+-- 15 分鐘免費、PaidUntilTime 與每日上限規則不變。
+USE ParkingLot;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'TARIFF_RULE')
+BEGIN
+    CREATE TABLE TARIFF_RULE (
+        RuleID INT IDENTITY(1,1) PRIMARY KEY,
+        ParkingLotID INT NOT NULL,
+        DaysMask TINYINT NOT NULL CHECK (DaysMask BETWEEN 1 AND 127),
+        StartMinute SMALLINT NOT NULL CHECK (StartMinute BETWEEN 0 AND 1439),
+        EndMinute SMALLINT NOT NULL CHECK (EndMinute BETWEEN 0 AND 1439),
+        RateType NVARCHAR(10) NOT NULL CHECK (RateType IN ('hourly', 'flat')),
+        Rate INT NOT NULL CHECK (Rate >= 0),
+        Priority INT NOT NULL DEFAULT 0,
+        FOREIGN KEY (ParkingLotID) REFERENCES PARKING_LOT(ParkingLotID) ON DELETE CASCADE
+    );
+    CREATE INDEX idx_tariff_rule_lot ON TARIFF_RULE(ParkingLotID);
+    PRINT '✅ TARIFF_RULE 資料表建立成功';
+END
+ELSE
+    PRINT 'ℹ️ TARIFF_RULE 資料表已存在';
+GO